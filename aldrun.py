@@ -0,0 +1,576 @@
+"""Headless command line runner.
+
+usage:
+    python -m aldrun list
+    python -m aldrun run "Platinum ALD" --n 500 --oxygen_flow 80
+    python -m aldrun simulate "Platinum ALD" --n 500
+    python -m aldrun resume checkpoints/default.json
+    python -m aldrun queue add "Platinum ALD" --n 500
+    python -m aldrun queue run
+    python -m aldrun logs stats --recipe platinum --since 2026-09-01
+    python -m aldrun sweep "Platinum ALD" --vary platinum_wait=1:3:0.5 --vary oxygen_flow=60,80 --n 200
+
+Runs recipes without PyQt5 and without a display. The MQTT connection is
+configured by the same config.cnf as the GUI.
+
+exit status: 0 if the run or all queued jobs completed, 1 if a run failed
+(e.g. an exception or a silent controller) or a queued job did not
+complete, 2 for invalid arguments, 3 if a run was stopped by a stop
+command and 130 after Ctrl-C.
+"""
+import argparse
+import os
+import sys
+
+from configparser import ConfigParser
+from threading import Thread
+
+# seconds to wait for the queued commands when the runner exits
+FLUSH_TIMEOUT = 5.0
+
+# exit status of a run which was stopped by a stop command
+EXIT_STOPPED = 3
+
+
+def connect(config: ConfigParser):
+    """Creates a paho client connected to the broker of the [MQTT] section.
+
+    The client is wrapped into a publisher.Publisher, which queues the
+    commands while the broker is not reachable; the network thread of paho
+    reconnects.
+
+    :raises ConnectionError: if the broker is not reachable or does not accept the connection
+    """
+    from paho.mqtt.client import Client as MQTTClient
+    from recipes.publisher import publisher_from_config
+
+    mqtt_conf = config['MQTT']
+
+    client = MQTTClient()
+    client.username_pw_set(mqtt_conf['username'], mqtt_conf['password'])
+    publisher = publisher_from_config(client, config)
+    address = '{}:{}'.format(mqtt_conf['address'], mqtt_conf['port'])
+    try:
+        client.connect(mqtt_conf['address'], int(mqtt_conf['port']), int(mqtt_conf['timeout']))
+    except OSError as error:
+        raise ConnectionError('MQTT broker {} not reachable: {}'.format(address, error))
+    client.loop_start()
+    if not publisher.wait_connected(int(mqtt_conf['timeout'])):
+        client.loop_stop()
+        raise ConnectionError('MQTT broker {} did not accept the connection within {} s'.format(
+            address, mqtt_conf['timeout']))
+    return publisher
+
+
+def disconnect(publisher) -> None:
+    """Sends the queued commands and disconnects the client of connect."""
+    if not publisher.flush(FLUSH_TIMEOUT):
+        print('{} commands not sent'.format(publisher.queue_depth + publisher.in_flight), file=sys.stderr)
+    publisher.client.disconnect()
+    publisher.client.loop_stop()
+
+
+def open_telemetry(config: ConfigParser, client):
+    """Subscribes to the sensor channels of the [TELEMETRY] section, returns None if there is none."""
+    from recipes.telemetry import telemetry_from_config
+
+    telemetry = telemetry_from_config(client, config)
+    if telemetry is not None:
+        telemetry.open()
+    return telemetry
+
+
+def _input_parser(name: str, inputs: dict) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='aldrun run "{}"'.format(name), add_help=False)
+    for key, value in inputs.items():
+        parser.add_argument('--{}'.format(key), type=value.convert_from_string, default=value.default,
+                            help='{} (default: {})'.format(value.fullname, value.default))
+    return parser
+
+
+def list_recipes(args) -> int:
+    from recipes import REGISTRY
+
+    for name in REGISTRY:
+        print(name)
+        for key, value in REGISTRY.inputs(name).items():
+            print('    --{:<24} {} (default: {})'.format(key, value.fullname, value.default))
+    return 0
+
+
+def _recipe_and_inputs(args, extra):
+    """Returns the recipe class and its inputs parsed from extra, or None if the run should not start."""
+    from recipes import REGISTRY
+
+    if args.recipe not in REGISTRY:
+        print('unknown recipe {!r}, see "aldrun list"'.format(args.recipe), file=sys.stderr)
+        return None
+
+    input_parser = _input_parser(args.recipe, REGISTRY.inputs(args.recipe))
+    if '--help' in extra or '-h' in extra:
+        input_parser.print_help()
+        return None
+    return REGISTRY[args.recipe], vars(input_parser.parse_args(extra))
+
+
+def _engine_options(args) -> dict:
+    return {'schedule_policy': args.policy,
+            'delta_publishing': not args.full_publish,
+            'resync_interval': args.resync,
+            'chamber': args.chamber}
+
+
+def simulate_recipe(args, extra) -> int:
+    import json
+    from recipes.simulation import format_result, simulate, timeline_to_dicts
+
+    recipe_and_inputs = _recipe_and_inputs(args, extra)
+    if recipe_and_inputs is None:
+        return 2
+    cls, inputs = recipe_and_inputs
+
+    result = simulate(cls, **_engine_options(args), **inputs)
+
+    if args.json:
+        print(json.dumps({'duration': result.duration,
+                          'gas_on_time': result.gas_on_time,
+                          'valve_open_time': result.valve_open_time,
+                          'timeline': timeline_to_dicts(result)}))
+        return 0
+
+    if args.timeline:
+        for publication in result.timeline:
+            print('{:12.3f} {} {}'.format(publication.time, publication.topic, publication.payload.decode()))
+    for line in format_result(result):
+        print(line)
+    return 0
+
+
+def run_recipe(args, extra) -> int:
+    from recipes.checkpoint import CheckpointFile
+
+    recipe_and_inputs = _recipe_and_inputs(args, extra)
+    if recipe_and_inputs is None:
+        return 2
+    cls, inputs = recipe_and_inputs
+
+    inputs.update(_engine_options(args))
+    checkpoint = None
+    if args.checkpoint is not None:
+        # engine options are saved as well, so a resumed run behaves the same
+        checkpoint = CheckpointFile(args.checkpoint, args.recipe, inputs, args.chamber)
+    return _execute(args, args.recipe, cls, inputs, checkpoint)
+
+
+def resume_recipe(args, extra) -> int:
+    from recipes import REGISTRY
+    from recipes.checkpoint import CheckpointFile, load
+
+    checkpoint = load(args.checkpoint)
+    if checkpoint is None:
+        print('{} is not a checkpoint'.format(args.checkpoint), file=sys.stderr)
+        return 2
+    if checkpoint.recipe not in REGISTRY:
+        print('unknown recipe {!r} in checkpoint'.format(checkpoint.recipe), file=sys.stderr)
+        return 2
+
+    inputs = dict(checkpoint.inputs, start_cycle=checkpoint.cycle)
+    return _execute(args, checkpoint.recipe, REGISTRY[checkpoint.recipe], inputs,
+                    CheckpointFile(args.checkpoint, checkpoint.recipe, checkpoint.inputs, checkpoint.chamber))
+
+
+def queue_command(args, extra) -> int:
+    from recipes.jobqueue import JobQueue
+
+    queue = JobQueue(args.queue)
+
+    if args.queue_command == 'add':
+        recipe_and_inputs = _recipe_and_inputs(args, extra)
+        if recipe_and_inputs is None:
+            return 2
+        cls, inputs = recipe_and_inputs
+        options = _engine_options(args)
+        chamber = options.pop('chamber')
+        job = queue.add(args.recipe, dict(inputs, **options), chamber)
+        print('added job {}'.format(job.id))
+        return 0
+
+    if args.queue_command == 'list':
+        for job in queue.jobs():
+            print('{:>4} {:<12} {:<10} {}'.format(job.id, job.state, job.chamber or 'default', job.recipe))
+        return 0
+
+    if args.queue_command == 'cancel':
+        if not queue.cancel(args.id):
+            print('job {} is not queued'.format(args.id), file=sys.stderr)
+            return 1
+        return 0
+
+    if args.queue_command == 'move':
+        try:
+            queue.move(args.id, args.position)
+        except KeyError:
+            print('unknown job {}'.format(args.id), file=sys.stderr)
+            return 1
+        return 0
+
+    if args.queue_command == 'run':
+        return _run_queue(args, queue)
+
+    print('usage: aldrun queue {add,list,cancel,move,run}', file=sys.stderr)
+    return 2
+
+
+def _run_queue(args, queue) -> int:
+    """Runs the queued jobs of a chamber back to back until the queue is empty or a job does not complete."""
+    from threading import Event
+    from recipes.jobqueue import QueueRunner
+    from recipes.runs import RunManager
+    from recipes.signals import ConsoleSignalInterface, JsonSignalInterface
+
+    config = ConfigParser()
+    config.read(args.config)
+    if 'MQTT' not in config:
+        print('{} has no [MQTT] section'.format(args.config), file=sys.stderr)
+        return 2
+
+    os.makedirs('logs', exist_ok=True)
+
+    try:
+        client = connect(config)
+    except ConnectionError as error:
+        print(error, file=sys.stderr)
+        return 1
+    run_manager = RunManager(client, [args.chamber], telemetry=open_telemetry(config, client),
+                             archive_directory=args.archive)
+
+    def signal_interface(job):
+        return JsonSignalInterface() if args.json else ConsoleSignalInterface()
+
+    def job_started(job, run):
+        if not args.json:
+            print('job {}: {}'.format(job.id, job.recipe))
+            run.signal_interface.max_process_value = run.recipe.max_process_value()
+
+    paused = Event()
+
+    def on_paused(reason):
+        if not args.json:
+            print('queue paused: {}'.format(reason))
+        paused.set()
+
+    options = {'acknowledge': args.acknowledge is not None, 'acknowledge_timeout': args.acknowledge or 1.0,
+               'metrics_textfile': args.metrics_file, 'metrics_port': args.metrics_port,
+               'controller_timed': args.controller_timed}
+    runner = QueueRunner(run_manager, queue, args.chamber, signal_interface, args.handoff,
+                         on_job_started=job_started, on_paused=on_paused, options=options)
+    runner.start()
+    try:
+        while not paused.wait(0.5):
+            pass
+        run_manager.join()
+    except KeyboardInterrupt:
+        runner.pause()
+        run_manager.stop_all()
+        run_manager.join()
+        return 130
+    finally:
+        disconnect(client)
+    return 0 if runner.drained else 1
+
+
+def sweep_recipe(args, extra) -> int:
+    from recipes import REGISTRY
+    from recipes.jobqueue import JobQueue
+    from recipes.sweep import Sweep, SweepError, format_sweep
+
+    if args.recipe not in REGISTRY:
+        print('unknown recipe {!r}, see "aldrun list"'.format(args.recipe), file=sys.stderr)
+        return 2
+
+    # fixed inputs are kept as text, the sweep converts and validates them with all variants
+    input_parser = argparse.ArgumentParser(prog='aldrun sweep "{}"'.format(args.recipe), add_help=False)
+    for key, value in REGISTRY.inputs(args.recipe).items():
+        input_parser.add_argument('--{}'.format(key), default=None,
+                                  help='{} (default: {})'.format(value.fullname, value.default))
+    if '--help' in extra or '-h' in extra:
+        input_parser.print_help()
+        return 2
+    fixed = {key: value for key, value in vars(input_parser.parse_args(extra)).items() if value is not None}
+
+    axes = {}
+    for vary in args.vary:
+        key, separator, values = vary.partition('=')
+        if not separator:
+            print('--vary needs INPUT=VALUES, not {!r}'.format(vary), file=sys.stderr)
+            return 2
+        axes[key] = values
+
+    try:
+        sweep = Sweep(args.recipe, axes, fixed, args.name)
+    except SweepError as error:
+        for message in error.errors:
+            print(message, file=sys.stderr)
+        return 2
+
+    for line in format_sweep(sweep, args.handoff):
+        print(line)
+    if args.dry_run:
+        return 0
+
+    options = _engine_options(args)
+    chamber = options.pop('chamber')
+    queue = JobQueue(args.queue)
+    sweep.enqueue(queue, chamber, options)
+    if not args.run:
+        print('added to {}, start with "aldrun queue run"'.format(args.queue))
+        return 0
+    return _run_queue(args, queue)
+
+
+def _posix_time(text: str) -> float:
+    from datetime import datetime
+
+    return datetime.fromisoformat(text).timestamp()
+
+
+def logs_command(args, extra) -> int:
+    import json
+    from datetime import datetime
+    from recipes.logindex import LogIndex, statistics, step_durations
+
+    index = LogIndex(args.directory)
+    index.refresh()
+    tags = dict(tag.partition('=')[::2] for tag in args.tag)
+    runs = index.runs(args.recipe, args.chamber,
+                      _posix_time(args.since) if args.since else None,
+                      _posix_time(args.until) if args.until else None, tags)
+
+    if args.logs_command == 'runs':
+        if args.json:
+            print(json.dumps([run._asdict() for run in runs]))
+            return 0
+        for run in runs:
+            flags = ' '.join([flag for flag, present in (('stopped', run.stopped), ('resumed', run.resumed)) if present] +
+                             ['{}={}'.format(key, value) for key, value in run.tags.items()])
+            print('{:%Y-%m-%d %H:%M:%S} {:>9.0f} s {:>6} cycles {:<10} {:<24} {}'.format(
+                datetime.fromtimestamp(run.start), run.end - run.start, run.cycles, run.chamber or 'default',
+                run.recipe, flags))
+        return 0
+
+    if args.logs_command == 'stats':
+        result = statistics(runs)
+        if args.json:
+            print(json.dumps(result))
+            return 0
+        print('runs: {runs} ({stopped} stopped, {resumed} resumed), cycles: {cycles}'.format(**result))
+        if result['mean_cycle_duration'] is not None:
+            print('cycle duration: mean {:.3f} s, max {:.3f} s'.format(result['mean_cycle_duration'],
+                                                                     result['max_cycle_duration']))
+        for name, (count, mean, maximum) in result['steps'].items():
+            print('    {:<32} n={:<8} mean={:.3f} s max={:.3f} s'.format(name, count, mean, maximum))
+        return 0
+
+    if args.logs_command == 'events':
+        for run in runs:
+            for timestamp, text in run.events:
+                print('{:%Y-%m-%d %H:%M:%S} {:<10} {:<24} {}'.format(
+                    datetime.fromtimestamp(timestamp), run.chamber or 'default', run.recipe, text))
+        return 0
+
+    if args.logs_command == 'show':
+        for run in runs:
+            if run.file != os.path.basename(args.file):
+                continue
+            print('{} on {}, {:%Y-%m-%d %H:%M:%S} to {:%H:%M:%S}, {} cycles{}'.format(
+                run.recipe, run.chamber or 'default', datetime.fromtimestamp(run.start),
+                datetime.fromtimestamp(run.end), run.cycles, ', stopped' if run.stopped else ''))
+            for name, count, mean, maximum in step_durations(run):
+                print('    {:<32} n={:<8} mean={:.3f} s max={:.3f} s'.format(name, count, mean, maximum))
+        return 0
+
+    print('usage: aldrun logs {runs,stats,events,show}', file=sys.stderr)
+    return 2
+
+
+def _execute(args, name, cls, inputs, checkpoint) -> int:
+    """Runs a recipe with the MQTT connection, signal interface and metrics given by the arguments."""
+    from recipes.archive import ArchiveWriter
+    from recipes.signals import ConsoleSignalInterface, JsonSignalInterface
+
+    config = ConfigParser()
+    config.read(args.config)
+    if 'MQTT' not in config:
+        print('{} has no [MQTT] section'.format(args.config), file=sys.stderr)
+        return 2
+
+    os.makedirs('logs', exist_ok=True)
+
+    try:
+        client = connect(config)
+    except ConnectionError as error:
+        print(error, file=sys.stderr)
+        return 1
+
+    if args.json:
+        signal_interface = JsonSignalInterface()
+    else:
+        signal_interface = ConsoleSignalInterface()
+
+    telemetry = open_telemetry(config, client)
+    archive = None
+    if args.archive is not None:
+        archive = ArchiveWriter(args.archive, name, inputs, inputs.get('chamber'), telemetry)
+
+    # the options of this execution replace those saved in a checkpoint of a queue or GUI run
+    options = {'checkpoint': checkpoint, 'telemetry': telemetry, 'archive': archive,
+               'acknowledge': args.acknowledge is not None, 'acknowledge_timeout': args.acknowledge or 1.0,
+               'metrics_textfile': args.metrics_file, 'metrics_port': args.metrics_port,
+               'controller_timed': args.controller_timed}
+    recipe = cls(client, signal_interface, **dict(inputs, **options))
+    if not args.json:
+        signal_interface.max_process_value = recipe.max_process_value()
+
+    thread = Thread(target=recipe)
+    thread.start()
+    try:
+        while thread.is_alive():
+            thread.join(0.5)
+    except KeyboardInterrupt:
+        recipe.stop()
+        thread.join()
+        return 130
+    finally:
+        disconnect(client)
+
+    if recipe.failed is not None:
+        print('run failed: {}'.format(recipe.failed), file=sys.stderr)
+        return 1
+    if recipe.stopped:
+        print('run stopped', file=sys.stderr)
+        return EXIT_STOPPED
+    return 0
+
+
+def main(argv=None) -> int:
+    from recipes.engine import RESYNC_INTERVAL
+
+    parser = argparse.ArgumentParser(prog='aldrun', description='Runs ALD recipes without GUI.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    subparsers.add_parser('list', help='list recipes and their inputs')
+
+    engine_parser = argparse.ArgumentParser(add_help=False)
+    engine_parser.add_argument('recipe', help='name of the recipe')
+    engine_parser.add_argument('--policy', default='catch_up', choices=['catch_up', 'skip'],
+                               help='how overrunning steps are compensated')
+    engine_parser.add_argument('--full-publish', action='store_true',
+                               help='publish all valves and the setpoint in every step instead of changes only')
+    engine_parser.add_argument('--resync', type=int, default=RESYNC_INTERVAL, metavar='CYCLES',
+                               help='publish the complete state every CYCLES cycles, 0 never '
+                                    '(default: {})'.format(RESYNC_INTERVAL))
+    engine_parser.add_argument('--chamber', default=None,
+                               help='run on this chamber, its topics are ald/<chamber>/... (default: single chamber)')
+
+    execution_parser = argparse.ArgumentParser(add_help=False)
+    execution_parser.add_argument('--config', default='config.cnf', help='config file with [MQTT] section')
+    execution_parser.add_argument('--json', action='store_true', help='write progress as JSON lines to stdout')
+    execution_parser.add_argument('--acknowledge', type=float, default=None, metavar='TIMEOUT',
+                                  help='wait up to TIMEOUT seconds for the controller to echo every command')
+    execution_parser.add_argument('--metrics-file', default=None, metavar='PATH',
+                                  help='write metrics in the Prometheus text format to PATH during the run')
+    execution_parser.add_argument('--metrics-port', type=int, default=None, metavar='PORT',
+                                  help='serve metrics on http://127.0.0.1:PORT/metrics during the run')
+    execution_parser.add_argument('--archive', default=None, metavar='DIRECTORY',
+                                  help='write a columnar archive of every run into DIRECTORY')
+    execution_parser.add_argument('--controller-timed', action='store_true',
+                                  help='upload the whole program, the controller times the steps')
+
+    run_parser = subparsers.add_parser('run', add_help=False, parents=[engine_parser, execution_parser],
+                                       help='run a recipe, recipe inputs are given as --<input> <value>')
+    run_parser.add_argument('--checkpoint', default=None, metavar='PATH',
+                            help='save a checkpoint to PATH at every cycle, see "aldrun resume"')
+
+    resume_parser = subparsers.add_parser('resume', parents=[execution_parser],
+                                          help='resume an interrupted run from its checkpoint')
+    resume_parser.add_argument('checkpoint', help='checkpoint file written by "aldrun run --checkpoint"')
+
+    simulate_parser = subparsers.add_parser('simulate', add_help=False, parents=[engine_parser],
+                                            help='dry run of a recipe on a virtual clock without broker')
+    simulate_parser.add_argument('--json', action='store_true', help='write the result and timeline as JSON')
+    simulate_parser.add_argument('--timeline', action='store_true', help='print every published command')
+
+    queue_parser = subparsers.add_parser('queue', help='queue of recipes which run back to back')
+    queue_parser.add_argument('--queue', default='queue.json', metavar='PATH', help='queue file (default: queue.json)')
+    queue_subparsers = queue_parser.add_subparsers(dest='queue_command')
+    queue_subparsers.add_parser('add', add_help=False, parents=[engine_parser],
+                                help='append a recipe, recipe inputs are given as --<input> <value>')
+    queue_subparsers.add_parser('list', help='list all jobs')
+    queue_cancel_parser = queue_subparsers.add_parser('cancel', help='cancel a queued job')
+    queue_cancel_parser.add_argument('id', type=int)
+    queue_move_parser = queue_subparsers.add_parser('move', help='move a job to a position, 0 is the front')
+    queue_move_parser.add_argument('id', type=int)
+    queue_move_parser.add_argument('position', type=int)
+    queue_run_parser = queue_subparsers.add_parser('run', parents=[execution_parser],
+                                                   help='run the queued jobs of a chamber back to back')
+    queue_run_parser.add_argument('--chamber', default=None, help='run the jobs of this chamber')
+    queue_run_parser.add_argument('--handoff', type=float, default=0.0, metavar='SECONDS',
+                                  help='wait SECONDS between two jobs (default: 0)')
+
+    sweep_parser = subparsers.add_parser('sweep', add_help=False, allow_abbrev=False, parents=[engine_parser, execution_parser],
+                                         help='queue a recipe for every combination of the varied inputs')
+    sweep_parser.add_argument('--vary', action='append', required=True, metavar='INPUT=VALUES',
+                              help='values of an input as list 1,2,5 or grid start:stop:step, can be repeated')
+    sweep_parser.add_argument('--name', default=None, help='name of the sweep in the logs (default: recipe and time)')
+    sweep_parser.add_argument('--queue', default='queue.json', metavar='PATH', help='queue file (default: queue.json)')
+    sweep_parser.add_argument('--handoff', type=float, default=0.0, metavar='SECONDS',
+                              help='wait SECONDS between two runs (default: 0)')
+    sweep_parser.add_argument('--dry-run', action='store_true', help='only validate the variants and estimate the time')
+    sweep_parser.add_argument('--run', action='store_true', help='run the queue after adding the variants')
+
+    query_parser = argparse.ArgumentParser(add_help=False)
+    query_parser.add_argument('--recipe', default=None, help='only runs whose recipe log name contains RECIPE')
+    query_parser.add_argument('--chamber', default=None, help='only runs of this chamber, "default" without chambers')
+    query_parser.add_argument('--since', default=None, metavar='DATE', help='only runs started at or after DATE')
+    query_parser.add_argument('--until', default=None, metavar='DATE', help='only runs started before DATE')
+    query_parser.add_argument('--tag', action='append', default=[], metavar='KEY=VALUE',
+                              help='only runs with this tag, e.g. sweep=<name>, can be repeated')
+    query_parser.add_argument('--json', action='store_true', help='write the result as JSON')
+
+    logs_parser = subparsers.add_parser('logs', help='query the run logs through an incremental index')
+    logs_parser.add_argument('--directory', default='logs', help='directory of the logs (default: logs)')
+    logs_subparsers = logs_parser.add_subparsers(dest='logs_command')
+    logs_subparsers.add_parser('runs', parents=[query_parser], help='list the runs')
+    logs_subparsers.add_parser('stats', parents=[query_parser], help='cycle and step durations over the runs')
+    logs_subparsers.add_parser('events', parents=[query_parser], help='stops, resumes and errors of the runs')
+    logs_show_parser = logs_subparsers.add_parser('show', parents=[query_parser], help='step durations of a run')
+    logs_show_parser.add_argument('file', help='log file of the run')
+
+    args, extra = parser.parse_known_args(argv)
+    # only the recipe inputs are parsed later, by the parser of the recipe
+    takes_inputs = args.command in ('run', 'simulate', 'sweep') or \
+        args.command == 'queue' and args.queue_command == 'add'
+    if extra and not takes_inputs:
+        parser.error('unrecognized arguments: {}'.format(' '.join(extra)))
+
+    if args.command == 'list':
+        return list_recipes(args)
+    if args.command == 'run':
+        return run_recipe(args, extra)
+    if args.command == 'resume':
+        return resume_recipe(args, extra)
+    if args.command == 'simulate':
+        return simulate_recipe(args, extra)
+    if args.command == 'queue':
+        return queue_command(args, extra)
+    if args.command == 'logs':
+        return logs_command(args, extra)
+    if args.command == 'sweep':
+        return sweep_recipe(args, extra)
+
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
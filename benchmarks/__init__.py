@@ -0,0 +1,11 @@
+"""Benchmarks of the recipe engine.
+
+usage:
+    python -m benchmarks run [--output PATH] [--quick]
+    python -m benchmarks compare OLD.json NEW.json [--threshold PERCENT]
+
+The recipes run against recipes.fake.FakeMQTTClient and a
+NullSignalInterface, so no broker is needed. Results are written as JSON,
+by default to benchmarks/results/<commit>.json, and two result files can be
+compared to find regressions between commits.
+"""
@@ -0,0 +1,113 @@
+"""Command line of the benchmark suite, see benchmarks/__init__.py."""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+from datetime import datetime
+from typing import Dict, Optional
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(RESULTS_DIRECTORY)).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _higher_is_better(metric: str) -> bool:
+    return metric.endswith('_per_second')
+
+
+def run(args) -> int:
+    from .engine import run_all
+
+    commit = _commit()
+    results = run_all(quick=args.quick)
+    document = {'commit': commit,
+                'date': datetime.now().isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'quick': args.quick,
+                'results': results}
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        output = os.path.join(RESULTS_DIRECTORY, '{}.json'.format(commit or 'unknown'))
+    with open(output, 'w') as file:
+        json.dump(document, file, indent=2)
+
+    for key, metrics in results.items():
+        print(key)
+        for metric, value in metrics.items():
+            print('    {:<28} {:.6g}'.format(metric, value))
+    print('results written to {}'.format(output))
+    return 0
+
+
+def compare(args) -> int:
+    with open(args.old) as file:
+        old = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+
+    print('{} -> {}'.format(old.get('commit'), new.get('commit')))
+    regressions = 0
+    for key, new_metrics in new['results'].items():
+        old_metrics: Dict[str, float] = old['results'].get(key)
+        if old_metrics is None:
+            continue
+        print(key)
+        for metric, new_value in new_metrics.items():
+            old_value = old_metrics.get(metric)
+            if old_value is None:
+                continue
+            if old_value == 0:
+                change = 0.0 if new_value == 0 else float('inf')
+            else:
+                change = (new_value - old_value) / abs(old_value) * 100
+            worse = -change if _higher_is_better(metric) else change
+            marker = ''
+            if metric.endswith(('_seconds', '_per_second')) and worse > args.threshold:
+                marker = '  REGRESSION'
+                regressions += 1
+            print('    {:<28} {:>12.6g} {:>12.6g} {:>+8.1f}%{}'.format(metric, old_value, new_value, change, marker))
+
+    print('{} regressions above {}%'.format(regressions, args.threshold))
+    return 1 if regressions else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='benchmarks', description='Benchmarks of the recipe engine.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='run all benchmarks and write the results as JSON')
+    run_parser.add_argument('--output', default=None, metavar='PATH',
+                            help='result file (default: benchmarks/results/<commit>.json)')
+    run_parser.add_argument('--quick', action='store_true', help='shorter runs for a fast check')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two result files')
+    compare_parser.add_argument('old', help='result file of the baseline')
+    compare_parser.add_argument('new', help='result file to check')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, metavar='PERCENT',
+                                help='report timing changes worse than PERCENT as regressions (default: 10)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        return run(args)
+    if args.command == 'compare':
+        return compare(args)
+
+    parser.print_help()
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""Timing and throughput benchmarks of the recipes.
+
+Every benchmark returns a dict of metric name -> value. Metric names end
+with their unit, throughputs end with _per_second and are better when
+higher, all other metrics are better when lower.
+"""
+import os
+
+from tempfile import TemporaryDirectory
+from time import monotonic, perf_counter, process_time
+from typing import Dict, List
+
+from recipes.fake import FakeMQTTClient
+from recipes.runlog import CYCLE, RunLogger
+from recipes.signals import NullSignalInterface
+from recipes.simulation import VirtualClock
+
+RECIPES = ('Platinum ALD', 'Oxygen Purification', 'Oxygen On Off')
+STEP_DURATIONS = (0.5, 0.1, 0.02, 0.005)
+
+
+def _recipe_class(name: str):
+    from recipes import REGISTRY
+    return REGISTRY[name]
+
+
+def _inputs(name: str, loops: int, step_duration: float) -> Dict:
+    """Sets the number of loops and the duration of all timed steps of a recipe."""
+    from recipes import REGISTRY
+
+    inputs = {'n': loops}
+    for key in REGISTRY.inputs(name):
+        if key.endswith('_wait'):
+            inputs[key] = step_duration
+    return inputs
+
+
+def _executed_steps(recipe) -> int:
+    program = recipe.program
+    return len(program.setup) + program.loops * len(program.cycle) + len(program.teardown)
+
+
+def _cycle_duration(name: str, step_duration: float) -> float:
+    recipe = _recipe_class(name)(FakeMQTTClient(), NullSignalInterface(), log_directory=None,
+                                 **_inputs(name, 1, step_duration))
+    return sum(step.duration for step in recipe.program.cycle)
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def jitter(name: str, step_duration: float, seconds: float = 3.0) -> Dict[str, float]:
+    """Runs a recipe in real time and measures how late the steps start.
+
+    :param name: recipe name
+    :param step_duration: duration of all timed steps in seconds
+    :param seconds: approximate duration of the run
+    """
+    loops = max(1, int(seconds / _cycle_duration(name, step_duration)))
+    recipe = _recipe_class(name)(FakeMQTTClient(), NullSignalInterface(), log_directory=None,
+                                 **_inputs(name, loops, step_duration))
+
+    lateness = []
+    run = recipe._scheduler.run
+
+    async def recording_run(*args, **kwargs):
+        result = await run(*args, **kwargs)
+        lateness.append(result)
+        return result
+
+    recipe._scheduler.run = recording_run
+    recipe()
+
+    # the first step defines the start of the timeline
+    ordered = sorted(lateness[1:] or lateness)
+    return {'steps': len(lateness),
+            'lateness_mean_seconds': sum(ordered) / len(ordered),
+            'lateness_median_seconds': _percentile(ordered, 0.5),
+            'lateness_p95_seconds': _percentile(ordered, 0.95),
+            'lateness_p99_seconds': _percentile(ordered, 0.99),
+            'lateness_max_seconds': ordered[-1]}
+
+
+def _simulated_run(name: str, loops: int, log_directory=None, **options):
+    clock = VirtualClock()
+    recipe = _recipe_class(name)(FakeMQTTClient(clock=clock.time), NullSignalInterface(), clock=clock,
+                                 log_directory=log_directory, **_inputs(name, loops, 1.0), **options)
+    wall_start = perf_counter()
+    cpu_start = process_time()
+    recipe()
+    return recipe, perf_counter() - wall_start, process_time() - cpu_start
+
+
+def step_overhead(name: str, loops: int = 2000) -> Dict[str, float]:
+    """Measures the CPU time the engine spends per step, without waiting and without log file."""
+    recipe, wall, cpu = _simulated_run(name, loops)
+    steps = _executed_steps(recipe)
+    return {'steps': steps,
+            'cpu_per_step_seconds': cpu / steps,
+            'wall_per_step_seconds': wall / steps}
+
+
+def publish_throughput(name: str, loops: int = 2000, delta_publishing: bool = True) -> Dict[str, float]:
+    """Measures how many messages and steps per second the engine can publish without waiting."""
+    recipe, wall, cpu = _simulated_run(name, loops, delta_publishing=delta_publishing)
+    messages = len(recipe._mqtt_client.published)
+    return {'messages': messages,
+            'messages_per_second': messages / wall,
+            'steps_per_second': _executed_steps(recipe) / wall}
+
+
+def log_overhead(name: str, loops: int = 2000) -> Dict[str, float]:
+    """Measures the additional time per step caused by writing the run log.
+
+    CPU time includes the background writer of the log.
+    """
+    recipe, wall_without_log, cpu_without_log = _simulated_run(name, loops)
+    with TemporaryDirectory() as directory:
+        recipe, wall_with_log, cpu_with_log = _simulated_run(name, loops, log_directory=directory)
+        log_bytes = sum(os.path.getsize(os.path.join(directory, file)) for file in os.listdir(directory))
+    steps = _executed_steps(recipe)
+    return {'log_bytes': log_bytes,
+            'cpu_per_step_seconds': max(0.0, cpu_with_log - cpu_without_log) / steps,
+            'wall_per_step_seconds': max(0.0, wall_with_log - wall_without_log) / steps}
+
+
+def logger_call(events: int = 100000) -> Dict[str, float]:
+    """Measures the cost of RunLogger.log in the recipe thread and the throughput of the writer."""
+    with TemporaryDirectory() as directory:
+        logger = RunLogger(os.path.join(directory, 'benchmark.log'), queue_size=events)
+        start = perf_counter()
+        for index in range(events):
+            logger.log('starting CYCLE {}'.format(index), index, CYCLE)
+        enqueue = perf_counter() - start
+
+        start = monotonic()
+        logger.stop()
+        write = monotonic() - start
+    return {'log_call_seconds': enqueue / events,
+            'written_per_second': events / write if write > 0 else float('inf')}
+
+
+def run_all(quick: bool = False) -> Dict[str, Dict[str, float]]:
+    """Runs all benchmarks.
+
+    :param quick: shorter runs and fewer step durations, for a fast check
+    :return: benchmark key -> metrics
+    """
+    seconds = 1.0 if quick else 3.0
+    loops = 200 if quick else 2000
+    step_durations = STEP_DURATIONS[1:3] if quick else STEP_DURATIONS
+
+    results = {}
+    for name in RECIPES:
+        for step_duration in step_durations:
+            results['jitter/{}/{}s'.format(name, step_duration)] = jitter(name, step_duration, seconds)
+        results['step_overhead/{}'.format(name)] = step_overhead(name, loops)
+        results['publish_throughput/{}/delta'.format(name)] = publish_throughput(name, loops, True)
+        results['publish_throughput/{}/full'.format(name)] = publish_throughput(name, loops, False)
+        results['log_overhead/{}'.format(name)] = log_overhead(name, loops)
+    results['logger_call'] = logger_call(10000 if quick else 100000)
+    return results
@@ -1,45 +1,129 @@
 from PyQt5.QtWidgets import QApplication, QGroupBox, QComboBox, QPushButton, QHBoxLayout, \
-    QVBoxLayout, QProgressBar, QMessageBox, QMainWindow, QWidget, QStatusBar, QLabel
-from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject
+    QVBoxLayout, QMessageBox, QMainWindow, QWidget, QStatusBar, QLabel, QDialog
+from PyQt5.QtCore import pyqtSignal, pyqtSlot, QObject, QTimer
 
 from widgets.input_widget import InputWidget
+from widgets.run_widget import RunWidget
+from widgets.queue_widget import QueueWidget
+from widgets.sweep_dialog import SweepDialog
+from widgets.plot_widget import PlotWidget
 
 from paho.mqtt.client import Client as MQTTClient
 
-from threading import Thread
+from threading import Lock
+from time import time
 from recipes import REGISTRY
 from recipes.recipe import SignalInterface
+from recipes.aio import AsyncMQTTClient, AsyncRunManager
+from recipes.archive import ARCHIVE_DIRECTORY
+from recipes.checkpoint import CHECKPOINT_DIRECTORY, pending
+from recipes.jobqueue import QUEUE_PATH, JobQueue, QueueRunner
+from recipes.publisher import publisher_from_config
+from recipes.runs import ChamberBusyError, chambers_from_config
+from recipes.simulation import simulate, format_result
+from recipes.telemetry import telemetry_from_config
 
 from datetime import datetime
 
 from configparser import ConfigParser
 
+import asyncio
 import os
 if not os.path.exists('logs'):
     os.makedirs('logs')
 
 
 class QtSignalInterface(SignalInterface, QObject):
+    """Bridges the signals of a recipe to the GUI thread.
+
+    The recipe only stores its latest status message and process value, the
+    frame timer of the main window delivers them at most FRAME_RATE times a
+    second, so short steps and many runs do not flood the GUI thread.
+    Intermediate values are dropped, the complete history is in the log of
+    the run. Can be created in any thread, e.g. for the next job of a queue
+    which is built while the current job runs.
+    """
+    FRAME_RATE = 10
+
     finished = pyqtSignal()
     started = pyqtSignal()
     stopped = pyqtSignal()
     status_message = pyqtSignal(str)
     update_process_value = pyqtSignal(int)
+    # planned end as POSIX timestamp and drift in seconds
+    update_timeline = pyqtSignal(float, float)
+
+    def __init__(self):
+        QObject.__init__(self)
+        self.moveToThread(QApplication.instance().thread())
+
+        self._lock = Lock()
+        self._started = False
+        self._stopped = False
+        self._finished = False
+        self._status_message = None
+        self._process_value = None
+        self._timeline = None
 
     def emit_finished(self) -> None:
-        self.finished.emit()
+        self._finished = True
 
     def emit_started(self) -> None:
-        self.started.emit()
+        self._started = True
 
     def emit_stopped(self) -> None:
-        self.stopped.emit()
+        self._stopped = True
 
     def emit_status_message(self, message: str) -> None:
-        self.status_message.emit(message)
+        with self._lock:
+            self._status_message = message
 
     def emit_update_process_value(self, value:int) -> None:
-        self.update_process_value.emit(value)
+        with self._lock:
+            self._process_value = value
+
+    def emit_update_timeline(self, remaining: float, drift: float) -> None:
+        with self._lock:
+            self._timeline = (time() + remaining, drift)
+
+    def deliver(self) -> bool:
+        """Emits the stored signals in the GUI thread, returns True once finished was emitted."""
+        # read finished first, all values stored before it are delivered now
+        finished = self._finished
+        with self._lock:
+            status_message, self._status_message = self._status_message, None
+            process_value, self._process_value = self._process_value, None
+            timeline, self._timeline = self._timeline, None
+
+        if self._started:
+            self._started = False
+            self.started.emit()
+        if process_value is not None:
+            self.update_process_value.emit(process_value)
+        if timeline is not None:
+            self.update_timeline.emit(*timeline)
+        if status_message is not None:
+            self.status_message.emit(status_message)
+        if self._stopped:
+            self._stopped = False
+            self.stopped.emit()
+        if finished:
+            self.finished.emit()
+        return finished
+
+
+class QueueEvents(QObject):
+    """Delivers the events of the job queue and its runners to the GUI thread."""
+
+    changed = pyqtSignal()
+    job_started = pyqtSignal(object, object)
+    paused = pyqtSignal(str)
+
+
+class BrokerEvents(QObject):
+    """Delivers the connection changes of the MQTT client to the GUI thread."""
+
+    connected = pyqtSignal(bool)
 
 
 class Main(QMainWindow):
@@ -49,43 +133,75 @@ class Main(QMainWindow):
     def __init__(self):
         super(Main, self).__init__()
 
-        self._running_recipe = None
-        self._recipe_started_timestamp = None
-
         self._config = ConfigParser()
         self._config.read('config.cnf')
 
+        self._chambers = chambers_from_config(self._config)
+        self._run_manager = None
+        self._telemetry = None
+        self._plot_widget = None
+        self._run_widgets = {}
+        self._signal_interfaces = []
+
+        self._queue = JobQueue(QUEUE_PATH)
+        self._queue_runners = {}
+        self._queue_events = QueueEvents(self)
+        self._broker_events = BrokerEvents(self)
+        self._broker_events.connected.connect(self._on_broker_connection)
+        self._queue.add_listener(self._queue_events.changed.emit)
+
         self.__init_gui()
+
+        self._frame_timer = QTimer(self)
+        self._frame_timer.setInterval(1000 // QtSignalInterface.FRAME_RATE)
+        self._frame_timer.timeout.connect(self._deliver_signals)
+        self._frame_timer.start()
+
         if 'MQTT' in self._config:
             self.__init_mqtt_client()
+            if self._telemetry is not None:
+                self._plot_widget = PlotWidget(self._telemetry, self)
+                self._central_layout.addWidget(self._plot_widget, 1)
+            self._offer_resume()
         else:
             self._recipe_combobox.setEnabled(True)
-        self.__init_signal_interface()
 
     def __init_gui(self):
         self.setWindowTitle(self.TITLE)
 
         central_widget = QWidget()
+        # the recipe panel on the left, the plot of the telemetry on the right
+        self._central_layout = QHBoxLayout()
+        central_widget.setLayout(self._central_layout)
+
         central_layout = QVBoxLayout()
-        central_widget.setLayout(central_layout)
+        self._central_layout.addLayout(central_layout)
 
         recipe_selection = self._create_recipe_selection()
         central_layout.addWidget(recipe_selection)
 
         self._input_selectors = {}
 
-        for key, cls in REGISTRY.items():
-            widget = InputWidget(key, cls.inputs(), self)
+        for key in REGISTRY:
+            widget = InputWidget(key, REGISTRY.inputs(key), self)
             widget.hide()
             central_layout.addWidget(widget)
             self._input_selectors[key] = widget
 
-        self._recipe_progress = QProgressBar(self)
-        self._recipe_progress.setMaximum(100)
-        self._recipe_progress.setMinimum(0)
-        self._recipe_progress.setValue(0)
-
-        central_layout.addWidget(self._recipe_progress)
+        self._queue_widget = QueueWidget(self)
+        self._queue_widget.set_jobs(self._queue.jobs())
+        self._queue_widget.move_requested.connect(self._queue.move)
+        self._queue_widget.cancel_requested.connect(self._queue.cancel)
+        self._queue_widget.clear_requested.connect(self._queue.clear_finished)
+        self._queue_widget.start_requested.connect(self._on_start_queue)
+        self._queue_widget.pause_requested.connect(self._on_pause_queue)
+        self._queue_events.changed.connect(lambda: self._queue_widget.set_jobs(self._queue.jobs()))
+        self._queue_events.job_started.connect(self._on_job_started)
+        self._queue_events.paused.connect(self._on_queue_paused)
+        central_layout.addWidget(self._queue_widget)
+
+        self._runs_layout = QVBoxLayout()
+        central_layout.addLayout(self._runs_layout)
 
         self._status_bar = QStatusBar()
         self.setStatusBar(self._status_bar)
@@ -97,11 +213,9 @@ class Main(QMainWindow):
         status_widget.setLayout(status_horizontal_layout)
 
         self._message_label = QLabel('', status_widget)
-        self._etc_label = QLabel('', status_widget)
 
         status_horizontal_layout.addWidget(self._message_label)
         status_horizontal_layout.addStretch(1)
-        status_horizontal_layout.addWidget(self._etc_label)
 
         self.setCentralWidget(central_widget)
         self.setGeometry(500, 300, 500, 350)
@@ -116,141 +230,259 @@ class Main(QMainWindow):
         self._recipe_combobox.addItem('...')
         self._recipe_combobox.currentTextChanged.connect(self._selection_changed)
 
-        for key, cls in REGISTRY.items():
+        for key in REGISTRY:
             self._recipe_combobox.addItem(key)
 
+        self._chamber_combobox = QComboBox(group_box)
+        for chamber in self._chambers:
+            self._chamber_combobox.addItem(chamber or 'default')
+        self._chamber_combobox.currentIndexChanged.connect(self._update_run_button)
+        if len(self._chambers) == 1:
+            self._chamber_combobox.hide()
+
+        self._recipe_simulate_button = QPushButton('simulate', group_box)
         self._recipe_run_button = QPushButton('run', group_box)
-        self._recipe_stop_button = QPushButton('stop', group_box)
+        self._recipe_queue_button = QPushButton('queue', group_box)
+        self._recipe_sweep_button = QPushButton('sweep', group_box)
 
+        self._recipe_simulate_button.setDisabled(True)
         self._recipe_run_button.setDisabled(True)
-        self._recipe_stop_button.hide()
+        self._recipe_queue_button.setDisabled(True)
+        self._recipe_sweep_button.setDisabled(True)
 
+        layout.addWidget(self._chamber_combobox)
         layout.addWidget(self._recipe_combobox)
         layout.addStretch(1)
+        layout.addWidget(self._recipe_simulate_button)
         layout.addWidget(self._recipe_run_button)
-        layout.addWidget(self._recipe_stop_button)
+        layout.addWidget(self._recipe_queue_button)
+        layout.addWidget(self._recipe_sweep_button)
 
+        self._recipe_simulate_button.clicked.connect(self._on_simulate)
         self._recipe_run_button.clicked.connect(self._on_run)
-        self._recipe_stop_button.clicked.connect(self._on_stop)
+        self._recipe_queue_button.clicked.connect(self._on_queue)
+        self._recipe_sweep_button.clicked.connect(self._on_sweep)
 
         return group_box
 
     def __init_mqtt_client(self):
-        self._mqtt_client = MQTTClient()
-        self._mqtt_client.on_connect = self._on_connect
-        self._mqtt_client.on_message = self._on_message
+        client = MQTTClient()
+        # the publisher calls these after its own callbacks
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
 
         mqtt_conf = self._config['MQTT']
 
-        self._mqtt_client.username_pw_set(mqtt_conf['username'], mqtt_conf['password'])
+        client.username_pw_set(mqtt_conf['username'], mqtt_conf['password'])
+
+        # the client and all recipes run on the event loop of the run manager, the publisher
+        # queues the commands and restores the subscriptions while the client reconnects
+        self._mqtt_client = AsyncMQTTClient(client)
+        self._publisher = publisher_from_config(self._mqtt_client, self._config)
+        self._telemetry = telemetry_from_config(self._publisher, self._config)
+        if self._telemetry is not None:
+            self._telemetry.open()
+        self._run_manager = AsyncRunManager(self._publisher, self._chambers,
+                                            checkpoint_directory=CHECKPOINT_DIRECTORY, telemetry=self._telemetry,
+                                            archive_directory=ARCHIVE_DIRECTORY)
+        # seconds between two jobs of the queue, e.g. to let the chamber settle
+        self._queue_handoff = self._config.getfloat('QUEUE', 'handoff', fallback=0.0)
+        # the controller executes the uploaded programs with its own timing
+        self._recipe_options = {'controller_timed': self._config.getboolean('CONTROLLER', 'timed', fallback=False)}
+        for chamber in self._chambers:
+            self._queue_runners[chamber] = QueueRunner(
+                self._run_manager, self._queue, chamber, lambda job: QtSignalInterface(), self._queue_handoff,
+                on_job_started=self._queue_events.job_started.emit, on_paused=self._queue_events.paused.emit,
+                options=self._recipe_options)
+        connect = self._mqtt_client.connect(mqtt_conf['address'], int(mqtt_conf['port']), int(mqtt_conf['timeout']))
         try:
-            self._mqtt_client.connect(mqtt_conf['address'], int(mqtt_conf['port']), int(mqtt_conf['timeout']))
-        except ConnectionRefusedError:
-            QMessageBox.warning(self, 'Connection Failed','Connection to MQTT Server failed')
-            exit(0)
-        self._mqtt_client.loop_start()
-
-    def __init_signal_interface(self):
-        self._signal_interface = QtSignalInterface()
-        self._signal_interface.finished.connect(self._on_recipe_finished)
-        self._signal_interface.started.connect(self._on_recipe_started)
-        self._signal_interface.stopped.connect(self._on_recipe_stopped)
-        self._signal_interface.status_message.connect(self._on_status_message)
-        self._signal_interface.update_process_value.connect(self._on_update_process_value)
+            asyncio.run_coroutine_threadsafe(connect, self._run_manager.loop).result()
+        except OSError as error:
+            # the client keeps trying, the recipes are enabled when it is connected
+            self._show_status_bar_message('MQTT broker not reachable, retrying: {}'.format(error))
 
+    # called on the event loop
     def _on_connect(self, client, userdata, flags, rc):
-        self._recipe_combobox.setEnabled(True)
+        if rc == 0:
+            self._broker_events.connected.emit(True)
+
+    def _on_disconnect(self, client, userdata, rc):
+        self._broker_events.connected.emit(False)
+
+    @pyqtSlot(bool)
+    def _on_broker_connection(self, connected):
+        if connected:
+            self._recipe_combobox.setEnabled(True)
+            self._show_status_bar_message('MQTT broker connected')
+        else:
+            self._show_status_bar_message('MQTT broker disconnected, runs are paused until it is reachable')
 
-    def _on_message(self, client, userdata, msg):
-        print('DEBUG(MQTT)', msg.payload)
+    def _selected_chamber(self):
+        return self._chambers[self._chamber_combobox.currentIndex()]
 
     @pyqtSlot()
-    def _on_stop(self):
-        self._recipe_stop_button.hide()
-        self._running_recipe.stop()
-        self._recipe_run_button.show()
-        self._recipe_run_button.setDisabled(True)
+    def _update_run_button(self):
+        selected = self._recipe_combobox.currentText()
+        busy = self._run_manager is not None and self._run_manager.is_busy(self._selected_chamber())
+        self._recipe_run_button.setEnabled(selected in self._input_selectors and not busy)
+        self._recipe_queue_button.setEnabled(selected in self._input_selectors and self._run_manager is not None)
+        self._recipe_sweep_button.setEnabled(selected in self._input_selectors and self._run_manager is not None)
+
+    def _offer_resume(self):
+        for checkpoint in pending(CHECKPOINT_DIRECTORY):
+            if checkpoint.recipe not in REGISTRY or checkpoint.chamber not in self._chambers:
+                continue
+            question = '{} on chamber {} was interrupted in cycle {} of {} ({}).\n\n' \
+                       'Resume with cycle {}? The valves are driven to the safe state first.'.format(
+                           checkpoint.recipe, checkpoint.chamber or 'default', checkpoint.cycle + 1,
+                           checkpoint.loops, checkpoint.time, checkpoint.cycle + 1)
+            answer = QMessageBox.question(self, 'Resume Run', question, QMessageBox.Yes | QMessageBox.No)
+            if answer == QMessageBox.Yes:
+                self._start_run(checkpoint.chamber, checkpoint.recipe,
+                                lambda signal_interface: self._run_manager.resume(checkpoint, signal_interface,
+                                                                                  **self._recipe_options))
+            else:
+                os.remove(checkpoint.path)
 
     @pyqtSlot()
     def _on_run(self):
-        self._recipe_run_button.hide()
-        self._recipe_stop_button.show()
-
+        chamber = self._selected_chamber()
         recipe_text = self._recipe_combobox.currentText()
         inputs = self._input_selectors[recipe_text].user_inputs
-        cls = REGISTRY[recipe_text]
 
-        self._running_recipe = cls(self._mqtt_client, self._signal_interface, **inputs)
+        self._start_run(chamber, recipe_text,
+                        lambda signal_interface: self._run_manager.start(chamber, recipe_text, signal_interface,
+                                                                         **inputs, **self._recipe_options))
 
-        thread = Thread(target=self._running_recipe)
-        thread.start()
+    @pyqtSlot()
+    def _on_queue(self):
+        recipe_text = self._recipe_combobox.currentText()
+        inputs = self._input_selectors[recipe_text].user_inputs
+
+        self._queue.add(recipe_text, inputs, self._selected_chamber())
 
     @pyqtSlot()
-    def _selection_changed(self):
-        if self._recipe_combobox.itemText(0) == '...':
-            self._recipe_combobox.removeItem(0)
+    def _on_sweep(self):
+        recipe_text = self._recipe_combobox.currentText()
+        dialog = SweepDialog(recipe_text, REGISTRY.inputs(recipe_text), self._queue_handoff, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
 
-        self._hide_all_user_inputs()
+        sweep = dialog.sweep
+        sweep.enqueue(self._queue, self._selected_chamber())
+        self._show_status_bar_message('sweep {}: {} variants queued'.format(sweep.name, len(sweep)))
+        self._queue_runners[self._selected_chamber()].start()
+        self._queue_widget.set_active(True)
 
-        selected = self._recipe_combobox.currentText()
+    @pyqtSlot()
+    def _on_start_queue(self):
+        for runner in self._queue_runners.values():
+            runner.start()
+        self._queue_widget.set_active(any(runner.active for runner in self._queue_runners.values()))
 
-        self._input_selectors[selected].show()
+    @pyqtSlot()
+    def _on_pause_queue(self):
+        for runner in self._queue_runners.values():
+            runner.pause()
 
-        self._recipe_run_button.setEnabled(True)
+    @pyqtSlot(object, object)
+    def _on_job_started(self, job, run):
+        self._add_run_widget(job.chamber, job.recipe, run, run.signal_interface)
 
-    def _hide_all_user_inputs(self):
-        for key, widget in self._input_selectors.items():
-            widget.hide()
+    @pyqtSlot(str)
+    def _on_queue_paused(self, reason):
+        self._queue_widget.set_active(any(runner.active for runner in self._queue_runners.values()))
+        self._show_status_bar_message('queue: {}'.format(reason))
 
     @pyqtSlot()
-    def _on_recipe_finished(self):
-        self._show_status_bar_message('recipe finished')
-        self._recipe_stop_button.hide()
-        self._recipe_run_button.show()
-        self._recipe_run_button.setEnabled(True)
-        self._running_recipe = None
+    def _deliver_signals(self):
+        for signal_interface in list(self._signal_interfaces):
+            if signal_interface.deliver():
+                self._signal_interfaces.remove(signal_interface)
+
+    def _start_run(self, chamber, recipe_text, start):
+        """
+        :param start: function which starts the run with the given signal interface
+        """
+        signal_interface = QtSignalInterface()
+        try:
+            run = start(signal_interface)
+        except ChamberBusyError as error:
+            QMessageBox.warning(self, 'Chamber Busy', str(error))
+            return
+
+        self._add_run_widget(chamber, recipe_text, run, signal_interface)
+
+    def _add_run_widget(self, chamber, recipe_text, run, signal_interface):
+        old_widget = self._run_widgets.pop(chamber, None)
+        if old_widget is not None:
+            old_widget.deleteLater()
+
+        widget = RunWidget(chamber, recipe_text, run.recipe.max_process_value(), self)
+        # the widget keeps the signal interface of its run alive
+        widget.signal_interface = signal_interface
+        signal_interface.started.connect(widget.on_started)
+        signal_interface.stopped.connect(widget.on_stopped)
+        signal_interface.finished.connect(widget.on_finished)
+        signal_interface.status_message.connect(widget.on_status_message)
+        signal_interface.update_process_value.connect(widget.on_update_process_value)
+        signal_interface.update_timeline.connect(widget.on_update_timeline)
+        signal_interface.finished.connect(self._update_run_button)
+        signal_interface.started.connect(lambda: self._show_status_bar_message(
+            '{} started on {}'.format(recipe_text, chamber or 'default')))
+        signal_interface.finished.connect(lambda: self._show_status_bar_message(
+            '{} finished on {}'.format(recipe_text, chamber or 'default')))
+        widget.stop_requested.connect(run.stop)
+        widget.close_requested.connect(lambda: self._close_run_widget(chamber, widget))
+
+        self._run_widgets[chamber] = widget
+        self._runs_layout.addWidget(widget)
+        self._signal_interfaces.append(signal_interface)
+        if self._plot_widget is not None:
+            self._plot_widget.set_recipe(run.recipe)
+        self._update_run_button()
+
+    def _close_run_widget(self, chamber, widget):
+        if self._run_widgets.get(chamber) is widget:
+            del self._run_widgets[chamber]
+        widget.deleteLater()
 
     @pyqtSlot()
-    def _on_recipe_started(self):
-        self._recipe_started_timestamp = datetime.now()
-        self._show_status_bar_message('recipe started')
+    def _on_simulate(self):
+        recipe_text = self._recipe_combobox.currentText()
+        inputs = self._input_selectors[recipe_text].user_inputs
 
-    @pyqtSlot()
-    def _on_recipe_stopped(self):
-        self._show_status_bar_message('recipe stopped')
+        result = simulate(REGISTRY[recipe_text], **inputs)
 
-    @pyqtSlot(str)
-    def _on_status_message(self, message):
-        self._show_status_bar_message(message)
+        QMessageBox.information(self, 'Simulation of {}'.format(recipe_text), '\n'.join(format_result(result)))
 
-    @pyqtSlot(int)
-    def _on_update_process_value(self, value):
-        max_value = self._running_recipe.max_process_value()
-        self._recipe_progress.setMinimum(0)
-        self._recipe_progress.setMaximum(max_value)
-        self._recipe_progress.setValue(value)
+    @pyqtSlot()
+    def _selection_changed(self):
+        if self._recipe_combobox.itemText(0) == '...':
+            self._recipe_combobox.removeItem(0)
 
-        diff = datetime.now() - self._recipe_started_timestamp
+        self._hide_all_user_inputs()
 
-        if value == 0:
-            estimated_end = None
-        else:
-            estimated_duration = diff / value * max_value
-            estimated_end = self._recipe_started_timestamp + estimated_duration
+        selected = self._recipe_combobox.currentText()
+
+        self._input_selectors[selected].show()
 
-        estimated_text = ''
-        if estimated_end is not None:
-            estimated_text = 'ETC: {:%H:%M}'.format(estimated_end) # estimated time of completion
+        self._recipe_simulate_button.setEnabled(True)
+        self._update_run_button()
 
-        self._etc_label.setText(estimated_text)
+    def _hide_all_user_inputs(self):
+        for key, widget in self._input_selectors.items():
+            widget.hide()
 
     def _show_status_bar_message(self, message):
         text = '{:%H:%M:%S} - {}'.format(datetime.now(), message)
         self._message_label.setText(text)
 
     def closeEvent(self, *args, **kwargs):
-        if self._running_recipe is not None:
-            self._running_recipe.stop()
+        for runner in self._queue_runners.values():
+            runner.pause()
+        if self._run_manager is not None:
+            self._run_manager.stop_all()
 
 
 if __name__ == '__main__':
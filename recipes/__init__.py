@@ -1,9 +1,10 @@
-from .recipe import REGISTRY
+"""Recipes are discovered by recipes.catalog.
 
-from importlib import import_module
+REGISTRY maps the recipe names to their classes and imports a recipe only
+when it is accessed, REGISTRY.inputs(name) returns the inputs from the index.
+"""
 import os
-paths = [x for x in os.listdir('./recipes') if x.endswith('py') and x != '__init__.py' and x != 'recipe.py']
 
-for path in paths:
-    print('importing recipes.{}'.format(path[:-3]))
-    import_module('recipes.{}'.format(path[:-3]))
\ No newline at end of file
+from .catalog import Catalog
+
+REGISTRY = Catalog(os.path.dirname(os.path.abspath(__file__)), __name__)
@@ -0,0 +1,162 @@
+"""Confirmation of valve and flow commands by the controller.
+
+The controller echoes the applied valve states as JSON on a state topic and
+the applied flow setpoint on a flow state topic. The Acknowledger waits for
+the echo of every command and records the latency from publishing the
+command to receiving its echo, per valve and per command topic.
+"""
+import json
+
+from threading import Condition
+from time import monotonic
+from typing import Callable, Dict, Optional, Tuple
+
+from .program import FLOW_TOPIC, VALVE_TOPIC, Step
+
+VALVE_STATE_TOPIC = 'ald/io/state'
+FLOW_STATE_TOPIC = 'ald/flow/state'
+
+
+class Acknowledger(object):
+    """Waits until the echoed hardware state matches the commanded state."""
+
+    def __init__(self, mqtt_client, valve_state_topic: str = VALVE_STATE_TOPIC,
+                 flow_state_topic: str = FLOW_STATE_TOPIC, timeout: float = 1.0,
+                 clock: Callable[[], float] = monotonic) -> None:
+        """
+        :param mqtt_client: paho client
+        :param valve_state_topic: topic on which the controller echoes the valve states
+        :param flow_state_topic: topic on which the controller echoes the flow setpoint
+        :param timeout: seconds to wait for the echo of a command
+        :param clock: monotonic clock, must be the clock of the scheduler
+        """
+        self._client = mqtt_client
+        self._valve_state_topic = valve_state_topic
+        self._flow_state_topic = flow_state_topic
+        self._timeout = timeout
+        self._clock = clock
+
+        self._condition = Condition()
+        self._valves = {}
+        self._flow = None
+        # time at which a valve or the flow was last echoed with a new state
+        self._changed_at = {}
+        self._cancelled = False
+
+        self._latencies = {}
+        self._timeouts = 0
+
+    @property
+    def timeouts(self) -> int:
+        return self._timeouts
+
+    def open(self) -> None:
+        """Subscribes to the state topics, call before the first command of every run.
+
+        A cancel of the previous run no longer aborts the waits.
+        """
+        with self._condition:
+            self._cancelled = False
+        self._client.subscribe(self._valve_state_topic)
+        self._client.message_callback_add(self._valve_state_topic, self._on_valve_state)
+        self._client.subscribe(self._flow_state_topic)
+        self._client.message_callback_add(self._flow_state_topic, self._on_flow_state)
+
+    def close(self) -> None:
+        for topic in (self._valve_state_topic, self._flow_state_topic):
+            self._client.message_callback_remove(topic)
+            self._client.unsubscribe(topic)
+
+    def cancel(self) -> None:
+        """Aborts the current and all further waits until the next open."""
+        with self._condition:
+            self._cancelled = True
+            self._condition.notify_all()
+
+    def _on_valve_state(self, client, user_data, message) -> None:
+        now = self._clock()
+        try:
+            valves = json.loads(message.payload)
+        except ValueError:
+            return
+        with self._condition:
+            for valve, state in valves.items():
+                if self._valves.get(valve) != state:
+                    self._valves[valve] = state
+                    self._changed_at[valve] = now
+            self._condition.notify_all()
+
+    def _on_flow_state(self, client, user_data, message) -> None:
+        now = self._clock()
+        try:
+            flow = float(message.payload)
+        except ValueError:
+            return
+        with self._condition:
+            if flow != self._flow:
+                self._flow = flow
+                self._changed_at[FLOW_TOPIC] = now
+            self._condition.notify_all()
+
+    def expect(self, step: Step) -> Tuple[float, Dict[str, bool], Optional[float]]:
+        """Registers the state commanded by step, call before publishing it.
+
+        :return: token for confirm
+        """
+        with self._condition:
+            valves = {valve: state for valve, state in step.valves if self._valves.get(valve) != state}
+            flow = step.flow if step.flow is not None and step.flow != self._flow else None
+        return self._clock(), valves, flow
+
+    def _pending(self, valves: Dict[str, bool], flow: Optional[float]) -> bool:
+        if flow is not None and self._flow != flow:
+            return True
+        return any(self._valves.get(valve) != state for valve, state in valves.items())
+
+    def confirm(self, token: Tuple[float, Dict[str, bool], Optional[float]]) -> Optional[float]:
+        """Waits for the echo of the commands registered by expect.
+
+        :return: time of the confirmation on the clock, None on timeout or cancel
+        """
+        sent_at, valves, flow = token
+        if not valves and flow is None:
+            return sent_at
+
+        deadline = sent_at + self._timeout
+        with self._condition:
+            while self._pending(valves, flow):
+                remaining = deadline - self._clock()
+                if self._cancelled:
+                    return None
+                if remaining <= 0:
+                    self._timeouts += 1
+                    return None
+                self._condition.wait(remaining)
+
+            confirmed_at = sent_at
+            for valve in valves:
+                latency = self._changed_at[valve] - sent_at
+                self._record('valve ' + valve, latency)
+                confirmed_at = max(confirmed_at, self._changed_at[valve])
+            if valves:
+                self._record(VALVE_TOPIC, confirmed_at - sent_at)
+            if flow is not None:
+                latency = self._changed_at[FLOW_TOPIC] - sent_at
+                self._record(FLOW_TOPIC, latency)
+                confirmed_at = max(confirmed_at, self._changed_at[FLOW_TOPIC])
+        return confirmed_at
+
+    def _record(self, key: str, latency: float) -> None:
+        self._latencies.setdefault(key, []).append(latency)
+
+    def latencies(self) -> Dict[str, Tuple[int, float, float, float, float]]:
+        """
+        :return: valve or topic -> (count, mean, median, 95th percentile, max) in seconds
+        """
+        result = {}
+        for key, values in self._latencies.items():
+            ordered = sorted(values)
+            count = len(ordered)
+            result[key] = (count, sum(ordered) / count, ordered[count // 2],
+                           ordered[min(count - 1, int(count * 0.95))], ordered[-1])
+        return result
@@ -0,0 +1,209 @@
+"""asyncio execution of recipes.
+
+AbstractRecipe.run_async runs a recipe as a coroutine, its waits are
+cancellable sleeps. AsyncMQTTClient drives a paho client from the same
+event loop instead of the network thread of paho, and AsyncRunManager runs
+the recipes of all chambers as tasks of one event loop, so dozens of runs
+share a single thread.
+
+The signal interfaces are called from the event loop thread; the Qt signal
+interface of the GUI delivers them as queued signals to the GUI thread.
+"""
+import asyncio
+
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import AsyncIterator, Iterable, Optional
+
+from .runs import Run, RunManager
+
+
+class AsyncMQTTClient(object):
+    """Runs a paho client on an asyncio event loop instead of its network thread.
+
+    The socket of the client is watched by the loop, so all callbacks run on
+    the loop. The client offers the methods of the paho client which the
+    recipes use and can be passed to them instead of the paho client. Like
+    the paho client, it can be used from other threads than the loop thread.
+
+    A lost connection is restored in the default executor, because paho
+    resolves and connects blocking. The loop does not read or write the
+    socket meanwhile, and publish, subscribe and unsubscribe wait for the
+    reconnect, so the client is never used by two threads at once.
+    """
+
+    # paho.mqtt.client.MQTT_ERR_SUCCESS
+    _SUCCESS = 0
+
+    # seconds between two calls of loop_misc
+    MISC_INTERVAL = 1.0
+
+    # seconds between attempts to reconnect, doubled after every failed attempt
+    RECONNECT_DELAY = 1.0
+    RECONNECT_DELAY_MAX = 8.0
+
+    def __init__(self, client) -> None:
+        """
+        :param client: paho client which is not connected and whose loop is not started
+        """
+        self._client = client
+        self._loop = None
+        self._misc_task = None
+        # held by the executor thread while it reconnects
+        self._lock = Lock()
+        self._reconnecting = False
+        # socket and write interest which were registered during a reconnect, watched afterwards
+        self._deferred_socket = None
+        self._deferred_write = False
+
+        client.on_socket_open = self._on_socket_open
+        client.on_socket_close = self._on_socket_close
+        client.on_socket_register_write = self._on_socket_register_write
+        client.on_socket_unregister_write = self._on_socket_unregister_write
+
+    @property
+    def client(self):
+        return self._client
+
+    async def connect(self, host: str, port: int = 1883, keepalive: int = 60) -> None:
+        """Connects to the broker and reconnects whenever the connection is lost.
+
+        :raises OSError: if the broker is not reachable, the client keeps trying to connect
+        """
+        self._loop = asyncio.get_running_loop()
+        self._misc_task = self._loop.create_task(self._misc_loop())
+        self._client.connect(host, port, keepalive)
+
+    async def disconnect(self) -> None:
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+        self._client.disconnect()
+
+    # paho calls the socket callbacks from the thread which publishes or reconnects,
+    # the loop only watches the socket when no reconnect is running
+    def _on_socket_open(self, client, user_data, sock) -> None:
+        self._loop.call_soon_threadsafe(self._watch_read, sock)
+
+    def _on_socket_close(self, client, user_data, sock) -> None:
+        self._loop.call_soon_threadsafe(self._unwatch, sock)
+
+    def _on_socket_register_write(self, client, user_data, sock) -> None:
+        self._loop.call_soon_threadsafe(self._watch_write, sock)
+
+    def _on_socket_unregister_write(self, client, user_data, sock) -> None:
+        self._loop.call_soon_threadsafe(self._unwatch_write, sock)
+
+    def _watch_read(self, sock) -> None:
+        if self._reconnecting:
+            self._deferred_socket = sock
+        else:
+            self._loop.add_reader(sock, self._client.loop_read)
+
+    def _watch_write(self, sock) -> None:
+        if self._reconnecting:
+            self._deferred_write = True
+        else:
+            self._loop.add_writer(sock, self._client.loop_write)
+
+    def _unwatch_write(self, sock) -> None:
+        self._deferred_write = False
+        self._loop.remove_writer(sock)
+
+    def _unwatch(self, sock) -> None:
+        if self._deferred_socket is sock:
+            self._deferred_socket = None
+            self._deferred_write = False
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+
+    def _reconnect(self) -> None:
+        with self._lock:
+            self._client.reconnect()
+
+    async def _misc_loop(self) -> None:
+        # keep alive pings and retries of paho, reconnects after the connection was lost
+        delay = self.RECONNECT_DELAY
+        while True:
+            await asyncio.sleep(self.MISC_INTERVAL)
+            if self._client.loop_misc() == self._SUCCESS:
+                continue
+            self._reconnecting = True
+            try:
+                # reconnect resolves and connects blocking
+                await self._loop.run_in_executor(None, self._reconnect)
+                delay = self.RECONNECT_DELAY
+            except OSError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.RECONNECT_DELAY_MAX)
+            finally:
+                self._reconnecting = False
+                sock, self._deferred_socket = self._deferred_socket, None
+                if sock is not None:
+                    self._loop.add_reader(sock, self._client.loop_read)
+                    if self._deferred_write:
+                        self._loop.add_writer(sock, self._client.loop_write)
+                self._deferred_write = False
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False):
+        with self._lock:
+            return self._client.publish(topic, payload, qos, retain)
+
+    def subscribe(self, topic: str, qos: int = 0):
+        with self._lock:
+            return self._client.subscribe(topic, qos)
+
+    def unsubscribe(self, topic: str):
+        with self._lock:
+            return self._client.unsubscribe(topic)
+
+    def message_callback_add(self, subscription: str, callback) -> None:
+        self._client.message_callback_add(subscription, callback)
+
+    def message_callback_remove(self, subscription: str) -> None:
+        self._client.message_callback_remove(subscription)
+
+    async def messages(self, subscription: str) -> AsyncIterator:
+        """Subscribes and yields the messages of the subscription until the iteration is closed."""
+        queue = asyncio.Queue()
+        self._client.message_callback_add(subscription, lambda client, user_data, message: queue.put_nowait(message))
+        self.subscribe(subscription)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(subscription)
+            self._client.message_callback_remove(subscription)
+
+
+class AsyncRunManager(RunManager):
+    """Runs the recipes of all chambers as tasks of one event loop.
+
+    start, stop and join can be called from any thread. Without a loop, the
+    manager runs its own loop in a daemon thread.
+    """
+
+    def __init__(self, mqtt_client, chambers: Iterable[Optional[str]] = (None,),
+                 checkpoint_directory: Optional[str] = None, telemetry=None,
+                 archive_directory: Optional[str] = None,
+                 loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        :param mqtt_client: client shared by all runs, e.g. an AsyncMQTTClient on the same loop
+        :param chambers: names of the chambers, None is the chamber of the single chamber setup
+        :param checkpoint_directory: directory of the checkpoints of the runs, None disables them
+        :param telemetry: telemetry.Telemetry which is passed to all recipes
+        :param archive_directory: directory of the columnar archives of the runs, None disables them
+        :param loop: running event loop, None starts a new one in a daemon thread
+        """
+        super().__init__(mqtt_client, chambers, checkpoint_directory, telemetry, archive_directory)
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            Thread(target=loop.run_forever, name='recipe-loop', daemon=True).start()
+        self._loop = loop
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    def _launch(self, run: Run) -> Future:
+        return asyncio.run_coroutine_threadsafe(run.recipe.run_async(), self._loop)
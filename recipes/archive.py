@@ -0,0 +1,350 @@
+"""Columnar binary archive of a run.
+
+Next to its text log, a run can write an archive directory with one raw
+file per column and a meta.json::
+
+    archives/2026-10-18T10-44-06-platinum-ald/
+        meta.json       recipe, chamber, inputs, valve and step names
+        time.f8         monotonic time of every executed step
+        step.u2         index of the step name in meta.json
+        cycle.i4        index of the current cycle, -1 before the first one
+        valves.u8       commanded valves as bit mask, bit i is valve i of meta.json
+        flow.f8         commanded flow setpoint, nan before the first one
+
+and for every telemetry channel <channel>.time.f8 (wall time) and
+<channel>.value.f8. The recipe thread only appends to in-memory blocks; a
+writer thread appends the blocks to the files once per flush interval, so a
+crash loses at most the last block. A write error, e.g. on a full disk, ends
+the writing; the columns may then be written up to different rows, so
+meta.json records the number of rows which were written to all columns and
+the error. A reader maps the files into memory and returns the columns as
+NumPy arrays without copying them.
+"""
+import json
+import os
+import sys
+
+from array import array
+from datetime import datetime
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+from .program import Program, Step
+
+ARCHIVE_DIRECTORY = 'archives'
+
+# increase if the format of the archives changes
+ARCHIVE_VERSION = 1
+
+_BYTE_ORDER = '<' if sys.byteorder == 'little' else '>'
+
+# column name, array type code and NumPy dtype of the step columns
+COLUMNS = (('time', 'd', 'f8'), ('step', 'H', 'u2'), ('cycle', 'i', 'i4'), ('valves', 'Q', 'u8'), ('flow', 'd', 'f8'))
+
+
+def _file_name(column: str, dtype: str) -> str:
+    return '{}.{}'.format(column, dtype)
+
+
+def archive_path(directory: str, recipe: str, chamber: Optional[str]) -> str:
+    """Returns a new archive directory for a run which starts now."""
+    name = recipe.lower().replace(' ', '-')
+    if chamber is not None:
+        name = '{}-{}'.format(chamber, name)
+    path = os.path.join(directory, '{:%Y-%m-%dT%H-%M-%S}-{}'.format(datetime.now(), name))
+    candidate, number = path, 1
+    while os.path.exists(candidate):
+        number += 1
+        candidate = '{}-{}'.format(path, number)
+    return candidate
+
+
+class ArchiveWriter(object):
+    """Writes the archive of a single run."""
+
+    def __init__(self, directory: str, recipe: str, inputs: Dict, chamber: Optional[str] = None,
+                 telemetry=None, flush_interval: float = 1.0) -> None:
+        """
+        :param directory: directory of the archives, the archive of the run is created in it when the run starts
+        :param recipe: name of the recipe in recipes.REGISTRY
+        :param inputs: inputs of the recipe, must be JSON serializable
+        :param chamber: chamber of the run
+        :param telemetry: telemetry.Telemetry whose channels are archived
+        :param flush_interval: seconds between two writes
+        """
+        self._directory = directory
+        self._path = None
+        self._meta = {'version': ARCHIVE_VERSION, 'recipe': recipe, 'inputs': dict(inputs), 'chamber': chamber}
+        self._telemetry = telemetry
+        self._flush_interval = flush_interval
+
+        self._files = None
+        self._blocks = self._new_blocks()
+        self._block_lock = Lock()
+        self._flush_lock = Lock()
+        self._stop_event = Event()
+        self._thread = None
+
+        self._step_indices = {}
+        self._valve_bits = {}
+        self._valves = 0
+        self._flow = float('nan')
+        self._telemetry_since = {}
+        self._rows = 0
+        self._error = None
+
+    @property
+    def path(self) -> Optional[str]:
+        """Directory of the archive, None before the run started."""
+        return self._path
+
+    @property
+    def error(self) -> Optional[OSError]:
+        """The error which stopped the writing, None if the archive is complete."""
+        return self._error
+
+    @staticmethod
+    def _new_blocks() -> Dict[str, array]:
+        return {column: array(type_code) for column, type_code, dtype in COLUMNS}
+
+    def open(self, program: Program, wall_offset: float) -> None:
+        """Writes meta.json and creates the column files.
+
+        :param program: program of the run, its valves and step names are numbered
+        :param wall_offset: difference of the wall clock and the clock of the timestamps
+        """
+        steps = program.setup + program.cycle + program.teardown
+        step_names = list(dict.fromkeys(step.name for step in steps))
+        valves = list(dict.fromkeys(valve for step in steps for valve, state in step.valves))
+        if len(valves) > 64:
+            raise ValueError('an archive holds at most 64 valves')
+        self._step_indices = {name: index for index, name in enumerate(step_names)}
+        self._valve_bits = {valve: 1 << index for index, valve in enumerate(valves)}
+
+        channels = self._telemetry.channels if self._telemetry is not None else []
+        self._telemetry_since = {channel: self._telemetry.channel(channel).count for channel in channels}
+
+        columns = {column: _BYTE_ORDER + dtype for column, type_code, dtype in COLUMNS}
+        self._meta.update(steps=step_names, valves=valves, channels=channels, columns=columns,
+                          wall_offset=wall_offset, started=datetime.now().isoformat(), rows=None, complete=False)
+        try:
+            self._path = archive_path(self._directory, self._meta['recipe'], self._meta['chamber'])
+            os.makedirs(self._path)
+            self._write_meta()
+            self._files = {column: open(os.path.join(self._path, _file_name(column, dtype)), 'ab')
+                           for column, type_code, dtype in COLUMNS}
+            for channel in channels:
+                for column in ('time', 'value'):
+                    self._files[(channel, column)] = open(
+                        os.path.join(self._path, _file_name('{}.{}'.format(channel, column), 'f8')), 'ab')
+        except OSError as error:
+            self._error = error
+
+    def start(self, program: Program, wall_offset: float) -> None:
+        """Opens the archive and starts the writer thread."""
+        self.open(program, wall_offset)
+        if self._thread is None and self._files is not None:
+            self._thread = Thread(target=self._write_loop, name='run-archive', daemon=True)
+            self._thread.start()
+
+    def _write_meta(self) -> None:
+        path = os.path.join(self._path, 'meta.json')
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self._meta, file)
+        os.replace(temporary_path, path)
+
+    def record(self, timestamp: float, step: Step, cycle: Optional[int]) -> None:
+        """Appends an executed step, called from the recipe thread."""
+        bits = self._valve_bits
+        for valve, state in step.valves:
+            if state:
+                self._valves |= bits[valve]
+            else:
+                self._valves &= ~bits[valve]
+        if step.flow is not None:
+            self._flow = step.flow
+
+        with self._block_lock:
+            blocks = self._blocks
+            blocks['time'].append(timestamp)
+            blocks['step'].append(self._step_indices[step.name])
+            blocks['cycle'].append(-1 if cycle is None else cycle)
+            blocks['valves'].append(self._valves)
+            blocks['flow'].append(self._flow)
+
+    def _write_loop(self) -> None:
+        while not self._stop_event.wait(self._flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Appends the recorded block and the new telemetry samples to the files."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        with self._block_lock:
+            blocks, self._blocks = self._blocks, self._new_blocks()
+        if self._files is None or self._error is not None:
+            return
+
+        try:
+            for column, type_code, dtype in COLUMNS:
+                # arrays are written in the byte order of the machine, which is recorded in meta.json
+                blocks[column].tofile(self._files[column])
+                self._files[column].flush()
+        except OSError as error:
+            self._error = error
+            return
+        self._rows += len(blocks['time'])
+
+        try:
+            for channel, since in self._telemetry_since.items():
+                buffer = self._telemetry.channel(channel)
+                count = buffer.count
+                times, values = buffer.to_arrays(since)
+                times.tofile(self._files[(channel, 'time')])
+                values.tofile(self._files[(channel, 'value')])
+                self._telemetry_since[channel] = count
+                for column in ('time', 'value'):
+                    self._files[(channel, column)].flush()
+        except OSError as error:
+            self._error = error
+
+    def close(self) -> None:
+        """Writes the last block and closes the files.
+
+        meta.json records the number of complete rows and whether the archive is complete.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._flush_lock:
+            self._flush()
+            if self._files is None:
+                return
+            for file in self._files.values():
+                try:
+                    file.close()
+                except OSError as error:
+                    self._error = self._error or error
+            self._files = None
+            # the rows of the last successful flush are complete in all columns
+            self._meta.update(rows=self._rows, complete=self._error is None)
+            if self._error is not None:
+                self._meta['error'] = str(self._error)
+            try:
+                self._write_meta()
+            except OSError as error:
+                self._error = self._error or error
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('reading run archives requires numpy')
+    return numpy
+
+
+class Archive(object):
+    """Reads an archive, the columns are NumPy arrays which map the files."""
+
+    def __init__(self, path: str) -> None:
+        with open(os.path.join(path, 'meta.json')) as file:
+            self._meta = json.load(file)
+        if self._meta.get('version') != ARCHIVE_VERSION:
+            raise ValueError('{} is not an archive of version {}'.format(path, ARCHIVE_VERSION))
+        self._path = path
+        self._rows = self._meta['rows']
+        if self._rows is None:
+            # the run did not end, only complete rows are read
+            self._rows = min(self._file_rows(_file_name(column, dtype), dtype) for column, type_code, dtype in COLUMNS)
+
+    def _file_rows(self, name: str, dtype: str) -> int:
+        try:
+            return os.path.getsize(os.path.join(self._path, name)) // int(dtype[1:])
+        except OSError:
+            return 0
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def recipe(self) -> str:
+        return self._meta['recipe']
+
+    @property
+    def chamber(self) -> Optional[str]:
+        return self._meta['chamber']
+
+    @property
+    def inputs(self) -> Dict:
+        return self._meta['inputs']
+
+    @property
+    def steps(self) -> List[str]:
+        return self._meta['steps']
+
+    @property
+    def valves(self) -> List[str]:
+        return self._meta['valves']
+
+    @property
+    def channels(self) -> List[str]:
+        return self._meta['channels']
+
+    @property
+    def wall_offset(self) -> float:
+        """Add to the time column to get POSIX time."""
+        return self._meta['wall_offset']
+
+    @property
+    def complete(self) -> bool:
+        return self._meta['complete']
+
+    @property
+    def error(self) -> Optional[str]:
+        """The error which ended the writing of the archive, None if there was none."""
+        return self._meta.get('error')
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _map(self, name: str, dtype: str, rows: int):
+        numpy = _numpy()
+        if rows == 0:
+            return numpy.empty(0, dtype=dtype)
+        return numpy.memmap(os.path.join(self._path, name), dtype=dtype, mode='r', shape=(rows,))
+
+    def column(self, name: str):
+        """Returns one of the columns time, step, cycle, valves and flow without copying it."""
+        dtype = self._meta['columns'][name]
+        return self._map(_file_name(name, dtype[1:]), dtype, self._rows)
+
+    def valve(self, name: str):
+        """Returns the commanded state of a valve after every step as boolean array."""
+        bit = self._meta['valves'].index(name)
+        return (self.column('valves') >> _numpy().uint64(bit)) & _numpy().uint64(1) == 1
+
+    def telemetry(self, channel: str) -> Tuple:
+        """Returns the wall time and the values of a telemetry channel without copying them."""
+        # same byte order as the time column
+        dtype = self._meta['columns']['time']
+        names = [_file_name('{}.{}'.format(channel, column), 'f8') for column in ('time', 'value')]
+        rows = min(self._file_rows(name, 'f8') for name in names)
+        return tuple(self._map(name, dtype, rows) for name in names)
+
+
+def archives(directory: str = ARCHIVE_DIRECTORY) -> List[Archive]:
+    """Returns all readable archives of a directory, ordered by their start."""
+    if not os.path.isdir(directory):
+        return []
+    result = []
+    for name in sorted(os.listdir(directory)):
+        try:
+            result.append(Archive(os.path.join(directory, name)))
+        except (OSError, ValueError, KeyError):
+            continue
+    return result
@@ -0,0 +1,146 @@
+"""Discovery of recipes without importing them.
+
+The catalog scans the recipe directory for Python modules and recipe files
+and keeps a persisted index of the recipe names and inputs of every source,
+keyed by its modification time and size. Only new or changed sources are
+imported to update the index, all other recipes are imported when they are
+used for the first time. A Python module is only imported if it registers a
+recipe with the decorator ``@register(...)`` at the start of a line, so the
+engine modules of the package are indexed without recipes.
+"""
+import json
+import os
+import re
+
+from collections import OrderedDict
+from collections.abc import Mapping
+from importlib import import_module
+from typing import Dict, List, Optional
+
+from . import declarative
+from .recipe import REGISTRY as CLASSES
+from .recipe import AbstractValue, FloatValue, IntegerValue
+
+# increase if the format of the index changes
+INDEX_VERSION = 1
+
+# marks a Python module which declares recipes
+_REGISTER_DECORATOR = re.compile(r'^@(?:\w+\.)*register\(', re.MULTILINE)
+
+VALUE_TYPES = {'int': IntegerValue, 'float': FloatValue}
+VALUE_TYPE_NAMES = {cls: name for name, cls in VALUE_TYPES.items()}
+
+
+def _describe_inputs(inputs: Dict[str, AbstractValue]) -> Optional[dict]:
+    result = {}
+    for key, value in inputs.items():
+        type_name = VALUE_TYPE_NAMES.get(type(value))
+        if type_name is None:
+            return None  # not serializable, inputs are taken from the class
+        result[key] = {'type': type_name, 'label': value.fullname, 'default': value.default}
+    return result
+
+
+class Catalog(Mapping):
+    """Maps recipe names to recipe classes, importing them on first access."""
+
+    def __init__(self, directory: str, package: str = 'recipes') -> None:
+        """
+        :param directory: directory of the recipe package
+        :param package: name of the recipe package
+        """
+        self._directory = directory
+        self._package = package
+        self._index_path = os.path.join(directory, declarative.CACHE_DIRECTORY, 'index.json')
+        self._entries = None
+
+    def _scan_directory(self) -> Dict[str, List[int]]:
+        sources = {}
+        for entry in os.scandir(self._directory):
+            name, extension = os.path.splitext(entry.name)
+            if extension == '.py' and name != '__init__' or extension in declarative.EXTENSIONS:
+                stat = entry.stat()
+                sources[entry.name] = [stat.st_mtime_ns, stat.st_size]
+        return sources
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_path) as file:
+                index = json.load(file)
+            if index.get('version') == INDEX_VERSION:
+                return index['sources']
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def _write_index(self, sources: dict) -> None:
+        try:
+            os.makedirs(os.path.dirname(self._index_path), exist_ok=True)
+            temporary_path = self._index_path + '.tmp'
+            with open(temporary_path, 'w') as file:
+                json.dump({'version': INDEX_VERSION, 'sources': sources}, file)
+            os.replace(temporary_path, self._index_path)
+        except OSError:
+            pass  # the index is only an optimization
+
+    def _load_source(self, filename: str) -> List[str]:
+        """Imports a source and returns the names of the recipes it registered."""
+        name, extension = os.path.splitext(filename)
+        if extension == '.py':
+            with open(os.path.join(self._directory, filename), encoding='utf-8') as file:
+                if _REGISTER_DECORATOR.search(file.read()) is None:
+                    return []
+            module_name = '{}.{}'.format(self._package, name)
+            import_module(module_name)
+            return [key for key, cls in CLASSES.items() if cls.__module__ == module_name]
+
+        cls = declarative.load(os.path.join(self._directory, filename))
+        return [key for key, value in CLASSES.items() if value is cls]
+
+    def refresh(self) -> None:
+        """Updates the index for new, changed and removed sources."""
+        cached = self._read_index()
+        sources = OrderedDict()
+        changed = False
+
+        for filename, stamp in sorted(self._scan_directory().items()):
+            source = cached.get(filename)
+            if source is None or source['stamp'] != stamp:
+                recipes = [{'name': key, 'inputs': _describe_inputs(CLASSES[key].inputs())}
+                           for key in self._load_source(filename)]
+                source = {'stamp': stamp, 'recipes': recipes}
+                changed = True
+            sources[filename] = source
+
+        if changed or set(cached) != set(sources):
+            self._write_index(sources)
+
+        self._entries = OrderedDict()
+        for filename, source in sources.items():
+            for recipe in source['recipes']:
+                self._entries[recipe['name']] = {'source': filename, 'inputs': recipe['inputs']}
+
+    def _get_entries(self) -> dict:
+        if self._entries is None:
+            self.refresh()
+        return self._entries
+
+    def __getitem__(self, name: str) -> type:
+        entry = self._get_entries()[name]
+        if name not in CLASSES:
+            self._load_source(entry['source'])
+        return CLASSES[name]
+
+    def __iter__(self):
+        return iter(self._get_entries())
+
+    def __len__(self) -> int:
+        return len(self._get_entries())
+
+    def inputs(self, name: str) -> Dict[str, AbstractValue]:
+        """Returns the inputs of a recipe, without importing it if possible."""
+        spec = self._get_entries()[name]['inputs']
+        if spec is None:
+            return self[name].inputs()
+        return {key: VALUE_TYPES[value['type']](value['label'], default=value['default'])
+                for key, value in spec.items()}
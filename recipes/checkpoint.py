@@ -0,0 +1,194 @@
+"""Checkpoints of running recipes.
+
+At every cycle boundary the engine writes the recipe name, its inputs and
+the index of the cycle which starts to a small JSON file. The file is
+replaced atomically and synced to disk by a writer thread, so it survives
+crashes of the GUI and reboots without delaying the recipe. It is removed
+when the recipe completes all cycles. A recipe which crashed keeps its
+checkpoint and can be resumed with start_cycle; the checkpoint of a recipe
+which the operator stopped is marked as stopped and not offered by pending,
+it can still be resumed explicitly.
+
+A resumed run always starts with the teardown of the recipe, which drives
+the valves to the safe state, so the checkpoint does not keep the valve
+states of the interrupted run.
+"""
+import json
+import os
+
+from collections import namedtuple
+from datetime import datetime
+from threading import Condition, Thread
+from typing import Dict, List, Optional
+
+CHECKPOINT_DIRECTORY = 'checkpoints'
+
+# increase if the format of the checkpoints changes
+CHECKPOINT_VERSION = 2
+
+Checkpoint = namedtuple('Checkpoint', ['path', 'recipe', 'inputs', 'chamber', 'cycle', 'loops', 'stopped', 'time'])
+Checkpoint.__doc__ = """A checkpoint read from disk.
+
+:param path: file of the checkpoint
+:param recipe: name of the recipe in recipes.REGISTRY
+:param inputs: inputs the recipe was started with
+:param chamber: chamber of the run
+:param cycle: index of the cycle which was started last, the run resumes with it
+:param loops: number of cycles of the run
+:param stopped: True if the run was stopped by the operator
+:param time: ISO time at which the checkpoint was written
+"""
+
+
+def checkpoint_path(directory: str, chamber: Optional[str]) -> str:
+    """Returns the checkpoint file of a chamber, there is one run per chamber."""
+    return os.path.join(directory, '{}.json'.format(chamber or 'default'))
+
+
+class CheckpointFile(object):
+    """Writes the checkpoints of a single run from a background thread.
+
+    save only hands the state to the writer thread. If the writer is still
+    busy, a newer state replaces the one which is waiting, only the latest
+    state is written.
+    """
+
+    def __init__(self, path: str, recipe: str, inputs: Dict, chamber: Optional[str] = None) -> None:
+        """
+        :param path: checkpoint file, see checkpoint_path
+        :param recipe: name of the recipe in recipes.REGISTRY
+        :param inputs: inputs of the recipe, must be JSON serializable
+        :param chamber: chamber of the run
+        """
+        self._path = path
+        self._data = {'version': CHECKPOINT_VERSION, 'recipe': recipe, 'inputs': dict(inputs), 'chamber': chamber}
+
+        self._condition = Condition()
+        self._thread = None
+        self._closing = False
+        # state which is not written yet, and the last saved state
+        self._pending = None
+        self._last = None
+        self._writing = False
+        self._error = None
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def save(self, cycle: int, loops: int, stopped: bool = False) -> None:
+        """Hands a state to the writer thread, which atomically replaces the checkpoint file.
+
+        :raises OSError: if writing an earlier state failed, the new state is written anyway
+        """
+        data = dict(self._data, cycle=cycle, loops=loops, stopped=stopped, time=datetime.now().isoformat())
+        with self._condition:
+            self._pending = self._last = data
+            error, self._error = self._error, None
+            if self._thread is None:
+                self._closing = False
+                self._thread = Thread(target=self._write_loop, name='checkpoint-writer', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+        if error is not None:
+            raise error
+
+    def mark_stopped(self) -> None:
+        """Saves the last state again as stopped, unless the checkpoint was removed."""
+        with self._condition:
+            last = self._last
+        if last is not None and not last['stopped']:
+            self.save(last['cycle'], last['loops'], stopped=True)
+
+    def flush(self) -> None:
+        """Waits until the pending state is written.
+
+        :raises OSError: if writing a state failed
+        """
+        with self._condition:
+            while self._pending is not None or self._writing:
+                self._condition.wait()
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self) -> None:
+        """Writes the pending state and ends the writer thread.
+
+        :raises OSError: if writing a state failed
+        """
+        try:
+            self.flush()
+        finally:
+            with self._condition:
+                thread, self._thread = self._thread, None
+                self._closing = True
+                self._condition.notify_all()
+            if thread is not None:
+                thread.join()
+
+    def _write_loop(self) -> None:
+        while True:
+            with self._condition:
+                while self._pending is None and not self._closing:
+                    self._condition.wait()
+                data, self._pending = self._pending, None
+                if data is None:
+                    return
+                self._writing = True
+            try:
+                self._write(data)
+            except OSError as error:
+                with self._condition:
+                    self._error = error
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
+
+    def _write(self, data: dict) -> None:
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = self._path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self._path)
+
+    def remove(self) -> None:
+        """Drops the pending state and removes the checkpoint file."""
+        with self._condition:
+            self._pending = self._last = None
+            while self._writing:
+                self._condition.wait()
+            try:
+                os.remove(self._path)
+            except FileNotFoundError:
+                pass
+
+
+def load(path: str) -> Optional[Checkpoint]:
+    """Reads a checkpoint, returns None if the file is missing, broken or of another version."""
+    try:
+        with open(path) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('version') != CHECKPOINT_VERSION:
+        return None
+    try:
+        return Checkpoint(path, data['recipe'], data['inputs'], data['chamber'], data['cycle'], data['loops'],
+                          data['stopped'], data['time'])
+    except KeyError:
+        return None
+
+
+def pending(directory: str = CHECKPOINT_DIRECTORY) -> List[Checkpoint]:
+    """Returns all readable checkpoints of a directory whose runs were not stopped by the operator."""
+    if not os.path.isdir(directory):
+        return []
+    checkpoints = (load(os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+                   if name.endswith('.json'))
+    return [checkpoint for checkpoint in checkpoints if checkpoint is not None and not checkpoint.stopped]
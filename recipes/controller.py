@@ -0,0 +1,163 @@
+"""Execution of whole programs by the valve controller.
+
+Instead of publishing every step, a recipe can upload its compiled program
+with the loop count in one message. The controller executes the steps with
+its own clock, so the timing does not depend on the network and on the
+Python threads, and reports its progress::
+
+    ald/program/load    {"id": "<run id>", "start_cycle": 0, "program": <Program.to_dict()>}
+    ald/program/cmd     stop: skip the remaining cycles and execute the teardown
+    ald/program/events  {"id": "<run id>", "event": "step", "phase": "cycle", "cycle": 3, "index": 1, "time": 12.5}
+
+The events are accepted, step, done (the program including its teardown was
+executed), stopped (the teardown after a stop command was executed) and
+error with a message. Step events carry the phase of the step (resume,
+setup, cycle or teardown), the cycle, the index of the step within its phase
+and the seconds since the controller started the program. A program with a
+start cycle other than 0 is a resumed run: the controller executes the
+teardown first (phase resume), then the setup and the remaining cycles.
+
+All topics are moved into the namespace of the chamber, see
+program.namespaced_topic. fake.FakeProgramController is a reference
+implementation of the controller side.
+"""
+import json
+
+from collections import namedtuple
+from queue import Empty, Queue
+from typing import Optional, Tuple
+from uuid import uuid4
+
+from .program import Program, namespaced_steps, namespaced_topic
+
+PROGRAM_TOPIC = 'ald/program/load'
+PROGRAM_COMMAND_TOPIC = 'ald/program/cmd'
+PROGRAM_EVENT_TOPIC = 'ald/program/events'
+
+ACCEPTED = 'accepted'
+STEP = 'step'
+DONE = 'done'
+STOPPED = 'stopped'
+ERROR = 'error'
+
+RESUME = 'resume'
+SETUP = 'setup'
+CYCLE = 'cycle'
+TEARDOWN = 'teardown'
+
+ProgramEvent = namedtuple('ProgramEvent', ['id', 'event', 'phase', 'cycle', 'index', 'time', 'message'])
+ProgramEvent.__doc__ = """A progress report of the controller.
+
+:param id: run id of the uploaded program
+:param event: accepted, step, done, stopped or error
+:param phase: phase of the executed step: resume, setup, cycle or teardown
+:param cycle: index of the cycle of the step, None outside the cycles
+:param index: index of the step within its phase
+:param time: seconds since the controller started the program
+:param message: description of an error
+"""
+
+
+def encode_program(program: Program, run_id: str, start_cycle: int = 0) -> bytes:
+    return json.dumps({'id': run_id, 'start_cycle': start_cycle, 'program': program.to_dict()}).encode()
+
+
+def decode_program(payload: bytes) -> Tuple[str, int, Program]:
+    """Returns run id, start cycle and program of an upload.
+
+    :raises ValueError: if the payload is not a valid upload
+    """
+    try:
+        data = json.loads(payload)
+        return data['id'], int(data.get('start_cycle', 0)), Program.from_dict(data['program'])
+    except (KeyError, TypeError, AttributeError) as error:
+        raise ValueError('invalid program: {!r}'.format(error))
+
+
+def encode_event(run_id: str, event: str, phase: Optional[str] = None, cycle: Optional[int] = None,
+                 index: Optional[int] = None, time: Optional[float] = None, message: Optional[str] = None) -> bytes:
+    data = {'id': run_id, 'event': event}
+    for key, value in (('phase', phase), ('cycle', cycle), ('index', index), ('time', time), ('message', message)):
+        if value is not None:
+            data[key] = value
+    return json.dumps(data).encode()
+
+
+def decode_event(payload: bytes) -> ProgramEvent:
+    """:raises ValueError: if the payload is not an event"""
+    try:
+        data = json.loads(payload)
+        return ProgramEvent(data['id'], data['event'], data.get('phase'), data.get('cycle'), data.get('index'),
+                            data.get('time'), data.get('message'))
+    except (KeyError, TypeError, AttributeError) as error:
+        raise ValueError('invalid program event: {!r}'.format(error))
+
+
+def namespaced_program(program: Program, chamber: Optional[str]) -> Program:
+    """Returns the program with all message topics moved into the namespace of a chamber."""
+    if chamber is None:
+        return program
+    return Program(namespaced_steps(program.cycle, chamber), program.loops,
+                   setup=namespaced_steps(program.setup, chamber),
+                   teardown=namespaced_steps(program.teardown, chamber))
+
+
+class ProgramChannel(object):
+    """Uploads the program of a run to the controller of a chamber and receives its events."""
+
+    def __init__(self, mqtt_client, chamber: Optional[str] = None) -> None:
+        """
+        :param mqtt_client: connected paho client
+        :param chamber: name of the chamber, None uses the topics of a single chamber
+        """
+        self._mqtt_client = mqtt_client
+        self._chamber = chamber
+        self._program_topic = namespaced_topic(PROGRAM_TOPIC, chamber)
+        self._command_topic = namespaced_topic(PROGRAM_COMMAND_TOPIC, chamber)
+        self._event_topic = namespaced_topic(PROGRAM_EVENT_TOPIC, chamber)
+        self._events = Queue()
+        self._run_id = None
+        self._invalid = 0
+
+    @property
+    def stop_message(self) -> Tuple[str, bytes]:
+        """Topic and payload which stop the program on the controller."""
+        return self._command_topic, b'stop'
+
+    @property
+    def invalid_events(self) -> int:
+        """Number of event payloads which could not be decoded."""
+        return self._invalid
+
+    def open(self) -> None:
+        self._mqtt_client.subscribe(self._event_topic)
+        self._mqtt_client.message_callback_add(self._event_topic, self._on_event)
+
+    def close(self) -> None:
+        self._mqtt_client.message_callback_remove(self._event_topic)
+        self._mqtt_client.unsubscribe(self._event_topic)
+
+    def upload(self, program: Program, start_cycle: int = 0) -> str:
+        """Sends the program to the controller, returns the run id of its events."""
+        self._run_id = uuid4().hex
+        self._events = Queue()
+        self._mqtt_client.publish(self._program_topic,
+                                  encode_program(namespaced_program(program, self._chamber), self._run_id,
+                                                 start_cycle))
+        return self._run_id
+
+    def _on_event(self, client, user_data, message) -> None:
+        try:
+            event = decode_event(message.payload)
+        except ValueError:
+            self._invalid += 1
+            return
+        if event.id == self._run_id:
+            self._events.put(event)
+
+    def next_event(self, timeout: float) -> Optional[ProgramEvent]:
+        """Returns the next event of the uploaded program, None if there was none within timeout seconds."""
+        try:
+            return self._events.get(timeout=timeout)
+        except Empty:
+            return None
@@ -0,0 +1,289 @@
+"""Recipes described by TOML or YAML files.
+
+A recipe file declares the valves, the inputs and the steps of a recipe::
+
+    name = "Center Purge"
+    logname = "center-purge"
+    command_topic = "ald/recipes/center_purge/cmd"
+    valves = ["centerpurge", "centeroxygen", "rightpurge"]
+    loops = "n"
+
+    [inputs.n]
+    type = "int"
+    label = "Number of Loops"
+    default = 100
+
+    [inputs.flush_wait]
+    type = "float"
+    label = "Flush Wait Time (s)"
+    default = 2
+
+    [[cycle]]
+    name = "Flush center"
+    duration = "flush_wait"
+    open = ["centerpurge"]
+    flow = 0.0
+
+    [[teardown]]
+    name = "Close all valves"
+    open = []
+    flow = 0.0
+
+`duration`, `flow` and `loops` are either numbers or the name of an input.
+`open` lists the valves which are open during the step, all other valves of
+the recipe are closed. A step without `open` does not publish valve states,
+a step without `flow` does not publish a setpoint. Additional messages can be
+given as `messages = [["topic", "payload"]]`. Steps are declared in the lists
+`setup`, `cycle` and `teardown`. Unknown keys are rejected, so a misspelled
+key does not silently change the recipe.
+
+A file is parsed and compiled once into a template with pre-encoded payloads.
+The template is cached in `__cache__` next to the file, keyed by the hash of
+the file, so only changed files are parsed again. Building a recipe only binds
+the inputs to the template.
+"""
+import json
+import os
+
+from hashlib import sha256
+from typing import Dict, Union
+
+from .recipe import AbstractRecipe, AbstractValue, FloatValue, IntegerValue, register
+from .program import FLOW_TOPIC, VALVE_TOPIC, Program, Step
+
+# increase if the format of the compiled templates changes
+TEMPLATE_VERSION = 2
+
+EXTENSIONS = ('.toml', '.yaml', '.yml')
+
+CACHE_DIRECTORY = '__cache__'
+
+VALUE_TYPES = {'int': IntegerValue, 'float': FloatValue}
+
+# keys which a recipe file, an input and a step may declare
+DEFINITION_KEYS = ('name', 'logname', 'command_topic', 'valves', 'loops', 'inputs', 'setup', 'cycle', 'teardown')
+INPUT_KEYS = ('type', 'label', 'default')
+STEP_KEYS = ('name', 'duration', 'open', 'flow', 'messages')
+
+
+class RecipeFileError(ValueError):
+    """Raised if a recipe file is invalid."""
+
+    def __init__(self, path: str, message: str) -> None:
+        super().__init__('{}: {}'.format(path, message))
+
+
+def _parse(path: str, content: bytes) -> dict:
+    # the parsers are only imported if a file is not in the cache
+    if path.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise RecipeFileError(path, 'reading TOML files requires python 3.11 or tomli')
+        return tomllib.loads(content.decode())
+
+    try:
+        import yaml
+    except ImportError:
+        raise RecipeFileError(path, 'reading YAML files requires PyYAML')
+    return yaml.safe_load(content)
+
+
+def _check_keys(path: str, what: str, value, allowed: tuple) -> None:
+    if not isinstance(value, dict):
+        raise RecipeFileError(path, '{} must be a table'.format(what))
+    unknown = set(value) - set(allowed)
+    if unknown:
+        raise RecipeFileError(path, '{} has unknown keys {}'.format(what, sorted(unknown)))
+
+
+def _names(path: str, value, what: str) -> list:
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise RecipeFileError(path, '{} must be a list of valve names'.format(what))
+    return value
+
+
+def _parameter(path: str, value: Union[int, float, str], inputs: dict, what: str) -> Union[float, str]:
+    if isinstance(value, str):
+        if value not in inputs:
+            raise RecipeFileError(path, '{} refers to unknown input {!r}'.format(what, value))
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise RecipeFileError(path, '{} must be a number or an input name'.format(what))
+    if value < 0:
+        raise RecipeFileError(path, '{} must not be negative'.format(what))
+    return float(value)
+
+
+def compile_definition(path: str, definition: dict) -> dict:
+    """Validates a parsed recipe file and compiles it into a template.
+
+    :param path: path of the file, used in error messages
+    :param definition: content of the file
+    :return: JSON serializable template
+    """
+    _check_keys(path, 'the recipe', definition, DEFINITION_KEYS)
+    for key in ('name', 'valves', 'cycle', 'loops'):
+        if key not in definition:
+            raise RecipeFileError(path, 'missing key {!r}'.format(key))
+
+    valves = _names(path, definition['valves'], 'valves')
+
+    inputs = {}
+    if not isinstance(definition.get('inputs', {}), dict):
+        raise RecipeFileError(path, 'inputs must be a table')
+    for key, spec in definition.get('inputs', {}).items():
+        where = 'input {!r}'.format(key)
+        _check_keys(path, where, spec, INPUT_KEYS)
+        value_type = spec.get('type', 'float')
+        if value_type not in VALUE_TYPES:
+            raise RecipeFileError(path, '{} has unknown type {!r}'.format(where, value_type))
+        try:
+            default = VALUE_TYPES[value_type](spec.get('label', key)).convert_from_string(str(spec.get('default', 0)))
+        except ValueError as error:
+            raise RecipeFileError(path, '{} has an invalid default: {}'.format(where, error))
+        inputs[key] = {'type': value_type, 'label': spec.get('label', key), 'default': default}
+
+    def compile_steps(section):
+        if not isinstance(definition.get(section, []), list):
+            raise RecipeFileError(path, '{} must be a list of steps'.format(section))
+        steps = []
+        for index, spec in enumerate(definition.get(section, [])):
+            where = '{}[{}]'.format(section, index)
+            _check_keys(path, where, spec, STEP_KEYS)
+            if 'name' not in spec:
+                raise RecipeFileError(path, '{} has no name'.format(where))
+
+            messages = []
+            valve_states = None
+            if 'open' in spec:
+                unknown = set(_names(path, spec['open'], where + '.open')) - set(valves)
+                if unknown:
+                    raise RecipeFileError(path, '{} opens unknown valves {}'.format(where, sorted(unknown)))
+                valve_states = {valve: valve in spec['open'] for valve in valves}
+                messages.append([VALVE_TOPIC, json.dumps(valve_states)])
+
+            flow = None
+            if 'flow' in spec:
+                flow = _parameter(path, spec['flow'], inputs, where + '.flow')
+                # the payload of a flow taken from an input is filled in by bind
+                messages.append([FLOW_TOPIC, None if isinstance(flow, str) else str(flow)])
+
+            for message in spec.get('messages', []):
+                if not (isinstance(message, list) and len(message) == 2
+                        and all(isinstance(part, str) for part in message)):
+                    raise RecipeFileError(path, '{}.messages must be a list of [topic, payload] pairs'.format(where))
+                messages.append(list(message))
+
+            steps.append({'name': spec['name'],
+                          'duration': _parameter(path, spec.get('duration', 0), inputs, where + '.duration'),
+                          'valves': valve_states or {},
+                          'flow': flow,
+                          'messages': messages})
+        return steps
+
+    return {'version': TEMPLATE_VERSION,
+            'name': definition['name'],
+            'logname': definition.get('logname', 'general'),
+            'command_topic': definition.get('command_topic'),
+            'inputs': inputs,
+            'loops': _parameter(path, definition['loops'], inputs, 'loops'),
+            'setup': compile_steps('setup'),
+            'cycle': compile_steps('cycle'),
+            'teardown': compile_steps('teardown')}
+
+
+def load_template(path: str) -> dict:
+    """Returns the compiled template of a recipe file, using the on-disk cache."""
+    with open(path, 'rb') as file:
+        content = file.read()
+
+    digest = sha256(content).hexdigest()
+    directory, filename = os.path.split(path)
+    cache_path = os.path.join(directory, CACHE_DIRECTORY,
+                              '{}-{}.json'.format(os.path.splitext(filename)[0], digest[:16]))
+
+    try:
+        with open(cache_path) as file:
+            template = json.load(file)
+        if template.get('version') == TEMPLATE_VERSION and template.get('digest') == digest:
+            return template
+    except (OSError, ValueError):
+        pass
+
+    template = compile_definition(path, _parse(path, content))
+    template['digest'] = digest
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temporary_path = cache_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(template, file)
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        pass  # the cache is only an optimization
+
+    return template
+
+
+def bind(template: dict, values: Dict[str, Union[int, float]]) -> Program:
+    """Creates the program of a template for the given input values."""
+    def resolve(value):
+        return float(values[value]) if isinstance(value, str) else value
+
+    def convert(steps):
+        result = []
+        for s in steps:
+            duration = resolve(s['duration'])
+            if duration < 0:
+                raise ValueError('step {!r} has the negative duration {}'.format(s['name'], duration))
+            flow = resolve(s['flow'])
+            messages = tuple((topic, (str(flow) if payload is None else payload).encode())
+                             for topic, payload in s['messages'])
+            result.append(Step(s['name'], duration, tuple(s['valves'].items()), flow, messages))
+        return result
+
+    loops = template['loops']
+    loops = int(values[loops]) if isinstance(loops, str) else int(loops)
+
+    return Program(convert(template['cycle']), loops,
+                   setup=convert(template['setup']), teardown=convert(template['teardown']))
+
+
+class DeclarativeRecipe(AbstractRecipe):
+    """Recipe which runs the program compiled from a recipe file."""
+
+    TEMPLATE = None
+
+    def __init__(self, mqtt_client, signal_interface, **kwargs):
+        template = self.TEMPLATE
+
+        values = {key: spec['default'] for key, spec in template['inputs'].items()}
+        for key in template['inputs']:
+            if key in kwargs:
+                values[key] = kwargs.pop(key)
+
+        super().__init__(mqtt_client, signal_interface, logname=template['logname'],
+                         command_topic=template['command_topic'], **kwargs)
+
+        self._program = bind(template, values)
+
+    @classmethod
+    def inputs(cls) -> Dict[str, AbstractValue]:
+        return {key: VALUE_TYPES[spec['type']](spec['label'], default=spec['default'])
+                for key, spec in cls.TEMPLATE['inputs'].items()}
+
+
+def load(path: str) -> type:
+    """Creates a recipe class from a recipe file and registers it.
+
+    :param path: path of a .toml, .yaml or .yml file
+    :return: the registered recipe class
+    """
+    template = load_template(path)
+    class_name = ''.join(c for c in template['name'].title() if c.isalnum())
+    cls = type(class_name, (DeclarativeRecipe,), {'TEMPLATE': template, '__module__': __name__})
+    return register(template['name'])(cls)
@@ -0,0 +1,850 @@
+"""Execution of the compiled program of a recipe.
+
+RunEngine publishes the steps of a Program on the deadlines of a
+scheduler.Scheduler, follows a controller which times the steps itself
+(see controller.py), pauses while the broker is not reachable and handles
+stops, checkpoints, archives, logs and metrics. AbstractRecipe adds the
+compilation of the program.
+
+The engine is written once as coroutines. __call__ executes them in the
+calling thread with waits which block (scheduler.ThreadWaits), run_async
+awaits them on the running event loop (scheduler.LoopWaits).
+"""
+import asyncio
+import os
+
+from datetime import datetime
+from threading import Event, RLock
+from time import monotonic, time as wall_time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+from urllib.parse import quote
+
+from .actuation import FLOW_STATE_TOPIC, VALVE_STATE_TOPIC, Acknowledger
+from . import controller, runlog
+from .metrics import DURATION_BUCKETS, Metrics
+from .program import Program, Step, namespaced_steps, namespaced_topic, step as compile_step
+from .publisher import Publisher
+from .runlog import RunLogger
+from .scheduler import LoopWaits, Scheduler, ThreadWaits, run_blocking
+from .telemetry import RingBuffer
+
+if TYPE_CHECKING:
+    from .recipe import SignalInterface
+
+# valve steps which are kept as markers for the plots
+STEP_MARKER_CAPACITY = 4096
+
+# longest wait of stop() for a step which is being published, afterwards the safe state is published anyway
+STOP_LOCK_TIMEOUT = 0.05
+
+# cycles between two publishes of the complete state with delta publishing
+RESYNC_INTERVAL = 10
+
+# seconds between two checks of a paused run whether it was stopped
+BROKER_POLL_INTERVAL = 0.1
+
+
+def format_tags(tags: Dict[str, str]) -> str:
+    """Returns the tags as 'key=value, key=value' for the log.
+
+    Keys and values are percent-encoded, so a ',' or '=' in a sweep name
+    or value does not split the tag, see logindex.
+    """
+    return ', '.join('{}={}'.format(quote(str(key), safe=' /:'), quote(str(value), safe=' /:'))
+                     for key, value in tags.items())
+
+
+class RunEngine(object):
+    """Executes the Program which a subclass assigns to self._program, see AbstractRecipe."""
+
+    def __init__(self, mqtt_client, signal_interface: 'SignalInterface', logname='general',
+                 command_topic: str = None, schedule_policy: str = Scheduler.CATCH_UP,
+                 log_queue_size: int = 10000, log_flush_interval: float = 1.0,
+                 delta_publishing: bool = True, resync_interval: int = RESYNC_INTERVAL,
+                 acknowledge: bool = False, acknowledge_timeout: float = 1.0,
+                 metrics_textfile: str = None, metrics_port: int = None,
+                 clock=None, log_directory: str = 'logs', chamber: str = None,
+                 checkpoint=None, start_cycle: int = 0, telemetry=None, archive=None, tags=None,
+                 controller_timed: bool = False, controller_timeout: float = 2.0):
+        """
+        :param mqtt_client: connected paho client or publisher.Publisher, with a Publisher the run
+                            is paused while the broker is not reachable
+        :param signal_interface: receives the progress of the recipe
+        :param logname: suffix of the log file
+        :param command_topic: topic on which a 'stop' message stops the recipe
+        :param schedule_policy: Scheduler.CATCH_UP or Scheduler.SKIP
+        :param log_queue_size: maximum number of log events waiting to be written
+        :param log_flush_interval: seconds between two writes of the log
+        :param delta_publishing: only publish valves and setpoints which changed
+        :param resync_interval: with delta publishing, publish the complete state
+                                every resync_interval cycles, 0 disables it; a command which
+                                is lost without an error is corrected at the next resync, after
+                                a publish error the next cycle publishes the complete state
+        :param acknowledge: wait for the controller to echo every command, the
+                            duration of a step starts at the confirmed actuation
+        :param acknowledge_timeout: seconds to wait for the echo of a command
+        :param metrics_textfile: file to which the metrics are written in the
+                                 Prometheus text format during the run
+        :param metrics_port: port on which the metrics are served over HTTP during the run
+        :param clock: object with time() and sleep(seconds) replacing the monotonic
+                      clock and the waits, e.g. a simulation.VirtualClock
+        :param log_directory: directory of the log file, None disables the log
+        :param chamber: name of the chamber, all topics are moved into its namespace
+                        (see program.namespaced_topic), None uses the topics of a single chamber
+        :param checkpoint: checkpoint.CheckpointFile which is saved at every cycle boundary
+        :param start_cycle: index of the first cycle, a run which does not start with the
+                            first cycle drives the valves to the safe state of the teardown first
+        :param telemetry: telemetry.Telemetry with the sensor channels which the recipe can read,
+                          their latest values are added to the metrics
+        :param archive: archive.ArchiveWriter which records every executed step
+        :param tags: key -> value written to the log after the first line, e.g. the coordinates of a sweep
+        :param controller_timed: upload the whole program to the controller, which times the steps itself,
+                                 and only follow its progress events, see controller.py
+        :param controller_timeout: seconds the controller may report later than planned before the recipe
+                                   is stopped and the teardown is published from here
+        """
+        self._stop_process = Event()
+        self._interrupt_event = Event()
+        self._stop_callbacks = []
+        # serializes the steps and the safe state published by stop()
+        self._publish_lock = RLock()
+        self._running = False
+        self._tearing_down = False
+        self._safe_state = None
+        # why the run failed, None while it did not fail
+        self._failure = None
+
+        self._mqtt_client = mqtt_client
+        self._publisher = mqtt_client if isinstance(mqtt_client, Publisher) else None
+        # connections of the publisher when the last step was executed
+        self._connections = 0
+        self._broker_lost = False
+        # valves and flow commanded by the run, published again after a reconnect
+        self._commanded_valves = {}
+        self._commanded_flow = None
+        self._signal_interface = signal_interface
+        self._chamber = chamber
+
+        # subscribed while the recipe runs, so recipes can be built ahead of time
+        self._command_topic = None
+        if command_topic is not None:
+            self._command_topic = namespaced_topic(command_topic, chamber)
+
+        self._clock = clock
+        if clock is None:
+            self._time = monotonic
+            self._waits = ThreadWaits(self._interrupt_event.wait)
+        else:
+            self._time = clock.time
+
+            def wait(seconds):
+                clock.sleep(seconds)
+                return self._interrupt_event.is_set()
+            self._waits = ThreadWaits(wait, clock.sleep)
+
+        self._logname = logname
+        self._log_directory = log_directory
+        # the file name is taken again when the run begins, a recipe may be built long before
+        self._logger = RunLogger(self._log_path(), queue_size=log_queue_size, flush_interval=log_flush_interval,
+                                 clock=self._time)
+        self._cycle = None
+
+        self._scheduler = Scheduler(self._waits.wait, policy=schedule_policy, clock=self._time)
+
+        self._program = None
+        self._checkpoint = checkpoint
+        self._start_cycle = start_cycle
+        self._delta_publishing = delta_publishing
+        self._resync_interval = resync_interval
+        # set by a publish error, the next cycle publishes the complete state
+        self._resync_pending = False
+
+        self._acknowledger = None
+        if acknowledge:
+            self._acknowledger = Acknowledger(mqtt_client,
+                                              valve_state_topic=namespaced_topic(VALVE_STATE_TOPIC, chamber),
+                                              flow_state_topic=namespaced_topic(FLOW_STATE_TOPIC, chamber),
+                                              timeout=acknowledge_timeout, clock=self._time)
+
+        self._controller = None
+        if controller_timed:
+            self._controller = controller.ProgramChannel(mqtt_client, chamber)
+        self._controller_timeout = controller_timeout
+
+        self._telemetry = telemetry
+        self._archive = archive
+        self._tags = dict(tags or {})
+        # wall time and index into _step_names of every step which published commands
+        self._step_markers = RingBuffer(STEP_MARKER_CAPACITY)
+        self._step_names = []
+        self._step_name_indices = {}
+
+        self._metrics_textfile = metrics_textfile
+        self._metrics_port = metrics_port
+        # started by _begin, stopped by _end
+        self._textfile_stop_event = None
+        self._metrics_server = None
+        self._init_metrics()
+
+    def _init_metrics(self):
+        self._metrics = metrics = Metrics()
+        self._publish_latency = metrics.histogram('aldrun_publish_seconds', 'Time spent in publish calls')
+        self._stop_latency = metrics.histogram('aldrun_stop_seconds',
+                                               'Time from the stop request to the published safe state')
+        self._cycle_duration = metrics.histogram('aldrun_cycle_seconds', 'Duration of the cycles',
+                                                 buckets=DURATION_BUCKETS)
+        self._broker_pause = metrics.histogram('aldrun_broker_pause_seconds',
+                                               'Pauses of the run while the broker was not reachable',
+                                               buckets=DURATION_BUCKETS)
+        metrics.gauge('aldrun_cycle', 'Index of the current cycle', lambda: self._cycle or 0)
+        metrics.gauge('aldrun_log_queue_depth', 'Log events waiting to be written',
+                      lambda: self._logger.queue_depth)
+        metrics.gauge('aldrun_log_dropped', 'Log events dropped because the queue was full',
+                      lambda: self._logger.dropped)
+        # paho keeps the messages which are not yet sent in a private deque
+        metrics.gauge('aldrun_mqtt_outbound_queue_depth', 'Messages waiting to be sent by the MQTT client',
+                      lambda: len(getattr(self._mqtt_client, '_out_packet', ())))
+        if self._publisher is not None:
+            self._publisher.register_metrics(metrics)
+        if self._telemetry is not None:
+            self._telemetry.register_metrics(metrics)
+
+    @property
+    def chamber(self) -> str:
+        return self._chamber
+
+    @property
+    def stopped(self) -> bool:
+        """True if the recipe was stopped before it completed."""
+        return self._stop_process.is_set()
+
+    @property
+    def failed(self) -> Optional[str]:
+        """Why the run failed, e.g. an exception or a silent controller, None if it did not fail."""
+        return self._failure
+
+    @property
+    def tags(self) -> Dict[str, str]:
+        return dict(self._tags)
+
+    @property
+    def telemetry(self):
+        """The telemetry.Telemetry of the sensors or None."""
+        return self._telemetry
+
+    @property
+    def step_markers(self) -> RingBuffer:
+        """Wall time of every step which published commands, the values are indices into step_names."""
+        return self._step_markers
+
+    @property
+    def step_names(self) -> List[str]:
+        return self._step_names
+
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+
+    @property
+    def archive(self):
+        """The archive.ArchiveWriter of the run or None."""
+        return self._archive
+
+    @property
+    def checkpoint(self):
+        """The checkpoint.CheckpointFile of the run or None."""
+        return self._checkpoint
+
+    def attach(self, archive=None, checkpoint=None) -> None:
+        """Sets the archive and the checkpoint of a recipe which was built ahead of its start.
+
+        :param archive: archive.ArchiveWriter, None keeps the current one
+        :param checkpoint: checkpoint.CheckpointFile, None keeps the current one
+        :raises RuntimeError: if the recipe is running
+        """
+        if self._running:
+            raise RuntimeError('the recipe is already running')
+        if archive is not None:
+            self._archive = archive
+        if checkpoint is not None:
+            self._checkpoint = checkpoint
+
+    def _log_path(self) -> Optional[str]:
+        """Returns the log file of a run which starts now, None without log directory."""
+        if self._log_directory is None:
+            return None
+        logname = self._logname if self._chamber is None else '{}-{}'.format(self._chamber, self._logname)
+        return os.path.join(self._log_directory, '{:%Y-%m-%dT%H-%M}-{}.log'.format(datetime.now(), logname))
+
+    def _with_lateness_metrics(self, steps):
+        metrics = self._metrics
+        return tuple((step, metrics.histogram('aldrun_step_lateness_seconds', 'Delay of the step start',
+                                              step=step.name))
+                     for step in namespaced_steps(steps, self._chamber))
+
+    def __call__(self):
+        run_blocking(self._execute_run())
+
+    async def run_async(self):
+        """Runs the recipe as a coroutine on the running event loop instead of a thread.
+
+        Waits are cancellable sleeps. Cancelling the task stops the recipe like
+        stop(), the teardown steps are still executed before CancelledError is
+        raised. Blocking calls, e.g. the confirmation of acknowledged commands,
+        run in the default executor.
+        """
+        loop = asyncio.get_running_loop()
+        interrupted = asyncio.Event()
+        if self._interrupt_event.is_set():
+            interrupted.set()
+
+        def interrupt():
+            loop.call_soon_threadsafe(interrupted.set)
+
+        self._waits = waits = LoopWaits(interrupted, self.stop, self._clock)
+        self._scheduler = Scheduler(waits.wait, policy=self._scheduler.policy, clock=self._time)
+        self._stop_callbacks.append(interrupt)
+        flush_task = loop.create_task(self._flush_log_periodically())
+        try:
+            await self._execute_run(start_logger=False, before_end=flush_task.cancel)
+        finally:
+            self._stop_callbacks.remove(interrupt)
+        if waits.cancelled:
+            raise asyncio.CancelledError()
+
+    async def _execute_run(self, start_logger: bool = True, before_end: Optional[Callable[[], None]] = None):
+        """Executes the run with the waits of __call__ or run_async.
+
+        :param start_logger: write the log from its own thread, otherwise the caller flushes it
+        :param before_end: called after the last step, before the log and the archive are closed
+        """
+        try:
+            # _end also undoes a _begin which failed halfway, e.g. on a metrics port in use
+            self._begin(start_logger)
+            self._scheduler.start()
+            if self._controller is not None:
+                await self._run_on_controller()
+            else:
+                await self._run()
+            self._log_summary()
+        except Exception as error:
+            self._abort(error)
+            raise
+        finally:
+            if before_end is not None:
+                before_end()
+            await self._waits.call(self._end)
+            # also after a failure, the run is over
+            self._signal_interface.emit_finished()
+
+    async def _flush_log_periodically(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self._logger.flush_interval)
+            await loop.run_in_executor(None, self._logger.flush)
+            if self._archive is not None:
+                await loop.run_in_executor(None, self._archive.flush)
+
+    def _begin(self, start_logger: bool = True):
+        with self._publish_lock:
+            # a stop before the start is kept, the run then only executes its teardown
+            self._tearing_down = False
+            safe_state = namespaced_steps([self._program.safe_state()], self._chamber)[0]
+            if self._controller is not None:
+                # the controller has to end the program before the safe state is commanded
+                safe_state = safe_state._replace(messages=(self._controller.stop_message,) + safe_state.messages)
+            self._safe_state = safe_state
+            self._commanded_valves = {}
+            self._commanded_flow = None
+            self._resync_pending = False
+            self._running = True
+        if self._publisher is not None:
+            self._connections = self._publisher.connections
+        self._broker_lost = False
+        if self._command_topic is not None:
+            self._mqtt_client.subscribe(self._command_topic)
+            self._mqtt_client.message_callback_add(self._command_topic, self._cmd)
+        if self._acknowledger is not None:
+            self._acknowledger.open()
+        if self._controller is not None:
+            self._controller.open()
+        self._logger.path = self._log_path()
+        if start_logger:
+            self._logger.start()
+        else:
+            self._logger.open()
+        # first line of the log, identifies the run for logindex
+        self._logger.log('run of {} on chamber {}'.format(self._logname, self._chamber or 'default'))
+        if self._tags:
+            self._logger.log('tags: {}'.format(format_tags(self._tags)))
+        if self._archive is not None:
+            wall_offset = wall_time() - self._time()
+            if start_logger:
+                self._archive.start(self._program, wall_offset)
+            else:
+                self._archive.open(self._program, wall_offset)
+        self._signal_interface.emit_started()
+        if self._metrics_textfile is not None:
+            self._textfile_stop_event = self._metrics.write_textfile_periodically(self._metrics_textfile)
+        if self._metrics_port is not None:
+            self._metrics_server = self._metrics.serve(self._metrics_port)
+
+    def _end(self):
+        with self._publish_lock:
+            self._running = False
+        if self._command_topic is not None:
+            self._mqtt_client.message_callback_remove(self._command_topic)
+            self._mqtt_client.unsubscribe(self._command_topic)
+        if self._acknowledger is not None:
+            self._acknowledger.close()
+        if self._controller is not None:
+            self._controller.close()
+        if self._textfile_stop_event is not None:
+            self._textfile_stop_event.set()
+            self._textfile_stop_event = None
+        if self._metrics_server is not None:
+            self._metrics_server.shutdown()
+            self._metrics_server.server_close()
+            self._metrics_server = None
+        if self._archive is not None:
+            self._archive.close()
+            if self._archive.error is not None:
+                self._logger.log('archive not written: {}'.format(self._archive.error), kind=runlog.EVENT)
+        if self._checkpoint is not None:
+            try:
+                if self.stopped and self._failure is None:
+                    # stopped by the operator, not offered for a resume, see checkpoint.pending
+                    self._checkpoint.mark_stopped()
+                self._checkpoint.close()
+            except OSError as error:
+                self._logger.log('checkpoint not saved: {}'.format(error), kind=runlog.EVENT)
+        self._logger.stop()
+        if self._logger.error is not None:
+            self._signal_interface.emit_status_message('log not written: {}, {} events lost'.format(
+                self._logger.error, self._logger.lost))
+
+    def stop(self):
+        """Stops the recipe and publishes the safe state of the teardown at once.
+
+        The safe state is published from the calling thread, e.g. the GUI or
+        the MQTT network thread, without waiting for the recipe to reach the
+        end of its step. A step which is being published is completed first,
+        but for at most STOP_LOCK_TIMEOUT; steps after the stop are not
+        published. The teardown still runs afterwards. A recipe which is
+        stopped before it runs, e.g. a prepared job, only executes its
+        teardown when it is started.
+        """
+        requested = monotonic()
+        locked = self._publish_lock.acquire(timeout=STOP_LOCK_TIMEOUT)
+        try:
+            if self._stop_process.is_set() and self._running:
+                return
+            self._stop_process.set()
+            published = self._running and not self._tearing_down
+            if published:
+                self._publish_safe_state()
+        finally:
+            if locked:
+                self._publish_lock.release()
+        latency = monotonic() - requested
+
+        self._interrupt_event.set()
+        if self._acknowledger is not None:
+            self._acknowledger.cancel()
+        for callback in list(self._stop_callbacks):
+            callback()
+        if published:
+            self._stop_latency.observe(latency)
+            self._log('recipe stopped, safe state published after {:.2f} ms{}'.format(
+                latency * 1e3, '' if locked else ' without waiting for the current step'), runlog.STOP)
+        else:
+            self._log('recipe stopped', runlog.STOP)
+        self._signal_interface.emit_stopped()
+
+    def _abort(self, error: Exception) -> None:
+        """Publishes the safe state after the run failed, the teardown is not executed."""
+        self._failure = repr(error)
+        result = 'safe state published'
+        with self._publish_lock:
+            self._stop_process.set()
+            if self._running:
+                try:
+                    self._publish_safe_state()
+                except Exception as publish_error:
+                    result = 'safe state not published: {!r}'.format(publish_error)
+        self._interrupt_event.set()
+        self._log('run failed: {!r}, {}'.format(error, result), runlog.EVENT)
+
+    def _publish_safe_state(self) -> None:
+        step = self._safe_state
+        if step.messages:
+            self._mark(step.name)
+        publish = self._mqtt_client.publish
+        for topic, payload in step.messages:
+            publish(topic, payload)
+
+    def _cmd(self, client, user_data, message):
+        if message.payload == b'stop':
+            self.stop()
+
+    def _log(self, text, kind=None):
+        self._logger.log(text, self._cycle, kind)
+        self._signal_interface.emit_status_message(text)
+
+    def _log_summary(self):
+        for line in self._metrics.summary():
+            self._log(line)
+        if self._acknowledger is not None:
+            self._log_latencies()
+
+    def _log_latencies(self):
+        for key, (count, mean, median, p95, maximum) in self._acknowledger.latencies().items():
+            self._log('actuation latency {}: n={} mean={:.1f} ms median={:.1f} ms p95={:.1f} ms max={:.1f} ms'.format(
+                key, count, mean * 1e3, median * 1e3, p95 * 1e3, maximum * 1e3))
+        self._log('actuation timeouts: {}'.format(self._acknowledger.timeouts))
+
+    @property
+    def program(self) -> Program:
+        return self._program
+
+    def _publish(self, step: Step) -> None:
+        with self._publish_lock:
+            # after a stop the safe state is published, only the teardown may follow
+            if self._stop_process.is_set() and not self._tearing_down:
+                return
+            self._record(step)
+            if self._publisher is not None:
+                self._commanded_valves.update(step.valves)
+                if step.flow is not None:
+                    self._commanded_flow = step.flow
+            publish = self._mqtt_client.publish
+            observe = self._publish_latency.observe
+            for topic, payload in step.messages:
+                start = monotonic()
+                rc = publish(topic, payload).rc
+                observe(monotonic() - start)
+                if rc:
+                    self._resync_pending = True
+                    self._log('command to {} not published (rc {})'.format(topic, rc), runlog.EVENT)
+
+    def _record(self, step: Step) -> None:
+        """Keeps the marker and the archive row of an executed step."""
+        if step.messages:
+            self._mark(step.name)
+        if self._archive is not None:
+            self._archive.record(self._time(), step, self._cycle)
+
+    def _mark(self, name: str) -> None:
+        index = self._step_name_indices.get(name)
+        if index is None:
+            index = self._step_name_indices[name] = len(self._step_names)
+            self._step_names.append(name)
+        self._step_markers.append(wall_time(), index)
+
+    async def _check_broker(self) -> None:
+        """Pauses the run while the broker is not reachable and resyncs the state after a reconnect."""
+        publisher = self._publisher
+        # after a stop the commands are queued until the broker is reachable again
+        if not publisher.connected and not self._stop_process.is_set():
+            self._log('broker disconnected, run paused', runlog.EVENT)
+            paused = monotonic()
+            while not await self._waits.call(publisher.wait_connected, BROKER_POLL_INTERVAL):
+                if self._stop_process.is_set():
+                    return
+            self._broker_paused(monotonic() - paused)
+        if publisher.connections != self._connections:
+            self._reconnected()
+
+    def _broker_paused(self, duration: float) -> None:
+        self._broker_pause.observe(duration)
+        self._log('broker reconnected, run continues after a pause of {:.1f} s'.format(duration), runlog.EVENT)
+
+    def _reconnected(self) -> None:
+        """Shifts the timeline to now and publishes the commanded valves and flow again.
+
+        The queued commands are sent by the publisher after the reconnect,
+        but commands which were written to the socket just before the
+        connection was lost may not have reached the broker.
+        """
+        self._connections = self._publisher.connections
+        self._scheduler.delay_to(self._time())
+        with self._publish_lock:
+            if self._stop_process.is_set() and not self._tearing_down:
+                return
+            if not self._commanded_valves and self._commanded_flow is None:
+                return
+            state = compile_step('Resync', 0.0, self._commanded_valves or None, self._commanded_flow)
+            for topic, payload in namespaced_steps([state], self._chamber)[0].messages:
+                self._mqtt_client.publish(topic, payload)
+
+    async def _execute(self, step: Step) -> None:
+        if self._publisher is not None:
+            await self._check_broker()
+        self._log(step.name, runlog.STEP)
+
+        acknowledger = self._acknowledger
+        if acknowledger is None or not step.messages:
+            self._publish(step)
+            return
+
+        token = acknowledger.expect(step)
+        self._publish(step)
+        self._confirmed(step, await self._waits.call(acknowledger.confirm, token))
+
+    def _confirmed(self, step: Step, confirmed_at: float) -> None:
+        if confirmed_at is None:
+            if not self._stop_process.is_set():
+                self._log('actuation of {} not confirmed'.format(step.name), runlog.EVENT)
+        else:
+            self._scheduler.delay_to(confirmed_at)
+
+    async def _run(self):
+        run = self._scheduler.run
+        execute = self._execute
+
+        for step, lateness in self._steps():
+            lateness.observe(await run(execute, step.duration, step))
+
+    def _steps(self):
+        """Yields the steps of the run with their lateness histogram.
+
+        Tracks the cycles, emits the progress, saves the checkpoints and ends
+        the cycles as soon as the recipe is stopped. The teardown steps are
+        always yielded.
+        """
+        program = self._program
+        start_cycle = self._start_cycle
+        if not 0 <= start_cycle < program.loops:
+            raise ValueError('start cycle {} is not within the {} cycles'.format(start_cycle + 1, program.loops))
+
+        if self._delta_publishing:
+            setup, first_cycle, cycle = program.deltas()
+        else:
+            setup, first_cycle, cycle = program.setup, program.cycle, program.cycle
+        setup = self._with_lateness_metrics(setup)
+        first_cycle = self._with_lateness_metrics(first_cycle)
+        cycle = self._with_lateness_metrics(cycle)
+        full_cycle = self._with_lateness_metrics(program.cycle)
+        teardown = self._with_lateness_metrics(program.teardown)
+        resync_interval = self._resync_interval
+        observe_cycle_duration = self._cycle_duration.observe
+        time = self._time
+        update_timeline = self._signal_interface.emit_update_timeline
+        checkpoint = self._checkpoint
+
+        if start_cycle:
+            self._log('resuming with CYCLE {}, driving valves to safe state'.format(start_cycle + 1), runlog.RESUME)
+            self._tearing_down = True
+            for step, lateness in teardown:
+                yield step, lateness
+            self._tearing_down = False
+
+        # planned offset of the current step from the start of the run
+        duration = program.duration - start_cycle * program.cycle_duration
+        start = time()
+        planned = 0.0
+
+        for step, lateness in setup:
+            update_timeline(duration - planned, time() - start - planned)
+            planned += step.duration
+            yield step, lateness
+
+        cycle_start = None
+        for loop_number in range(start_cycle, program.loops):
+            if self._stop_process.is_set():
+                break
+            if checkpoint is not None:
+                self._save_checkpoint(loop_number)
+            now = self._time()
+            if cycle_start is not None:
+                observe_cycle_duration(now - cycle_start)
+            cycle_start = now
+
+            self._cycle = loop_number
+            self._signal_interface.emit_update_process_value(loop_number)
+            self._log('starting CYCLE {}'.format(loop_number + 1), runlog.CYCLE)
+            if self._resync_pending or resync_interval and loop_number % resync_interval == 0:
+                self._resync_pending = False
+                steps = full_cycle
+            elif loop_number == start_cycle:
+                steps = first_cycle
+            else:
+                steps = cycle
+            for step, lateness in steps:
+                update_timeline(duration - planned, time() - start - planned)
+                planned += step.duration
+                yield step, lateness
+                if self._stop_process.is_set():
+                    break
+        else:
+            if cycle_start is not None:
+                observe_cycle_duration(self._time() - cycle_start)
+            if checkpoint is not None:
+                checkpoint.remove()
+
+        self._signal_interface.emit_update_process_value(program.loops)
+
+        if self._stop_process.is_set():
+            # the remaining cycles are skipped, the drift is measured from here on
+            planned = duration - program.teardown_duration
+            start = time() - planned
+        self._tearing_down = True
+        for step, lateness in teardown:
+            update_timeline(duration - planned, time() - start - planned)
+            planned += step.duration
+            yield step, lateness
+
+    async def _run_on_controller(self):
+        """Uploads the program and follows the progress events of the controller.
+
+        The controller executes the teardown itself. If it rejects the
+        program, reports an error or is silent for longer than the controller
+        timeout after the planned end of the current step, the recipe is
+        stopped and the teardown is published from here.
+        """
+        program = self._program
+        start_cycle = self._start_cycle
+        if not 0 <= start_cycle < program.loops:
+            raise ValueError('start cycle {} is not within the {} cycles'.format(start_cycle + 1, program.loops))
+
+        phases = {controller.RESUME: self._with_lateness_metrics(program.teardown),
+                  controller.SETUP: self._with_lateness_metrics(program.setup),
+                  controller.CYCLE: self._with_lateness_metrics(program.cycle),
+                  controller.TEARDOWN: self._with_lateness_metrics(program.teardown)}
+
+        def offsets(steps):
+            result = [0.0]
+            for step in steps:
+                result.append(result[-1] + step.duration)
+            return result
+
+        # planned start of every step within its phase and of the phases in controller time
+        step_offsets = {phase: offsets(steps) for phase, steps in
+                        ((controller.RESUME, program.teardown), (controller.SETUP, program.setup),
+                         (controller.CYCLE, program.cycle), (controller.TEARDOWN, program.teardown))}
+        setup_start = program.teardown_duration if start_cycle else 0.0
+        cycles_start = setup_start + program.setup_duration
+        teardown_start = cycles_start + (program.loops - start_cycle) * program.cycle_duration
+        duration = teardown_start + program.teardown_duration
+
+        timeout = self._controller_timeout
+        update_timeline = self._signal_interface.emit_update_timeline
+        observe_cycle_duration = self._cycle_duration.observe
+        checkpoint = self._checkpoint
+        cycle_start = None
+
+        if self._stop_process.is_set():
+            # stopped before the start, nothing is uploaded
+            await self._teardown_locally()
+            return
+
+        if start_cycle:
+            self._log('resuming with CYCLE {}, driving valves to safe state'.format(start_cycle + 1), runlog.RESUME)
+        run_id = self._controller.upload(program, start_cycle)
+        self._log('program {} uploaded to the controller'.format(run_id), runlog.EVENT)
+
+        wait = timeout
+        failure = None
+        while True:
+            event = await self._waits.call(self._controller.next_event, wait)
+            if event is None:
+                if self._controller_unreachable():
+                    continue
+                failure = 'controller did not report for {:.1f} s'.format(wait)
+                break
+            if self._broker_lost:
+                self._controller_unreachable()
+            if event.event == controller.ACCEPTED:
+                self._signal_interface.emit_update_process_value(start_cycle)
+                continue
+            if event.event in (controller.DONE, controller.STOPPED):
+                if event.event == controller.DONE and checkpoint is not None:
+                    checkpoint.remove()
+                break
+            if event.event != controller.STEP:
+                failure = 'controller error: {}'.format(event.message)
+                break
+
+            try:
+                step, lateness = phases[event.phase][event.index]
+                offset = step_offsets[event.phase][event.index]
+            except (KeyError, IndexError, TypeError):
+                failure = 'controller reported unknown step {} {}'.format(event.phase, event.index)
+                break
+
+            if event.phase == controller.SETUP:
+                offset += setup_start
+            elif event.phase == controller.CYCLE:
+                offset += cycles_start + (event.cycle - start_cycle) * program.cycle_duration
+                if event.index == 0:
+                    if checkpoint is not None:
+                        self._save_checkpoint(event.cycle)
+                    if cycle_start is not None:
+                        observe_cycle_duration(event.time - cycle_start)
+                    cycle_start = event.time
+                    self._cycle = event.cycle
+                    self._signal_interface.emit_update_process_value(event.cycle)
+                    self._log('starting CYCLE {}'.format(event.cycle + 1), runlog.CYCLE)
+            elif event.phase == controller.TEARDOWN:
+                if event.index == 0:
+                    if cycle_start is not None and not self._stop_process.is_set():
+                        observe_cycle_duration(event.time - cycle_start)
+                    self._signal_interface.emit_update_process_value(program.loops)
+                    if self._stop_process.is_set():
+                        # the remaining cycles are skipped, the drift is measured from here on
+                        teardown_start = event.time
+                        duration = teardown_start + program.teardown_duration
+                offset += teardown_start
+
+            lateness.observe(event.time - offset)
+            self._log(step.name, runlog.STEP)
+            self._record(step)
+            update_timeline(duration - offset, event.time - offset)
+            wait = step.duration + timeout
+
+        if failure is None:
+            return
+        self._failure = failure
+        self._log(failure, runlog.EVENT)
+        self.stop()
+        await self._teardown_locally()
+
+    async def _teardown_locally(self) -> None:
+        """Publishes the teardown from here instead of the controller."""
+        self._tearing_down = True
+        # the waits of the run are interrupted by the stop, the teardown keeps the durations of its steps
+        scheduler = Scheduler(self._waits.sleep, clock=self._time)
+        scheduler.start()
+        for step, lateness in self._with_lateness_metrics(self._program.teardown):
+            lateness.observe(await scheduler.run(self._execute, step.duration, step))
+
+    def _controller_unreachable(self) -> bool:
+        """True if the events of the controller may have been missed because the broker was not reachable.
+
+        The controller continues the program on its own, the recipe keeps
+        following it until the broker is reachable again.
+        """
+        publisher = self._publisher
+        if publisher is None or self._stop_process.is_set():
+            return False
+        if not publisher.connected:
+            if not self._broker_lost:
+                self._broker_lost = True
+                self._log('broker disconnected, the controller continues the program', runlog.EVENT)
+            return True
+        if publisher.connections != self._connections:
+            self._connections = publisher.connections
+            self._broker_lost = False
+            self._log('broker reconnected, events of the controller may be missing', runlog.EVENT)
+            return True
+        return False
+
+    def _save_checkpoint(self, cycle):
+        try:
+            self._checkpoint.save(cycle, self._program.loops)
+        except Exception as error:
+            # the run continues without checkpoint
+            self._log('checkpoint not saved: {}'.format(error), runlog.EVENT)
+
+    def max_process_value(self):
+        return self._program.loops
@@ -0,0 +1,277 @@
+"""In-process stand-ins for the MQTT broker and the valve controller.
+
+FakeMQTTClient implements the part of the paho client which the recipes
+use and delivers published messages synchronously to the subscribed
+callbacks. FakeController subscribes to the command topics like the real
+controller and echoes the applied state, so recipes can be run and tested
+without broker and hardware. FakeProgramController additionally executes
+uploaded programs like a controller with hardware timing, see controller.py.
+"""
+import json
+
+from collections import namedtuple
+from threading import Event, Lock, Thread, Timer
+from time import monotonic, sleep
+from typing import Callable, Optional
+
+from . import controller
+from .actuation import FLOW_STATE_TOPIC, VALVE_STATE_TOPIC
+from .program import FLOW_TOPIC, VALVE_TOPIC, Program, Step, namespaced_topic
+
+FakeMessage = namedtuple('FakeMessage', ['topic', 'payload', 'qos', 'retain'])
+FakeMessageInfo = namedtuple('FakeMessageInfo', ['rc', 'mid'])
+Publication = namedtuple('Publication', ['time', 'topic', 'payload'])
+
+
+def topic_matches(subscription: str, topic: str) -> bool:
+    """Returns True if the topic matches the subscription, supporting + and # wildcards."""
+    subscription_levels = subscription.split('/')
+    topic_levels = topic.split('/')
+    for index, level in enumerate(subscription_levels):
+        if level == '#':
+            return True
+        if index >= len(topic_levels) or level not in ('+', topic_levels[index]):
+            return False
+    return len(subscription_levels) == len(topic_levels)
+
+
+class FakeMQTTClient(object):
+    """Records every publish and delivers it to matching callbacks.
+
+    set_connected simulates a broker outage: while disconnected, publish
+    fails with MQTT_ERR_NO_CONN like paho does and nothing is recorded.
+    """
+
+    def __init__(self, clock: Callable[[], float] = monotonic) -> None:
+        self._clock = clock
+        self._callbacks = {}
+        self._subscriptions = set()
+        self._mid = 0
+        self._lock = Lock()
+        self._connected = True
+        self.on_message = None
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_publish = None
+        self.published = []
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def set_connected(self, connected: bool) -> None:
+        """Breaks or restores the connection and calls on_disconnect or on_connect."""
+        if connected == self._connected:
+            return
+        self._connected = connected
+        if not connected:
+            # a new session without subscriptions, like with clean_session
+            self._subscriptions.clear()
+            if self.on_disconnect is not None:
+                self.on_disconnect(self, None, 1)
+        elif self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False) -> FakeMessageInfo:
+        if isinstance(payload, str):
+            payload = payload.encode()
+        elif payload is None:
+            payload = b''
+
+        with self._lock:
+            if not self._connected:
+                return FakeMessageInfo(4, 0)
+            self._mid += 1
+            mid = self._mid
+            self.published.append(Publication(self._clock(), topic, payload))
+
+        message = FakeMessage(topic, payload, qos, retain)
+        delivered = False
+        for subscription, callback in list(self._callbacks.items()):
+            if topic_matches(subscription, topic):
+                callback(self, None, message)
+                delivered = True
+        if not delivered and self.on_message is not None:
+            if any(topic_matches(subscription, topic) for subscription in self._subscriptions):
+                self.on_message(self, None, message)
+
+        if self.on_publish is not None:
+            self.on_publish(self, None, mid)
+        return FakeMessageInfo(0, mid)
+
+    def subscribe(self, topic: str, qos: int = 0):
+        self._subscriptions.add(topic)
+        return 0, self._mid
+
+    def unsubscribe(self, topic: str):
+        self._subscriptions.discard(topic)
+        return 0, self._mid
+
+    def message_callback_add(self, subscription: str, callback: Callable) -> None:
+        self._callbacks[subscription] = callback
+
+    def message_callback_remove(self, subscription: str) -> None:
+        self._callbacks.pop(subscription, None)
+
+    def loop_start(self) -> None:
+        pass
+
+    def loop_stop(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+
+class FakeController(object):
+    """Applies valve and flow commands and echoes the new state.
+
+    :param client: client the controller listens on, usually a FakeMQTTClient
+    :param latency: seconds between command and echo, 0 echoes synchronously
+    """
+
+    def __init__(self, client, latency: float = 0.0,
+                 valve_topic: str = VALVE_TOPIC, flow_topic: str = FLOW_TOPIC,
+                 valve_state_topic: str = VALVE_STATE_TOPIC, flow_state_topic: str = FLOW_STATE_TOPIC) -> None:
+        self._client = client
+        self._latency = latency
+        self._valve_topic = valve_topic
+        self._flow_topic = flow_topic
+        self._valve_state_topic = valve_state_topic
+        self._flow_state_topic = flow_state_topic
+        self.valves = {}
+        self.flow = 0.0
+
+        client.subscribe(valve_topic)
+        client.message_callback_add(valve_topic, self._on_valves)
+        client.subscribe(flow_topic)
+        client.message_callback_add(flow_topic, self._on_flow)
+
+    def _echo(self, topic: str, payload: str) -> None:
+        if self._latency > 0:
+            Timer(self._latency, self._client.publish, (topic, payload)).start()
+        else:
+            self._client.publish(topic, payload)
+
+    def _on_valves(self, client, user_data, message) -> None:
+        self.valves.update(json.loads(message.payload))
+        self._echo(self._valve_state_topic, json.dumps(self.valves))
+
+    def _on_flow(self, client, user_data, message) -> None:
+        self.flow = float(message.payload)
+        self._echo(self._flow_state_topic, str(self.flow))
+
+
+class FakeProgramController(FakeController):
+    """Reference implementation of the program execution of the controller.
+
+    Besides the single commands of FakeController, the controller executes
+    uploaded programs in a thread against absolute deadlines of its clock,
+    applies their steps and reports them on the event topic. A stop command
+    skips the remaining cycles, the teardown is always executed. Other
+    messages of the steps, e.g. ald/io/closeall, are kept in messages.
+
+    :param client: client the controller listens on, usually a FakeMQTTClient
+    :param chamber: chamber of the controller, its topics are moved into the namespace of the chamber
+    """
+
+    def __init__(self, client, chamber: Optional[str] = None) -> None:
+        topic = namespaced_topic
+        super().__init__(client, valve_topic=topic(VALVE_TOPIC, chamber), flow_topic=topic(FLOW_TOPIC, chamber),
+                         valve_state_topic=topic(VALVE_STATE_TOPIC, chamber),
+                         flow_state_topic=topic(FLOW_STATE_TOPIC, chamber))
+        self._event_topic = topic(controller.PROGRAM_EVENT_TOPIC, chamber)
+        self._stop_event = Event()
+        self._thread = None
+        self.messages = []
+        # (controller time, step name) of all executed steps of the last program
+        self.executed = []
+
+        program_topic = topic(controller.PROGRAM_TOPIC, chamber)
+        command_topic = topic(controller.PROGRAM_COMMAND_TOPIC, chamber)
+        client.subscribe(program_topic)
+        client.message_callback_add(program_topic, self._on_program)
+        client.subscribe(command_topic)
+        client.message_callback_add(command_topic, self._on_command)
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _report(self, run_id: str, event: str, **values) -> None:
+        self._client.publish(self._event_topic, controller.encode_event(run_id, event, **values))
+
+    def _on_program(self, client, user_data, message) -> None:
+        try:
+            run_id, start_cycle, program = controller.decode_program(message.payload)
+        except ValueError as error:
+            self._report('', controller.ERROR, message=str(error))
+            return
+        if self.busy:
+            self._report(run_id, controller.ERROR, message='a program is running')
+            return
+        self._stop_event.clear()
+        self._thread = Thread(target=self._execute, args=(run_id, start_cycle, program),
+                              name='fake-controller', daemon=True)
+        self._thread.start()
+
+    def _on_command(self, client, user_data, message) -> None:
+        if message.payload == b'stop':
+            self._stop_event.set()
+
+    def _apply(self, step: Step) -> None:
+        for topic, payload in step.messages:
+            if topic == self._valve_topic:
+                self.valves.update(json.loads(payload))
+                self._echo(self._valve_state_topic, json.dumps(self.valves))
+            elif topic == self._flow_topic:
+                self.flow = float(payload)
+                self._echo(self._flow_state_topic, str(self.flow))
+            else:
+                self.messages.append((topic, payload))
+
+    def _execute(self, run_id: str, start_cycle: int, program: Program) -> None:
+        self._report(run_id, controller.ACCEPTED)
+        self.executed = []
+        start = deadline = monotonic()
+
+        def wait_until_deadline(interruptible):
+            """Returns False if the wait was interrupted by a stop command."""
+            remaining = deadline - monotonic()
+            if interruptible:
+                return not self._stop_event.wait(max(remaining, 0.0))
+            if remaining > 0:
+                sleep(remaining)
+            return True
+
+        def run(phase, steps, cycle=None, interruptible=True):
+            nonlocal deadline
+            for index, step in enumerate(steps):
+                if not wait_until_deadline(interruptible):
+                    return False
+                now = monotonic()
+                self._apply(step)
+                self.executed.append((now - start, step.name))
+                self._report(run_id, controller.STEP, phase=phase, cycle=cycle, index=index, time=now - start)
+                deadline += step.duration
+            return True
+
+        completed = True
+        if start_cycle:
+            run(controller.RESUME, program.teardown, interruptible=False)
+        if run(controller.SETUP, program.setup):
+            for cycle in range(start_cycle, program.loops):
+                if not run(controller.CYCLE, program.cycle, cycle):
+                    completed = False
+                    break
+        else:
+            completed = False
+        if not completed:
+            # the teardown starts at once
+            deadline = monotonic()
+        run(controller.TEARDOWN, program.teardown, interruptible=False)
+        wait_until_deadline(False)
+        self._report(run_id, controller.DONE if completed else controller.STOPPED)
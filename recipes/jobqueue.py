@@ -0,0 +1,345 @@
+"""Persistent queue of recipe runs.
+
+A job is a recipe with its inputs for a chamber. The JobQueue keeps all jobs
+in a JSON file which is replaced atomically on every change, so the queue
+survives restarts. A job which was running when the program ended is marked
+as interrupted, it can be resumed from its checkpoint.
+
+A QueueRunner executes the queued jobs of a chamber back to back. While a
+job runs, the recipe of the next job is already built, so the only idle
+time between two jobs is the hand-off time of the runner.
+"""
+import json
+import os
+
+from datetime import datetime
+from threading import Event, RLock, Thread
+from typing import Callable, Dict, List, Optional
+
+from .runs import ChamberBusyError, Run, RunManager
+
+QUEUE_PATH = 'queue.json'
+
+# increase if the format of the queue file changes
+QUEUE_VERSION = 1
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+STOPPED = 'stopped'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+INTERRUPTED = 'interrupted'
+
+FINISHED_STATES = (DONE, STOPPED, FAILED, CANCELLED, INTERRUPTED)
+
+
+class Job(object):
+    """A recipe run in the queue."""
+
+    def __init__(self, job_id: int, recipe: str, inputs: Dict, chamber: Optional[str] = None,
+                 state: str = QUEUED, added: str = None, started: str = None, finished: str = None) -> None:
+        self.id = job_id
+        self.recipe = recipe
+        self.inputs = dict(inputs)
+        self.chamber = chamber
+        self.state = state
+        self.added = added if added is not None else datetime.now().isoformat()
+        self.started = started
+        self.finished = finished
+
+    def to_dict(self) -> dict:
+        return {'id': self.id, 'recipe': self.recipe, 'inputs': self.inputs, 'chamber': self.chamber,
+                'state': self.state, 'added': self.added, 'started': self.started, 'finished': self.finished}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Job':
+        return cls(data['id'], data['recipe'], data['inputs'], data['chamber'], data['state'],
+                   data['added'], data['started'], data['finished'])
+
+    def copy(self) -> 'Job':
+        return Job.from_dict(self.to_dict())
+
+    def __repr__(self):
+        return '<Job {} {} on {} {}>'.format(self.id, self.recipe, self.chamber or 'default', self.state)
+
+
+class JobQueue(object):
+    """Ordered list of jobs which is saved to a file after every change.
+
+    All methods are thread safe and return copies of the jobs.
+    """
+
+    def __init__(self, path: str = QUEUE_PATH) -> None:
+        self._path = path
+        self._lock = RLock()
+        self._jobs = []
+        self._next_id = 1
+        self._listeners = []
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self._path) as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != QUEUE_VERSION:
+            return
+        self._jobs = [Job.from_dict(job) for job in data['jobs']]
+        self._next_id = data['next_id']
+
+        # saved with the next change, so reading the queue does not modify it
+        for job in self._jobs:
+            if job.state == RUNNING:
+                job.state = INTERRUPTED
+
+    def _save(self) -> None:
+        data = {'version': QUEUE_VERSION, 'next_id': self._next_id, 'jobs': [job.to_dict() for job in self._jobs]}
+        temporary_path = self._path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(data, file, indent=1)
+        os.replace(temporary_path, self._path)
+
+    def _changed(self) -> None:
+        self._save()
+        for listener in list(self._listeners):
+            listener()
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """Registers a function which is called after every change, from the thread which changed the queue."""
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        self._listeners.remove(listener)
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return [job.copy() for job in self._jobs]
+
+    def job(self, job_id: int) -> Optional[Job]:
+        with self._lock:
+            job = self._find(job_id)
+            return job.copy() if job is not None else None
+
+    def _find(self, job_id: int) -> Optional[Job]:
+        for job in self._jobs:
+            if job.id == job_id:
+                return job
+        return None
+
+    def add(self, recipe: str, inputs: Dict, chamber: Optional[str] = None) -> Job:
+        """Appends a job to the queue.
+
+        :param recipe: name of the recipe in recipes.REGISTRY
+        :param inputs: recipe inputs, must be JSON serializable
+        :param chamber: chamber on which the job runs
+        """
+        with self._lock:
+            job = Job(self._next_id, recipe, inputs, chamber)
+            self._next_id += 1
+            self._jobs.append(job)
+            self._changed()
+            return job.copy()
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancels a queued job, returns False if the job is not queued."""
+        with self._lock:
+            job = self._find(job_id)
+            if job is None or job.state != QUEUED:
+                return False
+            job.state = CANCELLED
+            job.finished = datetime.now().isoformat()
+            self._changed()
+            return True
+
+    def move(self, job_id: int, position: int) -> None:
+        """Moves a job to a position of the queue, 0 is the front."""
+        with self._lock:
+            job = self._find(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            self._jobs.remove(job)
+            self._jobs.insert(max(0, min(position, len(self._jobs))), job)
+            self._changed()
+
+    def requeue(self, job_id: int) -> bool:
+        """Queues a finished job again at its position, returns False if it is queued or running."""
+        with self._lock:
+            job = self._find(job_id)
+            if job is None or job.state not in FINISHED_STATES:
+                return False
+            job.state = QUEUED
+            job.started = job.finished = None
+            self._changed()
+            return True
+
+    def clear_finished(self) -> None:
+        """Removes all finished jobs."""
+        with self._lock:
+            self._jobs = [job for job in self._jobs if job.state not in FINISHED_STATES]
+            self._changed()
+
+    def next(self, chamber: Optional[str]) -> Optional[Job]:
+        """Returns the first queued job of a chamber."""
+        with self._lock:
+            for job in self._jobs:
+                if job.state == QUEUED and job.chamber == chamber:
+                    return job.copy()
+            return None
+
+    def set_state(self, job_id: int, state: str) -> None:
+        with self._lock:
+            job = self._find(job_id)
+            if job is None:
+                return
+            job.state = state
+            if state == RUNNING:
+                job.started = datetime.now().isoformat()
+            elif state in FINISHED_STATES:
+                job.finished = datetime.now().isoformat()
+            self._changed()
+
+
+class QueueRunner(object):
+    """Executes the queued jobs of one chamber back to back.
+
+    The runner pauses when the queue is empty, when a job was stopped or
+    failed, and when the chamber is busy with a run which was not started by
+    the runner.
+    """
+
+    def __init__(self, run_manager: RunManager, queue: JobQueue, chamber: Optional[str] = None,
+                 signal_interface_factory: Callable = None, handoff: float = 0.0,
+                 on_job_started: Callable[[Job, Run], None] = None,
+                 on_paused: Callable[[str], None] = None, options: Dict = None) -> None:
+        """
+        :param run_manager: manager which runs the recipes
+        :param queue: queue of the jobs
+        :param chamber: chamber whose jobs are executed
+        :param signal_interface_factory: function which returns the signal interface of a job,
+                                         it may be called from any thread
+        :param handoff: seconds between the end of a job and the start of the next one
+        :param on_job_started: called with the job and its run when a job starts
+        :param on_paused: called with the reason when the runner pauses
+        :param options: recipe options added to the inputs of every job, e.g. acknowledge
+        """
+        from .signals import NullSignalInterface
+
+        self._manager = run_manager
+        self._queue = queue
+        self._chamber = chamber
+        self._signal_interface_factory = signal_interface_factory or (lambda job: NullSignalInterface())
+        self._handoff = handoff
+        self._on_job_started = on_job_started
+        self._on_paused = on_paused
+        self._options = dict(options or {})
+
+        self._lock = RLock()
+        self._active = False
+        self._drained = False
+        self._current = None
+        # job and its prepared run, built while the current job runs
+        self._prepared = None
+        self._handoff_event = Event()
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    @property
+    def current(self) -> Optional[Job]:
+        return self._current
+
+    @property
+    def drained(self) -> bool:
+        """True if the runner paused because all jobs of the chamber were done."""
+        return self._drained
+
+    def start(self) -> None:
+        """Starts the next queued job if the runner is idle."""
+        with self._lock:
+            self._active = True
+            self._drained = False
+            if self._current is None:
+                self._start_next()
+
+    def pause(self, reason: str = 'paused') -> None:
+        """Lets the current job finish, but does not start further jobs."""
+        with self._lock:
+            was_active = self._active
+            self._active = False
+            self._handoff_event.set()
+        if was_active and self._on_paused is not None:
+            self._on_paused(reason)
+
+    def _prepare(self, job: Job) -> Run:
+        inputs = dict(job.inputs, **self._options)
+        return self._manager.prepare(job.chamber, job.recipe, self._signal_interface_factory(job), **inputs)
+
+    def _start_next(self) -> None:
+        with self._lock:
+            if not self._active or self._current is not None:
+                return
+            job = self._queue.next(self._chamber)
+            if job is None:
+                self._drained = True
+                self.pause('queue is empty')
+                return
+
+            prepared, self._prepared = self._prepared, None
+            if prepared is not None and prepared[0].to_dict() == job.to_dict():
+                run = prepared[1]
+            else:
+                try:
+                    run = self._prepare(job)
+                except Exception as error:
+                    self._queue.set_state(job.id, FAILED)
+                    self.pause('job {} could not be built: {}'.format(job.id, error))
+                    return
+
+            try:
+                self._manager.start_prepared(run)
+            except ChamberBusyError as error:
+                self.pause(str(error))
+                return
+            self._current = job
+            self._queue.set_state(job.id, RUNNING)
+            run._future.add_done_callback(lambda future: self._finished(job, run, future))
+
+            if self._on_job_started is not None:
+                self._on_job_started(job, run)
+
+            upcoming = self._queue.next(self._chamber)
+            if upcoming is not None:
+                try:
+                    self._prepared = (upcoming, self._prepare(upcoming))
+                except Exception:
+                    pass  # built again and reported when the job is due
+
+    def _finished(self, job: Job, run: Run, future) -> None:
+        if future.cancelled() or future.exception() is not None or run.recipe.failed is not None:
+            state = FAILED
+        elif run.recipe.stopped:
+            state = STOPPED
+        else:
+            state = DONE
+        self._queue.set_state(job.id, state)
+
+        with self._lock:
+            self._current = None
+            if state != DONE:
+                self.pause('job {} {}'.format(job.id, state))
+                return
+            if not self._active:
+                return
+            self._handoff_event.clear()
+
+        if self._handoff > 0:
+            Thread(target=self._hand_off, name='queue-handoff', daemon=True).start()
+        else:
+            self._start_next()
+
+    def _hand_off(self) -> None:
+        self._handoff_event.wait(self._handoff)
+        self._start_next()
@@ -0,0 +1,323 @@
+"""Index of the run logs.
+
+The index keeps a summary of every run in the logs directory: recipe,
+chamber, start and end, cycles, step and cycle durations and the events
+such as stops. The summaries are persisted in logs/__cache__/index.json,
+keyed by the modification time and size of the log files, so only new and
+changed logs are parsed. The logs are read through memory maps.
+
+A log holds the runs of one recipe which started in the same minute, every
+run begins with the lines written by AbstractRecipe._begin::
+
+    2026-10-18T10:44:06.289598 - run of platinum-ald on chamber default
+    2026-10-18T10:44:06.289611 - tags: sweep=platinum-ald-20261018T104400, point=2/6, platinum_wait=2
+
+The keys and values of the tags are percent-encoded. The following lines
+carry the kind of their event after the time, e.g. step or cycle, see
+runlog; only the kind decides whether a line is a step, the start of a
+cycle or an event, never its text. Logs written before the kinds were
+introduced give runs without cycles, steps and events. Logs written before
+the first line was introduced count as a single run whose recipe is taken
+from the file name.
+"""
+import json
+import mmap
+import os
+import re
+
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote
+
+from . import declarative, runlog
+
+# increase if the format of the index or of the summaries changes
+INDEX_VERSION = 3
+
+LOG_DIRECTORY = 'logs'
+
+LoggedRun = namedtuple('LoggedRun', ['file', 'recipe', 'chamber', 'start', 'end', 'cycles', 'stopped', 'resumed',
+                                     'cycle_durations', 'steps', 'events', 'tags'])
+LoggedRun.__doc__ = """Summary of a run read from its log.
+
+:param file: name of the log file
+:param recipe: log name of the recipe, e.g. platinum-ald
+:param chamber: chamber of the run, None for the single chamber setup
+:param start: POSIX time of the first line
+:param end: POSIX time of the last line
+:param cycles: number of cycles which were started
+:param stopped: True if the run was stopped
+:param resumed: True if the run was resumed from a checkpoint
+:param cycle_durations: (count, total, maximum) of the durations of the cycles in seconds
+:param steps: step name -> (count, total, maximum) of the step durations in seconds
+:param events: (time, text) of all lines which the engine logged as events, e.g. stops, resumes,
+                broker outages and errors
+:param tags: tags of the run, e.g. the coordinates of a sweep
+"""
+
+_HEADER = re.compile(rb'run of (.+) on chamber (.+)$')
+_TAGS = b'tags: '
+_FILE_NAME = re.compile(r'\d{4}-\d{2}-\d{2}T\d{2}-\d{2}-(.+)\.log$')
+_STEP = runlog.STEP.encode()
+_CYCLE = runlog.CYCLE.encode()
+_STOP = runlog.STOP.encode()
+_RESUME = runlog.RESUME.encode()
+_EVENTS = (_STOP, _RESUME, runlog.EVENT.encode())
+
+
+class _RunParser(object):
+    """Collects the summary of one run from its lines."""
+
+    def __init__(self, file: str, recipe: str, chamber: Optional[str]) -> None:
+        self.file = file
+        self.recipe = recipe
+        self.chamber = chamber
+        self.start = None
+        self.end = None
+        self.cycles = 0
+        self.stopped = False
+        self.resumed = False
+        self.cycle_durations = [0, 0.0, 0.0]
+        self.steps = OrderedDict()
+        self.events = []
+        self.tags = OrderedDict()
+        self._step = None
+        self._cycle_start = None
+
+    @staticmethod
+    def _add(statistics: list, duration: float) -> None:
+        statistics[0] += 1
+        statistics[1] += duration
+        if duration > statistics[2]:
+            statistics[2] = duration
+
+    def _end_step(self, timestamp: float) -> None:
+        if self._step is not None:
+            name, started = self._step
+            statistics = self.steps.get(name)
+            if statistics is None:
+                statistics = self.steps[name] = [0, 0.0, 0.0]
+            self._add(statistics, timestamp - started)
+            self._step = None
+
+    def line(self, timestamp: float, kind: Optional[bytes], text: bytes) -> None:
+        if self.start is None:
+            self.start = timestamp
+        self.end = timestamp
+
+        if kind is None and text.startswith(_TAGS) and self._step is None and not self.cycles:
+            for item in text[len(_TAGS):].decode(errors='replace').split(', '):
+                # percent-encoded by engine.format_tags
+                key, _, value = item.partition('=')
+                self.tags[unquote(key)] = unquote(value)
+        elif kind == _CYCLE:
+            self._end_step(timestamp)
+            if self._cycle_start is not None:
+                self._add(self.cycle_durations, timestamp - self._cycle_start)
+            self._cycle_start = timestamp
+            self.cycles += 1
+        elif kind in _EVENTS:
+            if kind == _STOP:
+                self.stopped = True
+            elif kind == _RESUME:
+                self.resumed = True
+            self.events.append((timestamp, text.decode(errors='replace')))
+        elif kind == _STEP:
+            self._end_step(timestamp)
+            self._step = (text.decode(errors='replace'), timestamp)
+        else:
+            # e.g. the metrics summary at the end of a run
+            self._end_step(timestamp)
+
+    def result(self) -> LoggedRun:
+        return LoggedRun(self.file, self.recipe, self.chamber, self.start, self.end, self.cycles, self.stopped,
+                         self.resumed, tuple(self.cycle_durations),
+                         OrderedDict((name, tuple(value)) for name, value in self.steps.items()), self.events,
+                         self.tags)
+
+
+def _recipe_from_file_name(file: str) -> str:
+    match = _FILE_NAME.match(file)
+    return match.group(1) if match is not None else os.path.splitext(file)[0]
+
+
+def parse_log(path: str) -> List[LoggedRun]:
+    """Reads the runs of a log file."""
+    file = os.path.basename(path)
+    runs = []
+    parser = None
+
+    with open(path, 'rb') as log:
+        if os.fstat(log.fileno()).st_size == 0:
+            return runs
+        with mmap.mmap(log.fileno(), 0, access=mmap.ACCESS_READ) as memory:
+            for line in iter(memory.readline, b''):
+                stamp, separator, text = line.rstrip(b'\r\n').partition(b' - ')
+                if not separator:
+                    continue
+                # the time may be followed by the cycle and the kind, e.g. 2026-10-18T10:44:06.289598 #3 step
+                fields = stamp.split(b' ')
+                try:
+                    timestamp = datetime.fromisoformat(fields[0].decode()).timestamp()
+                except ValueError:
+                    continue
+                kind = fields[-1] if len(fields) > 1 and not fields[-1].startswith(b'#') else None
+
+                match = _HEADER.match(text) if kind is None else None
+                if match is not None:
+                    if parser is not None:
+                        runs.append(parser.result())
+                    chamber = match.group(2).decode(errors='replace')
+                    parser = _RunParser(file, match.group(1).decode(errors='replace'),
+                                        None if chamber == 'default' else chamber)
+                    parser.start = parser.end = timestamp
+                    continue
+                if parser is None:
+                    parser = _RunParser(file, _recipe_from_file_name(file), None)
+                parser.line(timestamp, kind, text)
+
+    if parser is not None:
+        runs.append(parser.result())
+    return runs
+
+
+def _to_json(run: LoggedRun) -> dict:
+    return run._asdict()
+
+
+def _from_json(data: dict) -> LoggedRun:
+    data = dict(data)
+    data['cycle_durations'] = tuple(data['cycle_durations'])
+    data['steps'] = OrderedDict((name, tuple(value)) for name, value in data['steps'].items())
+    data['events'] = [tuple(event) for event in data['events']]
+    data['tags'] = OrderedDict(data['tags'])
+    return LoggedRun(**data)
+
+
+class LogIndex(object):
+    """Summaries of all runs of a logs directory, updated incrementally."""
+
+    def __init__(self, directory: str = LOG_DIRECTORY) -> None:
+        self._directory = directory
+        self._index_path = os.path.join(directory, declarative.CACHE_DIRECTORY, 'index.json')
+        self._runs = None
+
+    def _scan_directory(self) -> Dict[str, List[int]]:
+        logs = {}
+        if not os.path.isdir(self._directory):
+            return logs
+        for entry in os.scandir(self._directory):
+            if entry.is_file() and entry.name.endswith('.log'):
+                stat = entry.stat()
+                logs[entry.name] = [stat.st_mtime_ns, stat.st_size]
+        return logs
+
+    def _read_index(self) -> dict:
+        try:
+            with open(self._index_path) as file:
+                index = json.load(file)
+            if index.get('version') == INDEX_VERSION:
+                return index['logs']
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def _write_index(self, logs: dict) -> None:
+        try:
+            os.makedirs(os.path.dirname(self._index_path), exist_ok=True)
+            temporary_path = self._index_path + '.tmp'
+            with open(temporary_path, 'w') as file:
+                json.dump({'version': INDEX_VERSION, 'logs': logs}, file)
+            os.replace(temporary_path, self._index_path)
+        except OSError:
+            pass  # the index is only an optimization
+
+    def refresh(self) -> int:
+        """Parses new and changed logs and drops removed ones, returns the number of parsed logs."""
+        cached = self._read_index()
+        logs = OrderedDict()
+        parsed = 0
+
+        for file, stamp in sorted(self._scan_directory().items()):
+            log = cached.get(file)
+            if log is None or log['stamp'] != stamp:
+                try:
+                    runs = parse_log(os.path.join(self._directory, file))
+                except OSError:
+                    continue
+                log = {'stamp': stamp, 'runs': [_to_json(run) for run in runs]}
+                parsed += 1
+            logs[file] = log
+
+        if parsed or set(cached) != set(logs):
+            self._write_index(logs)
+
+        self._runs = [_from_json(run) for log in logs.values() for run in log['runs']]
+        self._runs.sort(key=lambda run: run.start)
+        return parsed
+
+    def runs(self, recipe: Optional[str] = None, chamber: Optional[str] = None,
+             since: Optional[float] = None, until: Optional[float] = None,
+             tags: Optional[Dict[str, str]] = None) -> List[LoggedRun]:
+        """Returns the runs ordered by their start.
+
+        :param recipe: only runs whose recipe log name contains this text
+        :param chamber: only runs of this chamber, 'default' for the single chamber setup
+        :param since: only runs which started at or after this POSIX time
+        :param until: only runs which started before this POSIX time
+        :param tags: only runs with all these tags
+        """
+        if self._runs is None:
+            self.refresh()
+        result = []
+        for run in self._runs:
+            if recipe is not None and recipe not in run.recipe:
+                continue
+            if chamber is not None and (run.chamber or 'default') != chamber:
+                continue
+            if since is not None and run.start < since:
+                continue
+            if until is not None and run.start >= until:
+                continue
+            if tags and any(run.tags.get(key) != value for key, value in tags.items()):
+                continue
+            result.append(run)
+        return result
+
+
+def statistics(runs: Iterable[LoggedRun]) -> dict:
+    """Aggregates runs.
+
+    :return: dictionary with the number of runs, stopped and resumed runs, cycles,
+             mean and maximum cycle duration and step name -> (count, mean, max)
+    """
+    result = {'runs': 0, 'stopped': 0, 'resumed': 0, 'cycles': 0}
+    cycle_count, cycle_total, cycle_maximum = 0, 0.0, 0.0
+    steps = OrderedDict()
+
+    for run in runs:
+        result['runs'] += 1
+        result['stopped'] += run.stopped
+        result['resumed'] += run.resumed
+        result['cycles'] += run.cycles
+        count, total, maximum = run.cycle_durations
+        cycle_count += count
+        cycle_total += total
+        cycle_maximum = max(cycle_maximum, maximum)
+        for name, (count, total, maximum) in run.steps.items():
+            step = steps.setdefault(name, [0, 0.0, 0.0])
+            step[0] += count
+            step[1] += total
+            step[2] = max(step[2], maximum)
+
+    result['mean_cycle_duration'] = cycle_total / cycle_count if cycle_count else None
+    result['max_cycle_duration'] = cycle_maximum if cycle_count else None
+    result['steps'] = OrderedDict((name, (count, total / count, maximum))
+                                  for name, (count, total, maximum) in steps.items())
+    return result
+
+
+def step_durations(run: LoggedRun) -> List[Tuple[str, int, float, float]]:
+    """Returns (name, count, mean, max) of the steps of a run."""
+    return [(name, count, total / count, maximum) for name, (count, total, maximum) in run.steps.items()]
@@ -0,0 +1,213 @@
+"""Runtime metrics of a recipe run.
+
+Counters, gauges and histograms are kept in a Metrics registry. The registry
+renders them in the Prometheus text format, which can be written to a file
+for the node exporter textfile collector or served over HTTP, and creates a
+compact summary for the log at the end of a run.
+
+The recipe thread updates the metrics while the HTTP server and the textfile
+thread render them, so counters and histograms are updated under a lock and
+rendered from consistent snapshots.
+"""
+import os
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 2e-3, 5e-3, 1e-2, 2e-2, 5e-2, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+DURATION_BUCKETS = (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0)
+
+
+class Counter(object):
+    def __init__(self) -> None:
+        self.value = 0.0
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Gauge(object):
+    def __init__(self, function: Optional[Callable[[], float]] = None) -> None:
+        self._function = function
+        self._value = 0.0
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._value
+
+
+class Histogram(object):
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+        self._lock = Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def snapshot(self) -> 'Histogram':
+        """Returns a copy whose counts, count, sum and max belong to the same observations."""
+        copy = Histogram(self.buckets)
+        with self._lock:
+            copy.counts = list(self.counts)
+            copy.count, copy.sum, copy.max = self.count, self.sum, self.max
+        return copy
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Returns the upper bound of the bucket which contains the q-quantile."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.max
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ''
+    escaped = ('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in items)
+    return '{' + ','.join(escaped) + '}'
+
+
+class Metrics(object):
+    """Registry of metric families, each family may have several label sets."""
+
+    def __init__(self) -> None:
+        self._families = {}
+        # guards the families, metrics may be added while they are rendered
+        self._lock = Lock()
+
+    def _get(self, kind: str, name: str, documentation: str, labels: Dict[str, str], factory: Callable):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (kind, documentation, {})
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+        return metric
+
+    def _snapshot(self) -> List[Tuple]:
+        """Returns (name, kind, documentation, [(labels, metric)]) of all families, histograms are copied."""
+        with self._lock:
+            families = [(name, kind, documentation, list(metrics.items()))
+                        for name, (kind, documentation, metrics) in self._families.items()]
+        return [(name, kind, documentation,
+                 [(labels, metric.snapshot() if kind == 'histogram' else metric) for labels, metric in metrics])
+                for name, kind, documentation, metrics in families]
+
+    def counter(self, name: str, documentation: str, **labels: str) -> Counter:
+        return self._get('counter', name, documentation, labels, Counter)
+
+    def gauge(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None,
+              **labels: str) -> Gauge:
+        return self._get('gauge', name, documentation, labels, lambda: Gauge(function))
+
+    def histogram(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS,
+                  **labels: str) -> Histogram:
+        return self._get('histogram', name, documentation, labels, lambda: Histogram(buckets))
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, kind, documentation, metrics in self._snapshot():
+            lines.append('# HELP {} {}'.format(name, documentation))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, metric in metrics:
+                if kind == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, metric.counts):
+                        cumulative += count
+                        lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, (('le', repr(bound)),)),
+                                                             cumulative))
+                    lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, (('le', '+Inf'),)),
+                                                         metric.count))
+                    lines.append('{}_sum{} {!r}'.format(name, _format_labels(labels), metric.sum))
+                    lines.append('{}_count{} {}'.format(name, _format_labels(labels), metric.count))
+                else:
+                    lines.append('{}{} {!r}'.format(name, _format_labels(labels), float(metric.value)))
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str) -> None:
+        """Writes the metrics atomically to path."""
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            file.write(self.render())
+        os.replace(temporary_path, path)
+
+    def write_textfile_periodically(self, path: str, interval: float = 10.0) -> Event:
+        """Writes the metrics to path every interval seconds from a daemon thread.
+
+        :return: event which stops the thread when set, the file is written a last time
+        """
+        stop_event = Event()
+
+        def write_loop():
+            while not stop_event.wait(interval):
+                self.write_textfile(path)
+            self.write_textfile(path)
+
+        Thread(target=write_loop, name='metrics-textfile', daemon=True).start()
+        return stop_event
+
+    def serve(self, port: int, address: str = '127.0.0.1') -> ThreadingHTTPServer:
+        """Serves the metrics on http://address:port/metrics from a daemon thread.
+
+        :return: the server, call shutdown() and server_close() to stop it
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((address, port), Handler)
+        Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+        return server
+
+    def summary(self) -> List[str]:
+        """Returns one compact line per metric."""
+        lines = []
+        for name, kind, documentation, metrics in self._snapshot():
+            for labels, metric in metrics:
+                title = name + _format_labels(labels)
+                if kind == 'histogram':
+                    if not metric.count:
+                        continue
+                    lines.append('{}: n={} mean={:.4g} p95<={:.4g} max={:.4g}'.format(
+                        title, metric.count, metric.sum / metric.count, metric.quantile(0.95), metric.max))
+                else:
+                    lines.append('{}: {:.6g}'.format(title, metric.value))
+        return lines
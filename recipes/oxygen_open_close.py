@@ -1,7 +1,7 @@
-from .recipe import AbstractRecipe, run_and_wait, register, logable
+from .recipe import AbstractRecipe, register
 from .recipe import FloatValue, IntegerValue
+from .program import Program, step
 
-import json
 
 @register('Oxygen On Off')
 class OxygenOnOff(AbstractRecipe):
@@ -9,44 +9,20 @@ class OxygenOnOff(AbstractRecipe):
                  n:int=100,
                  close_wait:float=5,
                  oxygen_wait:float=10,
-                 flow:float=10):
+                 flow:float=10,
+                 **options):
 
-        super().__init__(mqtt_client, signal_interface)
+        super().__init__(mqtt_client, signal_interface,
+                         command_topic='ald/recipes/oxygen_on_off/cmd', **options)
 
-        mqtt_client.subscribe('ald/recipes/oxygen_purification/cmd')
-        mqtt_client.message_callback_add('ald/recipes/oxygen_purification/cmd', self._cmd)
+        close_center = step('Close center', close_wait, {"centeroxygen": False}, 0.0)
+        open_oxygen = step('Open oxygen', oxygen_wait, {"centeroxygen": True}, flow)
+        close_all = step('Close all valves', messages=[('ald/io/closeall', ' ')])
 
-        self._number_of_loops = n
-        self._flow = flow
-
-        wait = self._interrupt_event.wait
-
-        self._close_center_and_wait = run_and_wait(self._close_center, total_run_time=close_wait, sleep_function=wait)
-        self._open_oxygen_and_wait = run_and_wait(self._open_oxygen, total_run_time=oxygen_wait, sleep_function=wait)
-
-    def _cmd(self, client, user_data, message):
-        if message.payload == b'stop':
-            self.stop()
-
-
-    @logable('Close center')
-    def _close_center(self):
-        valves_to_change = {"centeroxygen": False}
-        self._mqtt_client.publish('ald/io/set', json.dumps(valves_to_change))
-        self._mqtt_client.publish('ald/flow/set', '0.0')
-
-    @logable('Open oxygen')
-    def _open_oxygen(self):
-        valves_to_change = {"centeroxygen": True}
-        self._mqtt_client.publish('ald/io/set', json.dumps(valves_to_change))
-        self._mqtt_client.publish('ald/flow/set', str(self._flow))
-
-    @logable('Close all valves')
-    def _close_all(self):
-        self._mqtt_client.publish('ald/io/closeall', ' ')
-
-    def max_process_value(self):
-        return self._number_of_loops
+        self._program = Program([close_center,
+                                 open_oxygen],
+                                loops=n,
+                                teardown=[close_all])
 
     @staticmethod
     def inputs():
@@ -54,18 +30,3 @@ class OxygenOnOff(AbstractRecipe):
                 'close_wait': FloatValue('Close Center Wait Time (s)', default=10),
                 'oxygen_wait': FloatValue('Oxygen Open Time (s)', default=10),
                 'flow': FloatValue('flow (a.u.)', default=10)}
-
-    def _run(self):
-        loop = [ self._close_center_and_wait,
-                 self._open_oxygen_and_wait]
-
-        for loop_number in range(self._number_of_loops):
-            self._log('starting CYCLE {}'.format(loop_number + 1))
-            for command in loop:
-                command()
-                if self._stop_process.is_set():
-                    break
-            if self._stop_process.is_set():
-                break
-
-        self._close_all()
@@ -1,81 +1,44 @@
-from .recipe import AbstractRecipe, run_and_wait, register, logable
+from .recipe import AbstractRecipe, register
 from .recipe import FloatValue, IntegerValue
+from .program import Program, open_valves, step
 
-import json
 
 @register('Oxygen Purification')
 class OxygenPurification(AbstractRecipe):
+    VALVES = ("centerpurge",
+              "centeroxygen",
+              "rightpurge")
+
+    # time to 'fill' the tube after closing the oxygen valve before the flow is stopped
+    FILL_TIME = 0.2
+
     def __init__(self, mqtt_client, signal_interface,
                  n:int=100,
                  flush_wait:float=10,
                  close_wait:float=5,
                  oxygen_wait:float=10,
-                 oxygen_flow:float=80):
-
-        super().__init__(mqtt_client, signal_interface, logname='oxygen-purification')
-
-        mqtt_client.subscribe('ald/recipes/oxygen_purification/cmd')
-        mqtt_client.message_callback_add('ald/recipes/oxygen_purification/cmd', self._cmd)
-
-        self._number_of_loops = n
-        self._oxygen_flow = oxygen_flow
-
-        wait = self._interrupt_event.wait
-
-        self._flush_center_and_wait = run_and_wait(self._flush_center, total_run_time=flush_wait, sleep_function=wait)
-        self._close_center_and_wait = run_and_wait(self._close_center, total_run_time=close_wait, sleep_function=wait)
-        self._open_oxygen_and_wait = run_and_wait(self._open_oxygen, total_run_time=oxygen_wait, sleep_function=wait)
+                 oxygen_flow:float=80,
+                 **options):
 
-    def _cmd(self, client, user_data, message):
-        if message.payload == b'stop':
-            self.stop()
+        super().__init__(mqtt_client, signal_interface, logname='oxygen-purification',
+                         command_topic='ald/recipes/oxygen_purification/cmd', **options)
 
-    @logable('Flush center')
-    def _flush_center(self):
-        valves_to_change = {"centerpurge": True,
-                            "centeroxygen": False,
-                            "rightpurge": False}
-        self._mqtt_client.publish('ald/io/set', json.dumps(valves_to_change))
-        self._mqtt_client.publish('ald/flow/set', '0.0')
+        valves = self.VALVES
 
-    @logable('Close center')
-    def _close_center(self):
-        valves_to_change = {"centerpurge": False,
-                            "centeroxygen": False,
-                            "rightpurge": False}
-        self._mqtt_client.publish('ald/io/set', json.dumps(valves_to_change))
-        self._mqtt_client.publish('ald/flow/set', '0.0')
+        flush_center = step('Flush center', flush_wait, open_valves(valves, 'centerpurge'), 0.0)
+        close_center = step('Close center', close_wait, open_valves(valves), 0.0)
+        open_oxygen = step('Open oxygen', oxygen_wait, open_valves(valves, 'centeroxygen'), oxygen_flow)
+        close_oxygen = step('Close oxygen', self.FILL_TIME, open_valves(valves))
+        stop_oxygen_flow = step('Stop oxygen flow', 0, flow=0.0)
+        close_all = step('Close all valves', self.FILL_TIME, open_valves(valves))
 
-    @logable('Open oxygen')
-    def _open_oxygen(self):
-        valves_to_change = {"centerpurge": False,
-                            "centeroxygen": True,
-                            "rightpurge": False}
-        self._mqtt_client.publish('ald/io/set', json.dumps(valves_to_change))
-        self._mqtt_client.publish('ald/flow/set', str(self._oxygen_flow))
-
-    @logable('Close oxygen')
-    def _close_oxygen(self):
-        valves_to_change = {"centerpurge": False,
-                            "centeroxygen": False,
-                            "rightpurge": False}
-        self._mqtt_client.publish('ald/io/set', json.dumps(valves_to_change))
-        #wait a bit to 'fill' tube
-        self._interrupt_event.wait(0.2)
-        self._mqtt_client.publish('ald/flow/set', '0.0')
-
-    @logable('Close all valves')
-    def _close_all(self):
-        valves_to_change = {"centerpurge": False,
-                            "centeroxygen": False,
-                            "rightpurge": False}
-        self._mqtt_client.publish('ald/io/set', json.dumps(valves_to_change))
-        #wait a bit to 'fill' tube
-        self._interrupt_event.wait(0.2)
-        self._mqtt_client.publish('ald/flow/set', '0.0')
-
-    def max_process_value(self):
-        return self._number_of_loops
+        self._program = Program([flush_center,
+                                 close_center,
+                                 open_oxygen,
+                                 close_oxygen,
+                                 stop_oxygen_flow],
+                                loops=n,
+                                teardown=[close_all, stop_oxygen_flow])
 
     @staticmethod
     def inputs():
@@ -84,22 +47,3 @@ class OxygenPurification(AbstractRecipe):
                 'close_wait': FloatValue('Close Center Wait Time (s)', default=10),
                 'oxygen_wait': FloatValue('Oxygen Open Time (s)', default=10),
                 'oxygen_flow': FloatValue('Oxygenflow (sccm)', default=80)}
-
-    def _run(self):
-        loop = [self._flush_center_and_wait,
-                self._close_center_and_wait,
-                self._open_oxygen_and_wait,
-                self._close_oxygen]
-
-        for loop_number in range(self._number_of_loops):
-            self._signal_interface.emit_update_process_value(loop_number)
-            self._log('starting CYCLE {}'.format(loop_number + 1))
-            for command in loop:
-                command()
-                if self._stop_process.is_set():
-                    break
-            if self._stop_process.is_set():
-                break
-
-        self._signal_interface.emit_update_process_value(self._number_of_loops)
-        self._close_all()
@@ -0,0 +1,248 @@
+"""Compiled recipe programs.
+
+A recipe is compiled once when it is built into an immutable table of steps.
+Every step already carries its MQTT topics and encoded payloads, so running
+a recipe only publishes bytes and waits.
+"""
+import json
+
+from collections import namedtuple
+from hashlib import sha256
+from typing import Dict, Iterable, Optional, Tuple
+
+VALVE_TOPIC = 'ald/io/set'
+FLOW_TOPIC = 'ald/flow/set'
+
+Step = namedtuple('Step', ['name', 'duration', 'valves', 'flow', 'messages'])
+Step.__doc__ = """A single step of a program.
+
+:param name: name which is written to the log
+:param duration: planned duration of the step in seconds
+:param valves: commanded valve states as tuple of (valve, state) pairs
+:param flow: commanded flow setpoint or None
+:param messages: tuple of (topic, payload) pairs with encoded payloads
+"""
+
+
+def open_valves(valves: Iterable[str], *opened: str) -> Dict[str, bool]:
+    """Returns a valve map where only the given valves are open.
+
+    :param valves: all valves which are controlled by the recipe
+    :param opened: valves which should be open
+    """
+    return {valve: valve in opened for valve in valves}
+
+
+def step(name: str, duration: float = 0.0, valves: Optional[Dict[str, bool]] = None,
+         flow: Optional[float] = None, messages: Iterable[Tuple[str, str]] = ()) -> Step:
+    """Creates a step and encodes its MQTT messages.
+
+    :param name: name which is written to the log
+    :param duration: planned duration of the step in seconds
+    :param valves: valve states which are published to VALVE_TOPIC
+    :param flow: flow setpoint which is published to FLOW_TOPIC
+    :param messages: additional (topic, payload) pairs which are published after valves and flow
+    """
+    encoded = []
+    if valves is not None:
+        encoded.append((VALVE_TOPIC, json.dumps(valves).encode()))
+    if flow is not None:
+        flow = float(flow)
+        encoded.append((FLOW_TOPIC, str(flow).encode()))
+    for topic, payload in messages:
+        encoded.append((topic, payload.encode() if isinstance(payload, str) else bytes(payload)))
+
+    return Step(name, float(duration), tuple(valves.items()) if valves is not None else (), flow, tuple(encoded))
+
+
+def namespaced_topic(topic: str, chamber: Optional[str]) -> str:
+    """Moves a topic into the namespace of a chamber, 'ald/io/set' becomes 'ald/<chamber>/io/set'.
+
+    :param topic: topic of the single chamber setup
+    :param chamber: name of the chamber, None keeps the topic unchanged
+    """
+    if chamber is None:
+        return topic
+    root, _, rest = topic.partition('/')
+    return '{}/{}/{}'.format(root, chamber, rest) if rest else '{}/{}'.format(root, chamber)
+
+
+def namespaced_steps(steps: Iterable[Step], chamber: Optional[str]) -> Tuple[Step, ...]:
+    """Returns the steps with all message topics moved into the namespace of a chamber."""
+    if chamber is None:
+        return tuple(steps)
+    return tuple(s._replace(messages=tuple((namespaced_topic(topic, chamber), payload)
+                                           for topic, payload in s.messages))
+                 for s in steps)
+
+
+class ValveState(object):
+    """Tracks the last commanded valve states and flow setpoint.
+
+    apply turns a step into one which only publishes the valves and the
+    setpoint that differ from the tracked state. Messages to other topics are
+    always published; since their effect on the valves is unknown, the
+    tracked state is forgotten afterwards.
+    """
+
+    def __init__(self) -> None:
+        self._valves = {}
+        self._flow = None
+
+    @property
+    def valves(self) -> Dict[str, bool]:
+        return dict(self._valves)
+
+    @property
+    def flow(self) -> Optional[float]:
+        return self._flow
+
+    def reset(self) -> None:
+        """Forgets the state, the next step is published completely."""
+        self._valves = {}
+        self._flow = None
+
+    def apply(self, full_step: Step) -> Step:
+        """Updates the state and returns the step with only the changes in its messages."""
+        changed_valves = {valve: state for valve, state in full_step.valves
+                          if self._valves.get(valve) != state}
+        changed_flow = full_step.flow if full_step.flow is not None and full_step.flow != self._flow else None
+        extra_messages = [(topic, payload) for topic, payload in full_step.messages
+                          if topic not in (VALVE_TOPIC, FLOW_TOPIC)]
+
+        self._valves.update(full_step.valves)
+        if full_step.flow is not None:
+            self._flow = full_step.flow
+        if extra_messages:
+            self.reset()
+
+        delta = step(full_step.name, full_step.duration, changed_valves or None, changed_flow, extra_messages)
+        return delta._replace(valves=full_step.valves, flow=full_step.flow)
+
+
+class Program(object):
+    """An immutable, compiled recipe.
+
+    The setup steps run once, the cycle steps run `loops` times and the
+    teardown steps run at the end, also if the recipe was stopped.
+    """
+
+    def __init__(self, cycle: Iterable[Step], loops: int,
+                 setup: Iterable[Step] = (), teardown: Iterable[Step] = ()) -> None:
+        self._setup = tuple(setup)
+        self._cycle = tuple(cycle)
+        self._teardown = tuple(teardown)
+        self._loops = int(loops)
+        self._digest = None
+        self._deltas = None
+        self._safe_state = None
+
+    @property
+    def setup(self) -> Tuple[Step, ...]:
+        return self._setup
+
+    @property
+    def cycle(self) -> Tuple[Step, ...]:
+        return self._cycle
+
+    @property
+    def teardown(self) -> Tuple[Step, ...]:
+        return self._teardown
+
+    @property
+    def loops(self) -> int:
+        return self._loops
+
+    @property
+    def setup_duration(self) -> float:
+        return sum(s.duration for s in self._setup)
+
+    @property
+    def cycle_duration(self) -> float:
+        return sum(s.duration for s in self._cycle)
+
+    @property
+    def teardown_duration(self) -> float:
+        return sum(s.duration for s in self._teardown)
+
+    @property
+    def duration(self) -> float:
+        """Planned duration of the complete run in seconds."""
+        return self.setup_duration + self._loops * self.cycle_duration + self.teardown_duration
+
+    def safe_state(self) -> Step:
+        """Returns a single step which commands the state at the end of the teardown.
+
+        The step carries the final valve states and flow setpoint of the
+        teardown and its other messages, without the waits between the
+        teardown steps. An empty teardown gives a step without messages.
+        """
+        if self._safe_state is None:
+            valves = {}
+            flow = None
+            messages = []
+            for s in self._teardown:
+                valves.update(s.valves)
+                if s.flow is not None:
+                    flow = s.flow
+                messages.extend((topic, payload) for topic, payload in s.messages
+                                if topic not in (VALVE_TOPIC, FLOW_TOPIC))
+            self._safe_state = step('Safe state', 0.0, valves or None, flow, messages)
+        return self._safe_state
+
+    def deltas(self) -> Tuple[Tuple[Step, ...], Tuple[Step, ...], Tuple[Step, ...]]:
+        """Returns the setup, the first cycle and all further cycles with delta-only messages.
+
+        The state of the valves is unknown at the beginning, so the first
+        step publishes everything. The teardown is not included, it always
+        publishes the complete state.
+        """
+        if self._deltas is None:
+            state = ValveState()
+            setup = tuple(state.apply(s) for s in self._setup)
+            first_cycle = tuple(state.apply(s) for s in self._cycle)
+            cycle = tuple(state.apply(s) for s in self._cycle)
+            self._deltas = (setup, first_cycle, cycle)
+        return self._deltas
+
+    def to_dict(self) -> dict:
+        """Returns a JSON serializable representation of the program."""
+        def convert(steps):
+            return [{'name': s.name,
+                     'duration': s.duration,
+                     'valves': dict(s.valves),
+                     'flow': s.flow,
+                     'messages': [[topic, payload.decode()] for topic, payload in s.messages]}
+                    for s in steps]
+
+        return {'loops': self._loops,
+                'setup': convert(self._setup),
+                'cycle': convert(self._cycle),
+                'teardown': convert(self._teardown)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Program':
+        """Restores a program created by to_dict."""
+        def convert(steps):
+            return [Step(s['name'], s['duration'], tuple(s['valves'].items()), s['flow'],
+                         tuple((topic, payload.encode()) for topic, payload in s['messages']))
+                    for s in steps]
+
+        return cls(convert(data['cycle']), data['loops'],
+                   setup=convert(data['setup']), teardown=convert(data['teardown']))
+
+    def digest(self) -> str:
+        """Returns a SHA-256 hex digest which identifies the program."""
+        if self._digest is None:
+            text = json.dumps(self.to_dict(), sort_keys=True)
+            self._digest = sha256(text.encode()).hexdigest()
+        return self._digest
+
+    def __eq__(self, other):
+        return isinstance(other, Program) and self.digest() == other.digest()
+
+    def __hash__(self):
+        return hash(self.digest())
+
+    def __repr__(self):
+        return '<Program {} steps x {} loops {}>'.format(len(self._cycle), self._loops, self.digest()[:12])
@@ -0,0 +1,369 @@
+"""Publishing layer between the recipes and the paho client.
+
+paho drops messages with QoS 0 which are published while the connection is
+down, and messages which were queued when it breaks. The Publisher keeps
+every message until the client confirms it, so a broker outage delays the
+commands instead of losing them:
+
+* publish never blocks. The messages wait in a bounded queue, and at most
+  max_in_flight of them are handed to the client before it confirms them.
+  A message which does not fit into the queue is dropped, and its delivery
+  reports the paho error code MQTT_ERR_QUEUE_SIZE like paho does.
+* Every message gets a Delivery with its status: queued, sent, delivered or
+  dropped. A replaced message is superseded. QoS 0 messages are delivered
+  when they are written to the socket, QoS 1 and 2 messages when the broker
+  acknowledges them.
+* When the connection is lost, the QoS 0 messages which were not confirmed
+  go back to the front of the queue. The queue is sent when the client has
+  reconnected, in full (REPLAY_ALL) or only the newest message of every
+  topic (REPLAY_LATEST). The subscriptions are restored before that. With
+  delta publishing a valve message only holds the valves which changed, so
+  REPLAY_LATEST merges the queued valve maps of a topic instead of keeping
+  the newest one only.
+* The queue depth, messages in flight, drops, replays and the connection
+  are exported as metrics, see register_metrics.
+
+The Publisher offers the methods of the paho client which the recipes use
+and is passed to them instead of the client. AbstractRecipe pauses its run
+while the Publisher is disconnected, see AbstractRecipe._check_broker.
+"""
+import json
+
+from collections import OrderedDict, deque
+from configparser import ConfigParser
+from threading import Condition
+from time import monotonic
+from typing import Callable, Optional
+
+from .metrics import Metrics
+from .program import VALVE_TOPIC
+
+# paho.mqtt.client error codes
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_QUEUE_SIZE = 15
+
+QUEUED = 'queued'
+SENT = 'sent'
+DELIVERED = 'delivered'
+DROPPED = 'dropped'
+SUPERSEDED = 'superseded'
+
+REPLAY_ALL = 'all'
+REPLAY_LATEST = 'latest'
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_MAX_IN_FLIGHT = 100
+
+
+def is_valve_topic(topic: str) -> bool:
+    """True for the valve topic of the single chamber setup and of every chamber, see program.namespaced_topic."""
+    if topic == VALVE_TOPIC:
+        return True
+    root, _, rest = VALVE_TOPIC.partition('/')
+    levels = topic.split('/')
+    return len(levels) == VALVE_TOPIC.count('/') + 2 and levels[0] == root and '/'.join(levels[2:]) == rest
+
+
+def merge_payloads(older, newer):
+    """Returns the JSON object of newer updated over older, None if either payload is not a JSON object."""
+    try:
+        merged = json.loads(older)
+        update = json.loads(newer)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(merged, dict) or not isinstance(update, dict):
+        return None
+    merged.update(update)
+    payload = json.dumps(merged)
+    return payload.encode() if isinstance(newer, bytes) else payload
+
+
+class Delivery(object):
+    """Delivery status of a published message."""
+
+    __slots__ = ('topic', 'payload', 'qos', 'retain', 'status', 'mid', 'queued_at', 'delivered_at')
+
+    def __init__(self, topic: str, payload, qos: int, retain: bool, queued_at: float) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.status = QUEUED
+        self.mid = None
+        self.queued_at = queued_at
+        self.delivered_at = None
+
+    @property
+    def rc(self) -> int:
+        """paho error code: MQTT_ERR_QUEUE_SIZE if the message was dropped, else MQTT_ERR_SUCCESS."""
+        return MQTT_ERR_QUEUE_SIZE if self.status == DROPPED else MQTT_ERR_SUCCESS
+
+    @property
+    def pending(self) -> bool:
+        return self.status in (QUEUED, SENT)
+
+    def __repr__(self):
+        return '<Delivery {} {}>'.format(self.topic, self.status)
+
+
+class Publisher(object):
+    """Queues, sends and confirms the messages of a client and restores its session after a reconnect."""
+
+    def __init__(self, mqtt_client, queue_size: int = DEFAULT_QUEUE_SIZE, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 replay: str = REPLAY_ALL, clock: Callable[[], float] = monotonic,
+                 merged_topic: Callable[[str], bool] = is_valve_topic) -> None:
+        """
+        :param mqtt_client: paho client or aio.AsyncMQTTClient, the callbacks on_connect and
+                            on_disconnect which are already set are still called
+        :param queue_size: maximum number of messages which wait to be handed to the client
+        :param max_in_flight: maximum number of messages which were handed to the client but not confirmed
+        :param replay: REPLAY_ALL or REPLAY_LATEST, which queued messages are sent after a reconnect
+        :param clock: monotonic clock of the delivery times
+        :param merged_topic: returns True for the topics whose payloads are JSON objects with a part of
+                             the state, with REPLAY_LATEST their queued payloads are merged
+        """
+        if replay not in (REPLAY_ALL, REPLAY_LATEST):
+            raise ValueError('unknown replay policy {!r}'.format(replay))
+
+        self._mqtt_client = mqtt_client
+        # the callbacks are set on the paho client, also if it is driven by an AsyncMQTTClient
+        self._client = getattr(mqtt_client, 'client', mqtt_client)
+        self._queue_size = queue_size
+        self._max_in_flight = max_in_flight
+        self._replay = replay
+        self._clock = clock
+        self._merged_topic = merged_topic
+
+        self._condition = Condition()
+        self._queue = deque()
+        self._in_flight = OrderedDict()
+        # unknown confirmations which arrived during the current publish call, one of them may be
+        # its own; confirmations of messages which bypass the publisher are ignored otherwise
+        self._early_confirmations = set()
+        self._sending = False
+        self._publishing = False
+        self._subscriptions = OrderedDict()
+
+        self._connected = bool(getattr(self._client, 'is_connected', lambda: False)())
+        self._connections = 1 if self._connected else 0
+        self._dropped = 0
+        self._replayed = 0
+        self._superseded = 0
+        self._high_water = 0
+        self._max_delivery_time = 0.0
+
+        self._on_connect_callback = getattr(self._client, 'on_connect', None)
+        self._on_disconnect_callback = getattr(self._client, 'on_disconnect', None)
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.on_publish = self._on_publish
+
+    @property
+    def client(self):
+        """The wrapped client."""
+        return self._mqtt_client
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    @property
+    def connections(self) -> int:
+        """Number of established connections, increases with every reconnect."""
+        return self._connections
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    @property
+    def dropped(self) -> int:
+        """Number of messages which were dropped because the queue was full."""
+        return self._dropped
+
+    @property
+    def replayed(self) -> int:
+        """Number of messages which were sent again after a reconnect."""
+        return self._replayed
+
+    def register_metrics(self, metrics: Metrics) -> None:
+        metrics.gauge('aldrun_publish_queue_depth', 'Messages waiting in the publisher', lambda: len(self._queue))
+        metrics.gauge('aldrun_publish_queue_high_water', 'Maximum number of messages waiting in the publisher',
+                      lambda: self._high_water)
+        metrics.gauge('aldrun_publish_in_flight', 'Messages handed to the client and not yet confirmed',
+                      lambda: len(self._in_flight))
+        metrics.gauge('aldrun_publish_dropped', 'Messages dropped because the publisher queue was full',
+                      lambda: self._dropped)
+        metrics.gauge('aldrun_publish_replayed', 'Messages sent again after a reconnect', lambda: self._replayed)
+        metrics.gauge('aldrun_publish_superseded', 'Queued messages replaced by a newer one of the same topic',
+                      lambda: self._superseded)
+        metrics.gauge('aldrun_publish_max_delivery_seconds', 'Longest time from publish to confirmation',
+                      lambda: self._max_delivery_time)
+        metrics.gauge('aldrun_broker_connected', '1 while the client is connected to the broker',
+                      lambda: 1 if self._connected else 0)
+        metrics.gauge('aldrun_broker_connections', 'Number of established connections', lambda: self._connections)
+
+    def publish(self, topic: str, payload=None, qos: int = 0, retain: bool = False) -> Delivery:
+        """Queues a message and sends it if the client is connected, never blocks."""
+        delivery = Delivery(topic, payload, qos, retain, self._clock())
+        with self._condition:
+            if len(self._queue) >= self._queue_size:
+                delivery.status = DROPPED
+                self._dropped += 1
+                return delivery
+            self._queue.append(delivery)
+            if len(self._queue) > self._high_water:
+                self._high_water = len(self._queue)
+        self._send()
+        return delivery
+
+    def _send(self) -> None:
+        """Hands queued messages to the client while it is connected and the window is open.
+
+        Only one thread sends at a time, so the order of the queue is kept;
+        the client is called without holding the lock, its callbacks may run
+        in another thread.
+        """
+        with self._condition:
+            if self._sending:
+                return
+            self._sending = True
+        try:
+            while True:
+                with self._condition:
+                    if not self._connected or not self._queue or len(self._in_flight) >= self._max_in_flight:
+                        return
+                    delivery = self._queue.popleft()
+                    self._publishing = True
+                try:
+                    info = self._mqtt_client.publish(delivery.topic, delivery.payload, delivery.qos, delivery.retain)
+                finally:
+                    with self._condition:
+                        self._publishing = False
+                        early_confirmations, self._early_confirmations = self._early_confirmations, set()
+                with self._condition:
+                    if info.rc != MQTT_ERR_SUCCESS:
+                        # the connection broke, the message is sent after the reconnect
+                        self._queue.appendleft(delivery)
+                        return
+                    delivery.mid = info.mid
+                    delivery.status = SENT
+                    if info.mid in early_confirmations:
+                        self._confirm(delivery)
+                    else:
+                        self._in_flight[info.mid] = delivery
+        finally:
+            with self._condition:
+                self._sending = False
+
+    def _confirm(self, delivery: Delivery) -> None:
+        delivery.status = DELIVERED
+        delivery.delivered_at = self._clock()
+        duration = delivery.delivered_at - delivery.queued_at
+        if duration > self._max_delivery_time:
+            self._max_delivery_time = duration
+        self._condition.notify_all()
+
+    def _on_publish(self, client, user_data, mid) -> None:
+        with self._condition:
+            delivery = self._in_flight.pop(mid, None)
+            if delivery is None:
+                if self._publishing:
+                    self._early_confirmations.add(mid)
+                return
+            self._confirm(delivery)
+        self._send()
+
+    def _on_disconnect(self, client, user_data, rc) -> None:
+        with self._condition:
+            self._connected = False
+            # paho sends unconfirmed messages with QoS > 0 again by itself
+            lost = [delivery for delivery in self._in_flight.values() if delivery.qos == 0]
+            for delivery in reversed(lost):
+                del self._in_flight[delivery.mid]
+                delivery.status = QUEUED
+                delivery.mid = None
+                self._queue.appendleft(delivery)
+            self._replayed += len(lost)
+            self._condition.notify_all()
+        if self._on_disconnect_callback is not None:
+            self._on_disconnect_callback(client, user_data, rc)
+
+    def _on_connect(self, client, user_data, flags, rc) -> None:
+        if rc == 0:
+            for topic, (qos, count) in list(self._subscriptions.items()):
+                self._mqtt_client.subscribe(topic, qos)
+            with self._condition:
+                if self._replay == REPLAY_LATEST:
+                    self._keep_latest()
+                self._connected = True
+                self._connections += 1
+                self._condition.notify_all()
+            self._send()
+        if self._on_connect_callback is not None:
+            self._on_connect_callback(client, user_data, flags, rc)
+
+    def _keep_latest(self) -> None:
+        latest = OrderedDict()
+        for delivery in self._queue:
+            previous = latest.pop(delivery.topic, None)
+            if previous is not None:
+                if self._merged_topic(delivery.topic):
+                    merged = merge_payloads(previous.payload, delivery.payload)
+                    if merged is not None:
+                        # the newer delivery carries the state of both
+                        delivery.payload = merged
+                previous.status = SUPERSEDED
+                self._superseded += 1
+            latest[delivery.topic] = delivery
+        self._queue = deque(latest.values())
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the client is connected, returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._connected, timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until all messages are confirmed, returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and not self._in_flight, timeout)
+
+    def subscribe(self, topic: str, qos: int = 0):
+        """Subscribes now or after the connection is established, the subscription is restored after reconnects."""
+        with self._condition:
+            previous_qos, count = self._subscriptions.get(topic, (qos, 0))
+            self._subscriptions[topic] = (max(qos, previous_qos), count + 1)
+            connected = self._connected
+        if connected:
+            return self._mqtt_client.subscribe(topic, qos)
+        return MQTT_ERR_SUCCESS, None
+
+    def unsubscribe(self, topic: str):
+        """Ends a subscription when every subscriber of the topic has unsubscribed."""
+        with self._condition:
+            qos, count = self._subscriptions.get(topic, (0, 1))
+            if count > 1:
+                self._subscriptions[topic] = (qos, count - 1)
+                return MQTT_ERR_SUCCESS, None
+            self._subscriptions.pop(topic, None)
+            connected = self._connected
+        if connected:
+            return self._mqtt_client.unsubscribe(topic)
+        return MQTT_ERR_SUCCESS, None
+
+    def message_callback_add(self, subscription: str, callback) -> None:
+        self._mqtt_client.message_callback_add(subscription, callback)
+
+    def message_callback_remove(self, subscription: str) -> None:
+        self._mqtt_client.message_callback_remove(subscription)
+
+
+def publisher_from_config(mqtt_client, config: ConfigParser) -> Publisher:
+    """Returns the Publisher of the client with the options queue_size, max_in_flight and replay of [MQTT]."""
+    section = config['MQTT']
+    return Publisher(mqtt_client, section.getint('queue_size', DEFAULT_QUEUE_SIZE),
+                     section.getint('max_in_flight', DEFAULT_MAX_IN_FLIGHT), section.get('replay', REPLAY_ALL))
@@ -1,14 +1,11 @@
 """
 
 """
-from datetime import datetime
-
-from threading import Event
-from typing import Dict, List, Tuple, Union
-
 from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Union
 
-from time import time, sleep
+from .engine import RunEngine
 
 REGISTRY = {}
 
@@ -96,72 +93,24 @@ class SignalInterface:
     def emit_update_process_value(self, value: int) -> None:
         NotImplementedError()
 
+    def emit_update_timeline(self, remaining: float, drift: float) -> None:
+        """Called at the start of every step.
 
-def logable(text=''):
-    def outer_wrapper(foo):
-        def inner_wrapper(self, *args, **kwargs):
-            self._log(text)
-            foo(self, *args, **kwargs)
-        return inner_wrapper
-    return outer_wrapper
-
-
-def run_and_wait(foo, total_run_time: float=0, sleep_function=sleep):
-    def wrapper(*args, **kwargs):
-        start_time = time()
-        foo(*args, **kwargs)
-        foo_run_time = time() - start_time
-        time_to_wait = total_run_time - foo_run_time
-        if time_to_wait > 0:
-            sleep_function(time_to_wait)
-    return wrapper
+        :param remaining: planned seconds from the start of the step to the end of the run
+        :param drift: seconds the step starts later than planned, negative if earlier
+        """
+        NotImplementedError()
 
 
-class AbstractRecipe(ABC):
-    """
+class AbstractRecipe(RunEngine, ABC):
+    """Base class of all recipes.
 
+    Subclasses compile their steps into a Program when they are built and
+    assign it to self._program, the engine.RunEngine executes it. The
+    options of the constructor are those of RunEngine.
     """
-    def __init__(self, mqtt_client, signal_interface: SignalInterface, logname='general'):
-        self._stop_process = Event()
-
-        self._mqtt_client = mqtt_client
-        self._signal_interface = signal_interface
-
-        self._log_file = open('logs/{:%Y-%m-%dT%H-%M}-{}.log'.format(datetime.now(), logname), 'a')
-
-        self._interrupt_event = Event()
-
-    def __call__(self):
-        self._stop_process.clear()
-        self._interrupt_event.clear()
-        self._signal_interface.emit_started()
-        self._run()
-        self._signal_interface.emit_finished()
-
-    def stop(self):
-        self._stop_process.set()
-        self._interrupt_event.set()
-        self._signal_interface.emit_stopped()
-        self._log_file.close()
-
-    def _log(self, text):
-        message = '{} - {}'.format(datetime.now().isoformat(), text)
-        self._signal_interface.emit_status_message(text)
-        print(message, file=self._log_file)
-        self._log_file.flush()
-
-    @abstractmethod
-    def _run(self):
-        pass
-
-    @abstractmethod
-    def max_process_value(self):
-        return -1
 
     @staticmethod
     @abstractmethod
     def inputs():
         return {}
-
-
-
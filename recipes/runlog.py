@@ -0,0 +1,204 @@
+"""Run log which is written from a background thread.
+
+The recipe thread only appends a small event tuple to a bounded queue. A
+writer thread formats the events and writes them in batches, so slow disks
+do not delay the valve timing.
+
+Every line starts with the wall clock time of the event, followed by the
+number of the cycle in which it happened and the kind of the event, if
+any::
+
+    2026-10-18T10:44:06.289598 #3 step - Open oxygen
+
+The kind tells logindex how to read a line without knowing its text.
+
+A failed write, e.g. on a full disk, does not end the run: the lines of the
+batch are counted as lost and the error is reported in the last line.
+"""
+from collections import deque
+from datetime import datetime
+from threading import Event, Lock, Thread
+from time import monotonic, time
+from typing import Callable, Optional
+
+# kinds of events: the start of a step or of a cycle, a stop or resume of the run and other events
+# such as errors and broker outages; lines without kind, e.g. the metrics summary, are informational
+STEP = 'step'
+CYCLE = 'cycle'
+STOP = 'stop'
+RESUME = 'resume'
+EVENT = 'event'
+KINDS = (STEP, CYCLE, STOP, RESUME, EVENT)
+
+
+class RunLogger(object):
+    """Writes the log events of a run in batches from a background thread."""
+
+    def __init__(self, path: Optional[str], queue_size: int = 10000, flush_interval: float = 1.0,
+                 clock: Callable[[], float] = monotonic) -> None:
+        """
+        :param path: log file, events are appended, None discards all events;
+                     the file is opened when the logger is started
+        :param queue_size: maximum number of pending events, further events are dropped
+        :param flush_interval: seconds between two writes
+        :param clock: monotonic clock used for the event timestamps
+        """
+        self._path = path
+        self._file = None
+        self._queue = deque()
+        self._queue_size = queue_size
+        self._flush_interval = flush_interval
+        self._clock = clock
+        # converts timestamps of the monotonic clock into wall clock time
+        self._offset = time() - clock()
+
+        self._stop_event = Event()
+        self._thread = None
+        self._flush_lock = Lock()
+
+        self._written = 0
+        self._dropped = 0
+        self._delayed = 0
+        self._lost = 0
+        self._error = None
+
+    @property
+    def path(self) -> Optional[str]:
+        """The log file, it can be changed until the logger is opened."""
+        return self._path
+
+    @path.setter
+    def path(self, path: Optional[str]) -> None:
+        if self._file is not None:
+            raise RuntimeError('the log file {} is already open'.format(self._path))
+        self._path = path
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    @property
+    def dropped(self) -> int:
+        """Number of events which were dropped because the queue was full."""
+        return self._dropped
+
+    @property
+    def delayed(self) -> int:
+        """Number of events which were written later than two flush intervals after they happened."""
+        return self._delayed
+
+    @property
+    def lost(self) -> int:
+        """Number of events which could not be written to the file."""
+        return self._lost
+
+    @property
+    def error(self) -> Optional[OSError]:
+        """The first error writing the file, None if all writes succeeded."""
+        return self._error
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def flush_interval(self) -> float:
+        return self._flush_interval
+
+    def open(self) -> None:
+        """Opens the log file without writer thread, the owner has to call flush periodically."""
+        if self._file is None and self._path is not None:
+            self._file = open(self._path, 'a')
+
+    def start(self) -> None:
+        """Opens the log file and starts the writer thread."""
+        self.open()
+        if self._thread is None and self._file is not None:
+            self._thread = Thread(target=self._write_loop, name='run-logger', daemon=True)
+            self._thread.start()
+
+    def log(self, text: str, cycle: Optional[int] = None, kind: Optional[str] = None) -> bool:
+        """Enqueues an event, returns False if it was dropped.
+
+        :param text: text of the line
+        :param cycle: index of the cycle in which the event happened
+        :param kind: one of KINDS or None
+        """
+        if self._path is None:
+            return True
+        if len(self._queue) >= self._queue_size:
+            self._dropped += 1
+            return False
+        self._queue.append((self._clock(), cycle, kind, text))
+        return True
+
+    def stop(self) -> None:
+        """Writes all pending events and a summary line and closes the file."""
+        if self._file is None or self._file.closed:
+            return
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._flush_lock:
+            self._flush()
+            summary = 'logger: {} events written, {} dropped, {} delayed'.format(
+                self._written, self._dropped, self._delayed)
+            if self._error is not None:
+                summary += ', {} lost: {}'.format(self._lost, self._error)
+            try:
+                self._write(self._format(self._clock(), None, None, summary))
+            except OSError as error:
+                self._failed(error, 0)
+            finally:
+                try:
+                    self._file.close()
+                except OSError as error:
+                    self._failed(error, 0)
+
+    def _write_loop(self) -> None:
+        while not self._stop_event.wait(self._flush_interval):
+            self.flush()
+
+    def _format(self, timestamp: float, cycle: Optional[int], kind: Optional[str], text: str) -> str:
+        stamp = datetime.fromtimestamp(timestamp + self._offset).isoformat()
+        if cycle is not None:
+            # cycles are counted from 1 in the log, like in "starting CYCLE 1"
+            stamp += ' #{}'.format(cycle + 1)
+        if kind is not None:
+            stamp += ' ' + kind
+        return '{} - {}\n'.format(stamp, text)
+
+    def _write(self, text: str) -> None:
+        self._file.write(text)
+        self._file.flush()
+
+    def _failed(self, error: OSError, lines: int) -> None:
+        self._lost += lines
+        if self._error is None:
+            self._error = error
+
+    def flush(self) -> None:
+        """Writes all pending events."""
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        queue = self._queue
+        if not queue or self._file is None or self._file.closed:
+            return
+
+        lines = []
+        oldest_allowed = self._clock() - 2 * self._flush_interval
+        while queue:
+            timestamp, cycle, kind, text = queue.popleft()
+            if timestamp < oldest_allowed:
+                self._delayed += 1
+            lines.append(self._format(timestamp, cycle, kind, text))
+
+        try:
+            self._write(''.join(lines))
+        except OSError as error:
+            # the batch is dropped, the writer keeps going with the next one
+            self._failed(error, len(lines))
+        else:
+            self._written += len(lines)
@@ -0,0 +1,252 @@
+"""Concurrent runs of recipes on several chambers.
+
+Every chamber has its own topic namespace (see program.namespaced_topic), so
+the recipes of different chambers can share one MQTT client. The RunManager
+starts every run in its own thread and allows at most one run per chamber.
+
+The chambers are configured in config.cnf::
+
+    [CHAMBERS]
+    names = reactor1, reactor2
+
+Without this section there is a single chamber with the topics of the
+single chamber setup.
+"""
+from concurrent.futures import Future, wait
+from configparser import ConfigParser
+from threading import Lock, Thread
+from typing import Dict, Iterable, List, Optional
+
+from .archive import ArchiveWriter
+from .checkpoint import Checkpoint, CheckpointFile, checkpoint_path
+from .recipe import AbstractRecipe, SignalInterface
+
+
+# recipe options which are not saved with the inputs of a run
+ENGINE_OPTIONS = ('start_cycle', 'archive', 'checkpoint', 'telemetry', 'clock')
+
+
+class ChamberBusyError(RuntimeError):
+    """Raised when a recipe is started on a chamber which is already running one."""
+
+
+def chambers_from_config(config: ConfigParser) -> List[Optional[str]]:
+    """Returns the chamber names of the [CHAMBERS] section, [None] if there is none."""
+    if 'CHAMBERS' not in config:
+        return [None]
+    names = [name.strip() for name in config['CHAMBERS'].get('names', '').split(',')]
+    return [name for name in names if name] or [None]
+
+
+class _RunSignalInterface(SignalInterface):
+    """Forwards all signals, but releases the chamber before forwarding finished."""
+
+    def __init__(self, signal_interface: SignalInterface, release) -> None:
+        self._signal_interface = signal_interface
+        self._release = release
+
+    def emit_finished(self) -> None:
+        self._release()
+        self._signal_interface.emit_finished()
+
+    def emit_started(self) -> None:
+        self._signal_interface.emit_started()
+
+    def emit_stopped(self) -> None:
+        self._signal_interface.emit_stopped()
+
+    def emit_status_message(self, message: str) -> None:
+        self._signal_interface.emit_status_message(message)
+
+    def emit_update_process_value(self, value: int) -> None:
+        self._signal_interface.emit_update_process_value(value)
+
+    def emit_update_timeline(self, remaining: float, drift: float) -> None:
+        self._signal_interface.emit_update_timeline(remaining, drift)
+
+
+class Run(object):
+    """A recipe started by a run manager."""
+
+    def __init__(self, chamber: Optional[str], name: str, recipe: AbstractRecipe,
+                 signal_interface: SignalInterface, inputs: Optional[Dict] = None) -> None:
+        self._chamber = chamber
+        self._name = name
+        self._recipe = recipe
+        self._signal_interface = signal_interface
+        self._inputs = dict(inputs or {})
+        self._future = None
+
+    @property
+    def chamber(self) -> Optional[str]:
+        return self._chamber
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def recipe(self) -> AbstractRecipe:
+        return self._recipe
+
+    @property
+    def inputs(self) -> Dict:
+        """Inputs and options of the run without the engine objects, see ENGINE_OPTIONS."""
+        return dict(self._inputs)
+
+    @property
+    def signal_interface(self) -> SignalInterface:
+        """The signal interface the run was started with."""
+        return self._signal_interface
+
+    @property
+    def running(self) -> bool:
+        return self._future is not None and not self._future.done()
+
+    def stop(self) -> None:
+        self._recipe.stop()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the end of the run, returns False on timeout."""
+        if self._future is not None:
+            wait([self._future], timeout)
+        return not self.running
+
+
+class RunManager(object):
+    """Executes recipes concurrently over one shared MQTT client, one run per chamber.
+
+    Every run gets its own thread, see aio.AsyncRunManager for runs which
+    share one event loop.
+    """
+
+    def __init__(self, mqtt_client, chambers: Iterable[Optional[str]] = (None,),
+                 checkpoint_directory: Optional[str] = None, telemetry=None,
+                 archive_directory: Optional[str] = None) -> None:
+        """
+        :param mqtt_client: connected paho client which is shared by all runs
+        :param chambers: names of the chambers, None is the chamber of the single chamber setup
+        :param checkpoint_directory: directory of the checkpoints of the runs, None disables them
+        :param telemetry: telemetry.Telemetry which is passed to all recipes
+        :param archive_directory: directory of the columnar archives of the runs, None disables them
+        """
+        self._mqtt_client = mqtt_client
+        self._chambers = tuple(chambers)
+        self._checkpoint_directory = checkpoint_directory
+        self._telemetry = telemetry
+        self._archive_directory = archive_directory
+        self._runs = {}
+        self._lock = Lock()
+
+    @property
+    def chambers(self):
+        return self._chambers
+
+    def runs(self) -> Dict[Optional[str], Run]:
+        """Returns chamber -> run of all running recipes."""
+        with self._lock:
+            return dict(self._runs)
+
+    def is_busy(self, chamber: Optional[str]) -> bool:
+        with self._lock:
+            return chamber in self._runs
+
+    def start(self, chamber: Optional[str], name: str, signal_interface: SignalInterface, **inputs) -> Run:
+        """Builds the recipe for the chamber and starts it.
+
+        :param chamber: one of the chambers of the manager
+        :param name: name of the recipe in recipes.REGISTRY
+        :param signal_interface: receives the progress of this run
+        :param inputs: recipe inputs and recipe options
+        """
+        running = self.runs().get(chamber)
+        if running is not None:
+            raise ChamberBusyError('chamber {} is running {}'.format(chamber, running.name))
+        return self.start_prepared(self.prepare(chamber, name, signal_interface, **inputs))
+
+    def prepare(self, chamber: Optional[str], name: str, signal_interface: SignalInterface, **inputs) -> Run:
+        """Builds the recipe of a run without starting it, also while the chamber is busy.
+
+        The archive and the checkpoint of the run are only created by
+        start_prepared. The parameters are the same as for start.
+        """
+        from . import REGISTRY
+
+        if chamber not in self._chambers:
+            raise ValueError('unknown chamber {!r}'.format(chamber))
+
+        run = None
+        recipe = REGISTRY[name](self._mqtt_client, _RunSignalInterface(signal_interface, lambda: self._release(run)),
+                                chamber=chamber, telemetry=self._telemetry, **inputs)
+        run = Run(chamber, name, recipe, signal_interface,
+                  {key: value for key, value in inputs.items() if key not in ENGINE_OPTIONS})
+        return run
+
+    def start_prepared(self, run: Run) -> Run:
+        """Starts a run built by prepare.
+
+        :raises ChamberBusyError: if the chamber of the run is running another recipe
+        """
+        with self._lock:
+            if run.chamber in self._runs:
+                raise ChamberBusyError('chamber {} is running {}'.format(run.chamber, self._runs[run.chamber].name))
+            self._runs[run.chamber] = run
+
+        self._attach_files(run)
+        run._future = self._launch(run)
+        run._future.add_done_callback(lambda future: self._release(run))
+        return run
+
+    def _attach_files(self, run: Run) -> None:
+        """Creates the archive and the checkpoint of a run which starts now, unless the caller passed them."""
+        recipe = run.recipe
+        archive = checkpoint = None
+        if self._archive_directory is not None and recipe.archive is None:
+            archive = ArchiveWriter(self._archive_directory, run.name, run.inputs, run.chamber, self._telemetry)
+        if self._checkpoint_directory is not None and recipe.checkpoint is None:
+            checkpoint = CheckpointFile(checkpoint_path(self._checkpoint_directory, run.chamber),
+                                        run.name, run.inputs, run.chamber)
+        recipe.attach(archive, checkpoint)
+
+    def _release(self, run: Run) -> None:
+        with self._lock:
+            if self._runs.get(run.chamber) is run:
+                del self._runs[run.chamber]
+
+    def resume(self, checkpoint: Checkpoint, signal_interface: SignalInterface, **options) -> Run:
+        """Starts the run of a checkpoint again with the cycle which was interrupted.
+
+        :param options: recipe options which are not saved in the checkpoint, e.g. controller_timed
+        """
+        return self.start(checkpoint.chamber, checkpoint.recipe, signal_interface,
+                          start_cycle=checkpoint.cycle, **dict(checkpoint.inputs, **options))
+
+    def _launch(self, run: Run) -> Future:
+        """Starts the recipe of the run, returns a future which is done at its end."""
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        def target():
+            try:
+                run.recipe()
+            except Exception as error:
+                future.set_exception(error)
+                raise
+            future.set_result(None)
+
+        Thread(target=target, name='recipe-{}'.format(run.chamber or 'default')).start()
+        return future
+
+    def stop(self, chamber: Optional[str]) -> None:
+        with self._lock:
+            run = self._runs.get(chamber)
+        if run is not None:
+            run.stop()
+
+    def stop_all(self) -> None:
+        for run in self.runs().values():
+            run.stop()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the end of all runs, returns False on timeout."""
+        return all(run.join(timeout) for run in self.runs().values())
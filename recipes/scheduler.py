@@ -0,0 +1,221 @@
+"""Timing of the recipe steps.
+
+A Scheduler runs steps on absolute deadlines. Its steps and waits are
+awaited, so the same code runs a recipe in its own thread and as a task of
+an event loop: ThreadWaits blocks the calling thread and returns awaitables
+which are already done, run_blocking executes such a coroutine without
+event loop; LoopWaits waits on the running event loop.
+"""
+import asyncio
+
+from time import monotonic, sleep
+from typing import Callable, Optional
+
+
+class Ready(object):
+    """Awaitable which is already done, awaiting it never suspends the coroutine."""
+
+    __slots__ = ('_result',)
+
+    def __init__(self, result=None) -> None:
+        self._result = result
+
+    def __await__(self):
+        yield from ()
+        return self._result
+
+
+def run_blocking(coroutine):
+    """Executes a coroutine which only awaits Ready awaitables in the calling thread.
+
+    :return: the result of the coroutine
+    :raises RuntimeError: if the coroutine waits for anything else, e.g. asyncio.sleep
+    """
+    try:
+        awaited = coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coroutine.close()
+    raise RuntimeError('{!r} cannot be awaited without event loop'.format(awaited))
+
+
+class ThreadWaits(object):
+    """Waits of a run which blocks its thread, see run_blocking."""
+
+    def __init__(self, wait: Optional[Callable[[float], bool]] = None,
+                 sleep_function: Callable[[float], None] = sleep) -> None:
+        """
+        :param wait: waits the given seconds, returns True if it was interrupted (e.g. Event.wait),
+                     by default sleep_function which is never interrupted
+        :param sleep_function: waits the given seconds
+        """
+        self._sleep = sleep_function
+        self._wait = wait
+
+    def wait(self, seconds: float) -> Ready:
+        """Waits until the time has passed or the wait is interrupted, results in True if it was interrupted."""
+        if self._wait is None:
+            self._sleep(seconds)
+            return Ready(False)
+        return Ready(self._wait(seconds))
+
+    def sleep(self, seconds: float) -> Ready:
+        """Waits without interruption."""
+        self._sleep(seconds)
+        return Ready()
+
+    def call(self, function: Callable, *args) -> Ready:
+        """Calls a function which may block."""
+        return Ready(function(*args))
+
+
+class LoopWaits(object):
+    """Waits of a run on the running event loop.
+
+    Blocking functions are called in the default executor. A cancellation of
+    the task is not raised from the waits but calls on_cancel, e.g.
+    AbstractRecipe.stop, so that the run still ends with its teardown;
+    cancelled tells whether this happened.
+    """
+
+    def __init__(self, interrupted: asyncio.Event, on_cancel: Callable[[], None], clock=None) -> None:
+        """
+        :param interrupted: event which interrupts the waits
+        :param on_cancel: called when the task is cancelled during a wait
+        :param clock: object with time() and sleep(seconds) replacing the waits, e.g. a simulation.VirtualClock
+        """
+        self._interrupted = interrupted
+        self._on_cancel = on_cancel
+        self._clock = clock
+        self.cancelled = False
+
+    def _cancel(self) -> None:
+        self.cancelled = True
+        task = asyncio.current_task()
+        if hasattr(task, 'uncancel'):
+            # Python 3.11, later timeouts of the task are not taken for the cancellation
+            task.uncancel()
+        self._on_cancel()
+
+    async def wait(self, seconds: float) -> bool:
+        """Waits until the time has passed or the wait is interrupted, returns True if it was interrupted."""
+        try:
+            if self._clock is not None:
+                self._clock.sleep(seconds)
+                await asyncio.sleep(0)
+                return self._interrupted.is_set()
+            try:
+                await asyncio.wait_for(self._interrupted.wait(), seconds)
+            except asyncio.TimeoutError:
+                return False
+            return True
+        except asyncio.CancelledError:
+            self._cancel()
+            return True
+
+    async def sleep(self, seconds: float) -> None:
+        """Waits without interruption."""
+        try:
+            if self._clock is not None:
+                self._clock.sleep(seconds)
+                seconds = 0
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            self._cancel()
+
+    async def call(self, function: Callable, *args):
+        """Calls a function which may block in the default executor and returns its result."""
+        future = asyncio.get_running_loop().run_in_executor(None, function, *args)
+        while True:
+            try:
+                # the function cannot be interrupted, its result is still needed after a cancellation
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled():
+                    raise
+                self._cancel()
+
+
+class Scheduler(object):
+    """Runs recipe steps on absolute deadlines of a monotonic clock.
+
+    The deadline of a step is the start of the run plus the planned duration
+    of all previous steps. Time lost while publishing, logging or oversleeping
+    is therefore taken from the following waits instead of adding up over the
+    run, and wall clock jumps do not affect the timing at all.
+
+    Two policies decide what happens if a step overruns its own duration:
+
+    * ``CATCH_UP`` keeps the planned timeline, the following steps are
+      shortened until the schedule is met again.
+    * ``SKIP`` drops the lost time and continues the timeline from now on, so
+      no later step is shortened. The overrun is still reported as lateness
+      of the next step.
+    """
+
+    CATCH_UP = 'catch_up'
+    SKIP = 'skip'
+
+    def __init__(self, sleep_function: Optional[Callable] = None, policy: str = CATCH_UP,
+                 clock: Callable[[], float] = monotonic) -> None:
+        """
+        :param sleep_function: function returning an awaitable which waits for the given number
+                               of seconds and results in True if the wait was aborted, e.g.
+                               ThreadWaits.wait or LoopWaits.wait, by default time.sleep
+        :param policy: Scheduler.CATCH_UP or Scheduler.SKIP
+        :param clock: monotonic clock in seconds
+        """
+        if policy not in (self.CATCH_UP, self.SKIP):
+            raise ValueError('unknown schedule policy {!r}'.format(policy))
+
+        self._sleep = sleep_function or ThreadWaits().wait
+        self._policy = policy
+        self._clock = clock
+        self._deadline = None
+        # time dropped from the timeline by SKIP after the last step, reported with the next one
+        self._overrun = 0.0
+
+    @property
+    def policy(self) -> str:
+        return self._policy
+
+    def start(self) -> None:
+        """Sets the beginning of the planned timeline to now."""
+        self._deadline = self._clock()
+        self._overrun = 0.0
+
+    async def run(self, foo: Callable, duration: float, *args, **kwargs) -> float:
+        """Awaits foo at the current deadline and waits until the next one.
+
+        :param foo: coroutine function of the step
+        :param duration: planned duration of the step in seconds
+        :return: lateness of the step start in seconds, with SKIP including the
+                 overrun of the previous step
+        """
+        if self._deadline is None:
+            self.start()
+        lateness = self._clock() - self._deadline + self._overrun
+        self._overrun = 0.0
+
+        await foo(*args, **kwargs)
+
+        self._deadline += duration
+        remaining = self._deadline - self._clock()
+        while remaining > 0:
+            if await self._sleep(remaining):
+                break
+            remaining = self._deadline - self._clock()
+
+        if remaining < 0 and self._policy == self.SKIP:
+            self._deadline -= remaining
+            self._overrun = -remaining
+        return lateness
+
+    def delay_to(self, timestamp: float) -> None:
+        """Lets the current step start at timestamp if that is later than planned.
+
+        Must be called from within the step, the following deadlines are
+        shifted by the same amount.
+        """
+        if timestamp > self._deadline:
+            self._deadline = timestamp
@@ -0,0 +1,111 @@
+"""Signal interfaces for running recipes without a GUI."""
+import json
+import sys
+
+from datetime import datetime, timedelta
+
+from .recipe import SignalInterface
+
+
+class NullSignalInterface(SignalInterface):
+    """Ignores all signals."""
+
+    def emit_finished(self) -> None:
+        pass
+
+    def emit_started(self) -> None:
+        pass
+
+    def emit_stopped(self) -> None:
+        pass
+
+    def emit_status_message(self, message: str) -> None:
+        pass
+
+    def emit_update_process_value(self, value: int) -> None:
+        pass
+
+    def emit_update_timeline(self, remaining: float, drift: float) -> None:
+        pass
+
+
+class ConsoleSignalInterface(SignalInterface):
+    """Prints human readable progress to a stream.
+
+    The planned end is printed once at the start, the progress lines contain
+    the planned end and the drift of the latest step.
+    """
+
+    def __init__(self, stream=None) -> None:
+        self._stream = stream if stream is not None else sys.stdout
+        self.max_process_value = None
+        self._planned_end = None
+        self._drift = 0.0
+
+    def _print(self, text: str) -> None:
+        print('{:%H:%M:%S} - {}'.format(datetime.now(), text), file=self._stream, flush=True)
+
+    def emit_finished(self) -> None:
+        self._print('recipe finished')
+
+    def emit_started(self) -> None:
+        self._print('recipe started')
+
+    def emit_stopped(self) -> None:
+        self._print('recipe stopped')
+
+    def emit_status_message(self, message: str) -> None:
+        self._print(message)
+
+    def emit_update_process_value(self, value: int) -> None:
+        if self.max_process_value is None:
+            text = 'progress {}'.format(value)
+        else:
+            text = 'progress {}/{}'.format(value, self.max_process_value)
+        if self._planned_end is not None:
+            text += ', end {:%H:%M:%S}, drift {:+.3f} s'.format(self._planned_end, self._drift)
+        self._print(text)
+
+    def emit_update_timeline(self, remaining: float, drift: float) -> None:
+        first = self._planned_end is None
+        self._planned_end = datetime.now() + timedelta(seconds=remaining)
+        self._drift = drift
+        if first:
+            self._print('planned end {:%Y-%m-%d %H:%M:%S}'.format(self._planned_end))
+
+
+class JsonSignalInterface(SignalInterface):
+    """Writes one JSON object per signal and line to a stream.
+
+    The timeline of the latest step is added to the progress events as
+    planned_end and drift.
+    """
+
+    def __init__(self, stream=None) -> None:
+        self._stream = stream if stream is not None else sys.stdout
+        self._timeline = {}
+
+    def _write(self, event: str, **data) -> None:
+        data['event'] = event
+        data['time'] = datetime.now().isoformat()
+        self._stream.write(json.dumps(data) + '\n')
+        self._stream.flush()
+
+    def emit_finished(self) -> None:
+        self._write('finished')
+
+    def emit_started(self) -> None:
+        self._write('started')
+
+    def emit_stopped(self) -> None:
+        self._write('stopped')
+
+    def emit_status_message(self, message: str) -> None:
+        self._write('status', message=message)
+
+    def emit_update_process_value(self, value: int) -> None:
+        self._write('progress', value=value, **self._timeline)
+
+    def emit_update_timeline(self, remaining: float, drift: float) -> None:
+        self._timeline = {'planned_end': (datetime.now() + timedelta(seconds=remaining)).isoformat(),
+                          'drift': drift}
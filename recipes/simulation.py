@@ -0,0 +1,110 @@
+"""Dry runs of recipes on a virtual clock.
+
+simulate builds a recipe with a VirtualClock and a FakeMQTTClient, runs it
+without waiting and evaluates the recorded command timeline. A run of
+several hours finishes within milliseconds.
+"""
+import json
+
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from .fake import FakeMQTTClient, Publication
+from .program import FLOW_TOPIC, VALVE_TOPIC, namespaced_topic
+from .signals import NullSignalInterface
+
+SimulationResult = namedtuple('SimulationResult', ['timeline', 'duration', 'gas_on_time', 'valve_open_time'])
+SimulationResult.__doc__ = """Result of a simulated run.
+
+:param timeline: list of Publication(time, topic, payload), time in seconds since the start
+:param duration: total duration of the run in seconds
+:param gas_on_time: seconds during which the flow setpoint was above zero
+:param valve_open_time: valve -> seconds during which the valve was open
+"""
+
+
+class VirtualClock(object):
+    """Clock which advances instantly when sleeping."""
+
+    def __init__(self, start: float = 0.0) -> None:
+        self._now = start
+
+    def time(self) -> float:
+        return self._now
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            self._now += seconds
+
+
+def evaluate(timeline: List[Publication], end: float, chamber: Optional[str] = None) -> SimulationResult:
+    """Computes the gas-on and valve open times of a command timeline.
+
+    :param timeline: publications ordered by time
+    :param end: time at which the run ended
+    :param chamber: chamber whose commands are evaluated
+    """
+    valve_topic = namespaced_topic(VALVE_TOPIC, chamber)
+    flow_topic = namespaced_topic(FLOW_TOPIC, chamber)
+    valves = {}
+    valve_open_time = {}
+    flow = 0.0
+    gas_on_time = 0.0
+    last_time = timeline[0].time if timeline else 0.0
+
+    def advance(until):
+        nonlocal gas_on_time
+        elapsed = until - last_time
+        if flow > 0:
+            gas_on_time += elapsed
+        for valve, state in valves.items():
+            if state:
+                valve_open_time[valve] = valve_open_time.get(valve, 0.0) + elapsed
+
+    for publication in timeline:
+        advance(publication.time)
+        last_time = publication.time
+        if publication.topic == valve_topic:
+            for valve, state in json.loads(publication.payload).items():
+                valves[valve] = state
+                valve_open_time.setdefault(valve, 0.0)
+        elif publication.topic == flow_topic:
+            flow = float(publication.payload)
+    advance(end)
+
+    return SimulationResult(timeline, end, gas_on_time, valve_open_time)
+
+
+def simulate(recipe_cls, **inputs) -> SimulationResult:
+    """Runs a recipe on a virtual clock against a fake MQTT client.
+
+    :param recipe_cls: recipe class, e.g. REGISTRY['Platinum ALD']
+    :param inputs: recipe inputs and recipe options, the log is disabled by default
+    """
+    clock = VirtualClock()
+    client = FakeMQTTClient(clock=clock.time)
+    inputs.setdefault('log_directory', None)
+
+    recipe = recipe_cls(client, NullSignalInterface(), clock=clock, **inputs)
+    recipe()
+
+    return evaluate(client.published, clock.time(), inputs.get('chamber'))
+
+
+def format_result(result: SimulationResult) -> List[str]:
+    """Returns a human readable summary of a simulation result."""
+    def duration(seconds):
+        minutes, seconds = divmod(round(seconds, 3), 60)
+        hours, minutes = divmod(int(minutes), 60)
+        return '{}:{:02d}:{:06.3f}'.format(hours, minutes, seconds)
+
+    lines = ['duration: {}'.format(duration(result.duration)),
+             'gas on: {}'.format(duration(result.gas_on_time)),
+             'messages: {}'.format(len(result.timeline))]
+    for valve, seconds in sorted(result.valve_open_time.items()):
+        lines.append('{} open: {}'.format(valve, duration(seconds)))
+    return lines
+
+
+def timeline_to_dicts(result: SimulationResult) -> List[Dict]:
+    return [{'time': p.time, 'topic': p.topic, 'payload': p.payload.decode()} for p in result.timeline]
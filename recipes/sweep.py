@@ -0,0 +1,195 @@
+"""Parameter sweeps over the inputs of a recipe.
+
+A sweep varies some inputs of a recipe over lists or grids of values and
+runs every combination. All combinations are converted with the types of
+the declared inputs and compiled before the first run, so a typo fails the
+sweep up front instead of in the middle of the night. The variants are
+added to the job queue and run back to back by a QueueRunner; every run is
+tagged with the sweep name and its coordinates, see AbstractRecipe tags.
+"""
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from functools import lru_cache
+from itertools import product
+from typing import Dict, Iterable, List, Optional, Union
+
+# a product of axes with more points is rejected as a probable mistake
+MAX_POINTS = 1000
+
+# planned durations of variants which are kept, so editing a sweep only compiles the new variants
+DURATION_CACHE_SIZE = 4 * MAX_POINTS
+
+SweepPoint = namedtuple('SweepPoint', ['index', 'coordinates', 'inputs', 'duration'])
+SweepPoint.__doc__ = """A variant of a sweep.
+
+:param index: position of the variant in the sweep
+:param coordinates: varied input -> value of the variant
+:param inputs: all inputs of the variant
+:param duration: planned duration of the variant in seconds
+"""
+
+
+class SweepError(ValueError):
+    """Raised with all problems of a sweep definition."""
+
+    def __init__(self, errors: List[str]) -> None:
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+def parse_values(spec: str) -> List[str]:
+    """Parses the values of an axis.
+
+    '1, 2, 5' is a list, '1:2:0.25' the grid from 1 to 2 in steps of 0.25,
+    both ends included.
+    """
+    if ':' not in spec:
+        return [value.strip() for value in spec.split(',') if value.strip()]
+
+    try:
+        start, stop, step = (float(part) for part in spec.split(':'))
+    except ValueError:
+        raise SweepError(['{!r} is not a grid start:stop:step'.format(spec)])
+    if step <= 0 or stop < start:
+        raise SweepError(['grid {!r} needs a positive step and stop >= start'.format(spec)])
+    count = int((stop - start) / step + 1e-9) + 1
+    return ['{:.10g}'.format(start + index * step) for index in range(count)]
+
+
+class Sweep(object):
+    """All variants of a recipe for the product of the axes."""
+
+    def __init__(self, recipe: str, axes: Dict[str, Union[str, Iterable[str]]],
+                 fixed: Optional[Dict[str, str]] = None, name: Optional[str] = None) -> None:
+        """
+        :param recipe: name of the recipe in recipes.REGISTRY
+        :param axes: input -> values as string, see parse_values, or list of strings
+        :param fixed: input -> value as string for inputs which are not varied, the others keep their defaults
+        :param name: name of the sweep in the tags, by default recipe and time
+        :raises SweepError: with all invalid inputs, values and variants
+        """
+        self._recipe = recipe
+        self._name = name or '{}-{:%Y%m%dT%H%M%S}'.format(recipe.lower().replace(' ', '-'), datetime.now())
+        self._points = self._expand(axes, fixed or {})
+
+    def _expand(self, axes, fixed) -> List[SweepPoint]:
+        from . import REGISTRY
+
+        if self._recipe not in REGISTRY:
+            raise SweepError(['unknown recipe {!r}'.format(self._recipe)])
+        specs = REGISTRY.inputs(self._recipe)
+        errors = []
+
+        def convert(key, text):
+            try:
+                return specs[key].convert_from_string(text)
+            except ValueError:
+                errors.append('{!r} is not a valid value of {}'.format(text, key))
+
+        for key in list(axes) + list(fixed):
+            if key not in specs:
+                errors.append('{} has no input {!r}'.format(self._recipe, key))
+        if errors:
+            raise SweepError(errors)
+
+        names = list(axes)
+        axis_values = []
+        for key in names:
+            values = parse_values(axes[key]) if isinstance(axes[key], str) else list(axes[key])
+            if not values:
+                errors.append('no values for {}'.format(key))
+            axis_values.append([convert(key, value) for value in values])
+        base = OrderedDict((key, value.default) for key, value in specs.items())
+        for key, text in fixed.items():
+            base[key] = convert(key, text)
+        if errors:
+            raise SweepError(errors)
+
+        count = 1
+        for values in axis_values:
+            count *= len(values)
+        if count > MAX_POINTS:
+            raise SweepError(['{} variants, at most {} are allowed'.format(count, MAX_POINTS)])
+
+        cls = REGISTRY[self._recipe]
+        points = []
+        for index, combination in enumerate(product(*axis_values)):
+            coordinates = OrderedDict(zip(names, combination))
+            inputs = dict(base, **coordinates)
+            try:
+                duration = _planned_duration(cls, tuple(sorted(inputs.items())))
+            except Exception as error:
+                errors.append('variant {} ({}) cannot be built: {}'.format(index + 1, _format(coordinates), error))
+                continue
+            points.append(SweepPoint(index, coordinates, inputs, duration))
+        if errors:
+            raise SweepError(errors)
+        return points
+
+    @property
+    def recipe(self) -> str:
+        return self._recipe
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def points(self) -> List[SweepPoint]:
+        return list(self._points)
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def duration(self, handoff: float = 0.0) -> float:
+        """Planned tool time of the whole sweep in seconds.
+
+        :param handoff: seconds between two runs, see QueueRunner
+        """
+        return sum(point.duration for point in self._points) + handoff * max(len(self._points) - 1, 0)
+
+    def tags(self, point: SweepPoint) -> Dict[str, str]:
+        """Returns the tags of the run of a variant."""
+        tags = OrderedDict([('sweep', self._name), ('point', '{}/{}'.format(point.index + 1, len(self._points)))])
+        tags.update((key, str(value)) for key, value in point.coordinates.items())
+        return tags
+
+    def enqueue(self, queue, chamber: Optional[str] = None, options: Optional[Dict] = None) -> list:
+        """Adds all variants to a jobqueue.JobQueue, returns the jobs.
+
+        :param queue: queue of the runs
+        :param chamber: chamber on which the variants run
+        :param options: recipe options of all variants, e.g. schedule_policy
+        """
+        return [queue.add(self._recipe, dict(point.inputs, tags=self.tags(point), **(options or {})), chamber)
+                for point in self._points]
+
+
+@lru_cache(maxsize=DURATION_CACHE_SIZE)
+def _planned_duration(cls, inputs: tuple) -> float:
+    """Compiles the recipe without running it and returns the duration of its program.
+
+    :param inputs: sorted (input, value) pairs, hashable for the cache
+    """
+    from .fake import FakeMQTTClient
+    from .signals import NullSignalInterface
+
+    return cls(FakeMQTTClient(), NullSignalInterface(), log_directory=None, **dict(inputs)).program.duration
+
+
+def _format(coordinates: Dict) -> str:
+    return ', '.join('{}={}'.format(key, value) for key, value in coordinates.items())
+
+
+def format_sweep(sweep: Sweep, handoff: float = 0.0) -> List[str]:
+    """Returns a human readable list of the variants and the planned tool time."""
+    def duration(seconds):
+        minutes, seconds = divmod(int(round(seconds)), 60)
+        hours, minutes = divmod(minutes, 60)
+        return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+    lines = ['{:>4} {:>10} {}'.format(point.index + 1, duration(point.duration), _format(point.coordinates))
+             for point in sweep.points]
+    lines.append('{} variants of {}, sweep {}, planned tool time {}'.format(
+        len(sweep), sweep.recipe, sweep.name, duration(sweep.duration(handoff))))
+    return lines
@@ -0,0 +1,263 @@
+"""Sensor telemetry of the chambers.
+
+Telemetry subscribes to the sensor topics of the [TELEMETRY] section of
+config.cnf and stores every sample in a ring buffer per channel::
+
+    [TELEMETRY]
+    capacity = 65536
+    pressure = ald/sensors/pressure
+    heater = ald/sensors/heater/temperature
+
+Payloads are plain numbers. They are parsed in the network thread of the
+MQTT client and written into preallocated arrays, so receiving a sample
+allocates nothing but the float itself. Recipes, the GUI and the metrics
+exporters read the buffers without copying them.
+"""
+from array import array
+from configparser import ConfigParser
+from time import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_CAPACITY = 65536
+
+
+class RingBuffer(object):
+    """Fixed number of (timestamp, value) samples, the oldest samples are overwritten.
+
+    There is a single writer, the network thread of the MQTT client. Every
+    sample has a sequence number, the number of samples written before it,
+    so readers can fetch only the samples which arrived since their last
+    read. A reader which is slower than capacity samples misses samples,
+    but never sees a sample twice.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        if capacity < 1:
+            raise ValueError('capacity must be positive')
+        self._capacity = capacity
+        self._times = array('d', bytes(8 * capacity))
+        self._values = array('d', bytes(8 * capacity))
+        self._count = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def count(self) -> int:
+        """Number of samples written so far, the sequence number of the next sample."""
+        return self._count
+
+    def __len__(self) -> int:
+        return min(self._count, self._capacity)
+
+    def append(self, timestamp: float, value: float) -> None:
+        index = self._count % self._capacity
+        self._times[index] = timestamp
+        self._values[index] = value
+        self._count += 1
+
+    def latest(self) -> Optional[Tuple[float, float]]:
+        """Returns (timestamp, value) of the newest sample, None if there is none."""
+        count = self._count
+        if not count:
+            return None
+        index = (count - 1) % self._capacity
+        return self._times[index], self._values[index]
+
+    def segments(self, since: int = 0) -> List[Tuple[memoryview, memoryview]]:
+        """Returns the samples with a sequence number of at least since, oldest first.
+
+        The samples are returned as at most two (timestamps, values) pairs of
+        memoryviews into the buffer. They are not copied, a view is only valid
+        until the writer overwrites it, i.e. for capacity - len(view) samples.
+        """
+        count = self._count
+        first = max(since, count - self._capacity, 0)
+        if first >= count:
+            return []
+        start = first % self._capacity
+        end = start + count - first
+        times = memoryview(self._times)
+        values = memoryview(self._values)
+        if end <= self._capacity:
+            return [(times[start:end], values[start:end])]
+        end -= self._capacity
+        return [(times[start:], values[start:]), (times[:end], values[:end])]
+
+    def to_arrays(self, since: int = 0) -> Tuple[array, array]:
+        """Returns copies of the timestamps and values of segments(since)."""
+        times = array('d')
+        values = array('d')
+        for segment_times, segment_values in self.segments(since):
+            times.frombytes(segment_times.cast('B'))
+            values.frombytes(segment_values.cast('B'))
+        return times, values
+
+
+class MinMaxDecimator(object):
+    """Minimum and maximum of the samples of a ring buffer in a bounded number of time bins.
+
+    The decimator consumes the new samples of the buffer on every update, so
+    it covers the whole time since start even after the buffer wrapped. When
+    the samples do not fit into the bins anymore, neighbouring bins are
+    merged and the bin width doubles. Drawing the bins costs the same however
+    long the buffer is recorded.
+    """
+
+    def __init__(self, buffer: RingBuffer, start: float, bins: int = 1000, width: float = 0.1) -> None:
+        """
+        :param buffer: buffer whose samples are decimated
+        :param start: timestamp of the first bin, older samples are ignored
+        :param bins: maximum number of bins
+        :param width: initial width of a bin in seconds
+        """
+        self._buffer = buffer
+        self._start = start
+        self._bins = bins
+        self._width = width
+        self._since = buffer.count
+        self._minima = array('d')
+        self._maxima = array('d')
+
+    @property
+    def start(self) -> float:
+        return self._start
+
+    @property
+    def width(self) -> float:
+        return self._width
+
+    def update(self) -> None:
+        """Adds the samples which were received since the last update."""
+        nan = float('nan')
+        start = self._start
+        minima = self._minima
+        maxima = self._maxima
+        for times, values in self._buffer.segments(self._since):
+            for timestamp, value in zip(times, values):
+                if timestamp < start:
+                    continue
+                index = int((timestamp - start) / self._width)
+                while index >= self._bins:
+                    self._merge()
+                    minima = self._minima
+                    maxima = self._maxima
+                    index = int((timestamp - start) / self._width)
+                if index >= len(minima):
+                    missing = index + 1 - len(minima)
+                    minima.extend([nan] * missing)
+                    maxima.extend([nan] * missing)
+                # comparisons with nan are False, an empty bin takes the first value
+                if not value >= minima[index]:
+                    minima[index] = value
+                if not value <= maxima[index]:
+                    maxima[index] = value
+        self._since = self._buffer.count
+
+    def _merge(self) -> None:
+        minima = self._minima
+        maxima = self._maxima
+        merged_minima = array('d')
+        merged_maxima = array('d')
+        for index in range(0, len(minima), 2):
+            pair = slice(index, index + 2)
+            merged_minima.append(_nanmin(minima[pair]))
+            merged_maxima.append(_nanmax(maxima[pair]))
+        self._minima = merged_minima
+        self._maxima = merged_maxima
+        self._width *= 2
+
+    def bins(self) -> Tuple[array, array]:
+        """Returns the minima and maxima of the bins, empty bins are nan.
+
+        Bin i covers start + i * width to start + (i + 1) * width.
+        """
+        return self._minima, self._maxima
+
+
+def _nanmin(values) -> float:
+    present = [value for value in values if value == value]
+    return min(present) if present else float('nan')
+
+
+def _nanmax(values) -> float:
+    present = [value for value in values if value == value]
+    return max(present) if present else float('nan')
+
+
+class Telemetry(object):
+    """Subscribes to the sensor topics and fills a ring buffer per channel."""
+
+    def __init__(self, mqtt_client, channels: Dict[str, str], capacity: int = DEFAULT_CAPACITY,
+                 clock: Callable[[], float] = time) -> None:
+        """
+        :param mqtt_client: paho client or a client with the same interface
+        :param channels: channel name -> sensor topic
+        :param capacity: samples per channel
+        :param clock: timestamp of the received samples, the wall clock by default
+        """
+        self._mqtt_client = mqtt_client
+        self._topics = dict(channels)
+        self._buffers = {name: RingBuffer(capacity) for name in self._topics}
+        self._clock = clock
+        self._parse_errors = 0
+
+    @property
+    def channels(self) -> List[str]:
+        return list(self._topics)
+
+    @property
+    def parse_errors(self) -> int:
+        """Number of payloads which were not a number."""
+        return self._parse_errors
+
+    def channel(self, name: str) -> RingBuffer:
+        return self._buffers[name]
+
+    def latest(self, name: str) -> Optional[Tuple[float, float]]:
+        return self._buffers[name].latest()
+
+    def open(self) -> None:
+        """Subscribes to the sensor topics, call it again after a reconnect unless the client is a Publisher."""
+        for name, topic in self._topics.items():
+            self._mqtt_client.message_callback_add(topic, self._on_message(self._buffers[name]))
+            self._mqtt_client.subscribe(topic)
+
+    def close(self) -> None:
+        for topic in self._topics.values():
+            self._mqtt_client.unsubscribe(topic)
+            self._mqtt_client.message_callback_remove(topic)
+
+    def _on_message(self, buffer: RingBuffer) -> Callable:
+        append = buffer.append
+        clock = self._clock
+
+        def on_message(client, user_data, message):
+            try:
+                value = float(message.payload)
+            except ValueError:
+                self._parse_errors += 1
+                return
+            append(clock(), value)
+        return on_message
+
+    def register_metrics(self, metrics) -> None:
+        """Adds the latest value and the sample count of every channel to a metrics.Metrics registry."""
+        for name, buffer in self._buffers.items():
+            metrics.gauge('aldrun_telemetry_value', 'Latest value of the sensor channel',
+                          lambda buffer=buffer: (buffer.latest() or (0.0, float('nan')))[1], channel=name)
+            metrics.gauge('aldrun_telemetry_samples', 'Samples received on the sensor channel',
+                          lambda buffer=buffer: buffer.count, channel=name)
+        metrics.gauge('aldrun_telemetry_parse_errors', 'Sensor payloads which were not a number',
+                      lambda: self._parse_errors)
+
+
+def telemetry_from_config(mqtt_client, config: ConfigParser) -> Optional[Telemetry]:
+    """Returns the Telemetry of the [TELEMETRY] section, None if there is none."""
+    if 'TELEMETRY' not in config:
+        return None
+    section = config['TELEMETRY']
+    capacity = section.getint('capacity', DEFAULT_CAPACITY)
+    channels = {name: topic for name, topic in section.items() if name != 'capacity'}
+    return Telemetry(mqtt_client, channels, capacity)
@@ -0,0 +1,37 @@
+from threading import Timer
+
+from recipes.actuation import Acknowledger
+from recipes.fake import FakeController, FakeMQTTClient
+from recipes.program import step
+
+
+def command(client, acknowledger, valves):
+    token = acknowledger.expect(step('Pulse', valves=valves))
+    for topic, payload in step('Pulse', valves=valves).messages:
+        client.publish(topic, payload)
+    return acknowledger.confirm(token)
+
+
+def test_cancel_aborts_the_wait():
+    # no controller echoes the command
+    client = FakeMQTTClient()
+    acknowledger = Acknowledger(client, timeout=5.0)
+    acknowledger.open()
+    Timer(0.05, acknowledger.cancel).start()
+    assert command(client, acknowledger, {'V1': True}) is None
+    assert acknowledger.timeouts == 0
+
+
+def test_open_ends_the_cancel_of_the_previous_run():
+    client = FakeMQTTClient()
+    # the echo arrives after confirm started to wait
+    FakeController(client, latency=0.05)
+    acknowledger = Acknowledger(client, timeout=5.0)
+    # the previous run was stopped
+    acknowledger.open()
+    acknowledger.cancel()
+    acknowledger.close()
+
+    acknowledger.open()
+    assert command(client, acknowledger, {'V1': True}) is not None
+    assert acknowledger.latencies()['valve V1'][0] == 1
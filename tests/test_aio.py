@@ -0,0 +1,77 @@
+import asyncio
+import socket
+
+from threading import Event, Thread
+
+from recipes.aio import AsyncMQTTClient
+
+
+class ReconnectingClient(object):
+    """paho client whose first loop_misc reports a lost connection and whose reconnect blocks until released."""
+
+    def __init__(self):
+        self.sockets = socket.socketpair()
+        self.reconnecting = Event()
+        self.release = Event()
+        self.lost = True
+        # (call, True if it happened during the reconnect)
+        self.calls = []
+
+    def connect(self, host, port, keepalive):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def loop_misc(self):
+        lost, self.lost = self.lost, False
+        return 1 if lost else 0
+
+    def reconnect(self):
+        self.reconnecting.set()
+        sock = self.sockets[0]
+        self.on_socket_open(self, None, sock)
+        self.on_socket_register_write(self, None, sock)
+        self.release.wait(5)
+        self.reconnecting.clear()
+
+    def loop_read(self):
+        self.sockets[0].recv(1)
+        self.calls.append(('read', self.reconnecting.is_set()))
+
+    def loop_write(self):
+        self.calls.append(('write', self.reconnecting.is_set()))
+        self.on_socket_unregister_write(self, None, self.sockets[0])
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.calls.append(('publish', self.reconnecting.is_set()))
+
+
+def test_socket_and_publishes_wait_for_the_reconnect():
+    paho = ReconnectingClient()
+    client = AsyncMQTTClient(paho)
+    client.MISC_INTERVAL = 0.01
+
+    async def reconnect():
+        await client.connect('broker')
+        paho.sockets[1].send(b'x')
+        while not paho.reconnecting.is_set():
+            await asyncio.sleep(0.01)
+
+        publisher = Thread(target=client.publish, args=('ald/io/set', '{}'))
+        publisher.start()
+        await asyncio.sleep(0.1)
+        assert paho.calls == []
+
+        paho.release.set()
+        while len(paho.calls) < 3:
+            await asyncio.sleep(0.01)
+        publisher.join()
+        await client.disconnect()
+
+    try:
+        asyncio.run(reconnect())
+    finally:
+        for sock in paho.sockets:
+            sock.close()
+    assert sorted(paho.calls) == [('publish', False), ('read', False), ('write', False)]
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+import aldrun
+from recipes import controller
+from recipes.fake import FakeMQTTClient
+from recipes.jobqueue import DONE, FAILED, JobQueue
+
+INPUTS = ['--n', '2', '--close_wait', '0.01', '--oxygen_wait', '0.01']
+
+
+class FailingClient(FakeMQTTClient):
+    """Raises from the publish of the given topic."""
+
+    def __init__(self, topic):
+        super().__init__()
+        self.topic = topic
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if topic == self.topic:
+            raise RuntimeError('broken client')
+        return super().publish(topic, payload, qos, retain)
+
+
+def rejecting_controller(client):
+    """Answers every uploaded program with an error event."""
+    def reject(client, user_data, message):
+        run_id = controller.decode_program(message.payload)[0]
+        client.publish(controller.PROGRAM_EVENT_TOPIC, controller.encode_event(run_id, controller.ERROR,
+                                                                              message='no program memory'))
+    client.subscribe(controller.PROGRAM_TOPIC)
+    client.message_callback_add(controller.PROGRAM_TOPIC, reject)
+    return client
+
+
+@pytest.fixture
+def broker(tmp_path, monkeypatch):
+    """Replaces the broker connection of aldrun by the client which the test sets."""
+    monkeypatch.chdir(tmp_path)
+    with open('config.cnf', 'w') as file:
+        file.write('[MQTT]\n')
+    clients = [FakeMQTTClient()]
+    monkeypatch.setattr(aldrun, 'connect', lambda config: clients[0])
+    monkeypatch.setattr(aldrun, 'disconnect', lambda client: None)
+    return clients
+
+
+def test_completed_run_exits_with_0(broker):
+    assert aldrun.main(['run', 'Oxygen On Off'] + INPUTS) == 0
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_failed_run_exits_with_1(broker, capsys):
+    broker[0] = FailingClient('ald/flow/set')
+    assert aldrun.main(['run', 'Oxygen On Off'] + INPUTS) == 1
+    assert 'broken client' in capsys.readouterr().err
+
+
+def test_run_stopped_by_a_silent_controller_exits_with_1(broker, capsys):
+    broker[0] = rejecting_controller(FakeMQTTClient())
+    assert aldrun.main(['run', 'Oxygen On Off', '--controller-timed'] + INPUTS) == 1
+    assert 'controller error: no program memory' in capsys.readouterr().err
+
+
+def test_stopped_run_exits_with_3(broker):
+    client = broker[0]
+    client.subscribe('ald/io/set')
+    client.message_callback_add('ald/io/set', lambda client, user_data, message: client.publish(
+        'ald/recipes/oxygen_on_off/cmd', b'stop'))
+    assert aldrun.main(['run', 'Oxygen On Off'] + INPUTS) == aldrun.EXIT_STOPPED
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_queue_exits_with_1_when_a_job_fails(broker):
+    queue = JobQueue('queue.json')
+    for flow in (10.0, 20.0):
+        queue.add('Oxygen On Off', {'n': 1, 'close_wait': 0.01, 'oxygen_wait': 0.01, 'flow': flow})
+    assert aldrun.main(['queue', 'run', '--json']) == 0
+    assert [job.state for job in JobQueue('queue.json').jobs()] == [DONE, DONE]
+
+    queue = JobQueue('queue.json')
+    queue.add('Oxygen On Off', {'n': 1, 'close_wait': 0.01, 'oxygen_wait': 0.01})
+    broker[0] = FailingClient('ald/flow/set')
+    assert aldrun.main(['queue', 'run', '--json']) == 1
+    assert JobQueue('queue.json').jobs()[-1].state == FAILED
+    # the failed recipe thread reports its exception when it ends
+    for thread in threading.enumerate():
+        if thread.name.startswith('recipe-'):
+            thread.join()
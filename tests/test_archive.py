@@ -0,0 +1,90 @@
+import errno
+import json
+import os
+
+from array import array
+
+import pytest
+
+from recipes.archive import Archive, ArchiveWriter
+from recipes.program import Program, step
+
+OPEN = step('Open oxygen', 1.0, {'oxygen': True, 'purge': False}, flow=10.0)
+CLOSE = step('Close oxygen', 1.0, {'oxygen': False})
+PROGRAM = Program([OPEN, CLOSE], 2, teardown=[step('Close all valves', valves={'oxygen': False, 'purge': False})])
+
+
+class FullDisk(object):
+    """Column file whose writes fail."""
+
+    closed = False
+
+    def write(self, data):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def read_column(path, name, type_code):
+    column = array(type_code)
+    with open(os.path.join(path, name), 'rb') as file:
+        column.frombytes(file.read())
+    return list(column)
+
+
+def write_archive(directory, fail_after=None):
+    writer = ArchiveWriter(str(directory), 'Oxygen On Off', {'n': 2})
+    writer.open(PROGRAM, 1000.0)
+    for cycle in range(2):
+        if cycle == fail_after:
+            writer._files['cycle'] = FullDisk()
+        writer.record(2.0 * cycle, OPEN, cycle)
+        writer.record(2.0 * cycle + 1.0, CLOSE, cycle)
+        writer.flush()
+    writer.close()
+    return writer
+
+
+def test_columns_and_meta_are_written(tmp_path):
+    writer = write_archive(tmp_path)
+    assert writer.error is None
+
+    with open(os.path.join(writer.path, 'meta.json')) as file:
+        meta = json.load(file)
+    assert (meta['rows'], meta['complete'], meta['steps']) == (4, True, ['Open oxygen', 'Close oxygen',
+                                                                          'Close all valves'])
+    assert read_column(writer.path, 'time.f8', 'd') == [0.0, 1.0, 2.0, 3.0]
+    assert read_column(writer.path, 'step.u2', 'H') == [0, 1, 0, 1]
+    assert read_column(writer.path, 'cycle.i4', 'i') == [0, 0, 1, 1]
+    # bit 0 is oxygen, bit 1 is purge
+    assert read_column(writer.path, 'valves.u8', 'Q') == [1, 0, 1, 0]
+    assert read_column(writer.path, 'flow.f8', 'd') == [10.0] * 4
+
+
+def test_write_error_is_recorded_with_the_complete_rows(tmp_path):
+    writer = write_archive(tmp_path, fail_after=1)
+    assert writer.error.errno == errno.ENOSPC
+
+    with open(os.path.join(writer.path, 'meta.json')) as file:
+        meta = json.load(file)
+    assert (meta['rows'], meta['complete']) == (2, False)
+    assert 'No space left on device' in meta['error']
+    # the columns before the failed one got the rows of the second cycle
+    assert len(read_column(writer.path, 'time.f8', 'd')) == 4
+    assert len(read_column(writer.path, 'cycle.i4', 'i')) == 2
+
+
+def test_reader_returns_the_complete_rows(tmp_path):
+    pytest.importorskip('numpy')
+    writer = write_archive(tmp_path, fail_after=1)
+
+    archive = Archive(writer.path)
+    assert len(archive) == 2
+    assert not archive.complete
+    assert 'No space left on device' in archive.error
+    assert list(archive.column('time')) == [0.0, 1.0]
+    assert list(archive.valve('oxygen')) == [True, False]
@@ -0,0 +1,43 @@
+import textwrap
+
+from recipes.catalog import Catalog
+
+RECIPE_MODULE = '''
+from recipes.program import Program, step
+from recipes.recipe import AbstractRecipe, register
+
+
+@register('Catalog Test Recipe')
+class CatalogTestRecipe(AbstractRecipe):
+    def __init__(self, mqtt_client, signal_interface, **options):
+        super().__init__(mqtt_client, signal_interface, **options)
+        self._program = Program([step('Wait', 1.0)], loops=1)
+
+    @staticmethod
+    def inputs():
+        return {}
+'''
+
+ENGINE_MODULE = '''
+"""Helper of the engine, e.g. a decorator documented as
+
+    @register('My Recipe')
+"""
+raise ImportError('engine modules are not imported by the catalog')
+'''
+
+
+def test_only_modules_which_register_recipes_are_imported(tmp_path, monkeypatch):
+    package = tmp_path / 'catalog_test_recipes'
+    package.mkdir()
+    (package / '__init__.py').write_text('')
+    (package / 'test_recipe.py').write_text(textwrap.dedent(RECIPE_MODULE))
+    (package / 'helper.py').write_text(textwrap.dedent(ENGINE_MODULE))
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    catalog = Catalog(str(package), 'catalog_test_recipes')
+    assert list(catalog) == ['Catalog Test Recipe']
+    assert catalog['Catalog Test Recipe'].__name__ == 'CatalogTestRecipe'
+
+    # the index keeps the helper without importing it again
+    assert list(Catalog(str(package), 'catalog_test_recipes')) == ['Catalog Test Recipe']
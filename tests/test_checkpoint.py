@@ -0,0 +1,73 @@
+import errno
+
+from threading import Event
+
+import pytest
+
+from recipes import checkpoint
+from recipes.checkpoint import CheckpointFile
+
+
+def test_saved_state_is_read_back(tmp_path):
+    path = checkpoint.checkpoint_path(str(tmp_path / 'checkpoints'), 'left')
+    file = CheckpointFile(path, 'Oxygen On Off', {'n': 5}, 'left')
+    file.save(2, 5)
+    file.close()
+
+    saved = checkpoint.load(path)
+    assert (saved.recipe, saved.inputs, saved.chamber, saved.cycle, saved.loops, saved.stopped) == (
+        'Oxygen On Off', {'n': 5}, 'left', 2, 5, False)
+    assert checkpoint.pending(str(tmp_path / 'checkpoints')) == [saved]
+
+
+def test_only_the_latest_pending_state_is_written(tmp_path):
+    file = CheckpointFile(str(tmp_path / 'default.json'), 'Oxygen On Off', {})
+    written = []
+    release = Event()
+    write = file._write
+
+    def slow_write(data):
+        release.wait(5)
+        written.append(data['cycle'])
+        write(data)
+    file._write = slow_write
+
+    for cycle in range(4):
+        # returns at once although the writer is blocked
+        file.save(cycle, 10)
+    release.set()
+    file.close()
+
+    assert written[-1] == 3
+    assert len(written) <= 2
+    assert checkpoint.load(file.path).cycle == 3
+
+
+def test_write_error_is_raised_by_the_next_save(tmp_path):
+    file = CheckpointFile(str(tmp_path / 'default.json'), 'Oxygen On Off', {})
+
+    def full_disk(data):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+    file._write = full_disk
+
+    file.save(0, 10)
+    with pytest.raises(OSError):
+        file.flush()
+    file.save(1, 10)
+    with pytest.raises(OSError):
+        file.close()
+
+
+def test_stopped_checkpoint_is_not_pending_and_removed_one_is_not_marked(tmp_path):
+    directory = str(tmp_path)
+    file = CheckpointFile(checkpoint.checkpoint_path(directory, None), 'Oxygen On Off', {})
+    file.save(3, 10)
+    file.mark_stopped()
+    file.flush()
+    assert checkpoint.load(file.path).stopped
+    assert checkpoint.pending(directory) == []
+
+    file.remove()
+    file.mark_stopped()
+    file.close()
+    assert checkpoint.load(file.path) is None
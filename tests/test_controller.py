@@ -0,0 +1,92 @@
+from recipes import REGISTRY, controller
+from recipes.fake import FakeMQTTClient, FakeProgramController
+from recipes.program import VALVE_TOPIC
+from recipes.signals import NullSignalInterface
+
+INPUTS = {'n': 3, 'close_wait': 0.01, 'oxygen_wait': 0.02, 'flow': 10.0}
+CYCLE = ['Close center', 'Open oxygen']
+
+
+class Progress(NullSignalInterface):
+    """Records the cycles and stops the recipe when a cycle starts."""
+
+    def __init__(self, stop_at=None):
+        self.stop_at = stop_at
+        self.recipe = None
+        self.cycles = []
+
+    def emit_update_process_value(self, value):
+        self.cycles.append(value)
+        if value == self.stop_at:
+            self.recipe.stop()
+
+
+def build(client, signal_interface, **options):
+    options = dict(INPUTS, **dict({'log_directory': None, 'controller_timed': True}, **options))
+    recipe = REGISTRY['Oxygen On Off'](client, signal_interface, **options)
+    signal_interface.recipe = recipe
+    return recipe
+
+
+def events(client):
+    return [controller.decode_event(publication.payload).event for publication in client.published
+            if publication.topic == controller.PROGRAM_EVENT_TOPIC]
+
+
+def test_program_runs_on_the_controller_until_done():
+    client = FakeMQTTClient()
+    fake = FakeProgramController(client)
+    progress = Progress()
+    recipe = build(client, progress)
+    recipe()
+    fake.join(5)
+
+    assert not recipe.stopped
+    assert recipe.failed is None
+    assert events(client)[0] == controller.ACCEPTED and events(client)[-1] == controller.DONE
+    assert [name for time, name in fake.executed] == CYCLE * 3 + ['Close all valves']
+    # accepted, the three cycles and the teardown
+    assert progress.cycles == [0, 0, 1, 2, 3]
+    # the steps are applied by the controller, not published from here
+    assert VALVE_TOPIC not in [publication.topic for publication in client.published]
+
+
+def test_stop_skips_the_remaining_cycles_on_the_controller():
+    client = FakeMQTTClient()
+    fake = FakeProgramController(client)
+    progress = Progress(stop_at=1)
+    recipe = build(client, progress, n=50)
+    recipe()
+    fake.join(5)
+
+    assert recipe.stopped
+    assert recipe.failed is None
+    assert events(client)[-1] == controller.STOPPED
+    names = [name for time, name in fake.executed]
+    assert names[-1] == 'Close all valves'
+    assert len(names) < 50 * len(CYCLE)
+
+
+def test_silent_controller_stops_the_run_and_tears_down_locally():
+    client = FakeMQTTClient()
+    recipe = build(client, Progress(), controller_timeout=0.05)
+    recipe()
+
+    assert recipe.stopped
+    assert recipe.failed.startswith('controller did not report')
+    topics = [publication.topic for publication in client.published]
+    assert topics[0] == controller.PROGRAM_TOPIC
+    assert topics[-1] == 'ald/io/closeall'
+
+
+def test_resumed_program_starts_with_the_teardown():
+    client = FakeMQTTClient()
+    fake = FakeProgramController(client)
+    progress = Progress()
+    recipe = build(client, progress, start_cycle=1)
+    recipe()
+    fake.join(5)
+
+    assert recipe.failed is None
+    assert [name for time, name in fake.executed] == ['Close all valves'] + CYCLE * 2 + ['Close all valves']
+    assert progress.cycles == [1, 1, 2, 3]
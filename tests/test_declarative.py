@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from recipes import declarative
+from recipes.declarative import RecipeFileError, bind, load_template
+
+RECIPE = '''
+name = "Test Purge"
+valves = ["purge", "oxygen"]
+loops = "n"
+
+[inputs.n]
+type = "int"
+default = 3
+
+[inputs.purge_wait]
+default = 2
+
+[[cycle]]
+name = "Purge"
+duration = "purge_wait"
+open = ["purge"]
+flow = 10
+
+[[teardown]]
+name = "Close all valves"
+open = []
+'''
+
+
+def write(tmp_path, content, name='recipe.toml'):
+    path = tmp_path / name
+    path.write_text(content)
+    return str(path)
+
+
+def test_template_is_compiled_and_bound(tmp_path):
+    template = load_template(write(tmp_path, RECIPE))
+    program = bind(template, {'n': 4, 'purge_wait': 1.5})
+
+    assert program.loops == 4
+    step, = program.cycle
+    assert step.duration == 1.5
+    assert dict(step.valves) == {'purge': True, 'oxygen': False}
+
+
+def test_template_is_read_from_the_cache(tmp_path, monkeypatch):
+    path = write(tmp_path, RECIPE)
+    template = load_template(path)
+    cached, = os.listdir(str(tmp_path / declarative.CACHE_DIRECTORY))
+    assert cached.startswith('recipe-')
+
+    def parse(path, content):
+        raise AssertionError('the file was parsed again')
+    monkeypatch.setattr(declarative, '_parse', parse)
+    assert load_template(path) == template
+
+    # a changed file is compiled again
+    write(tmp_path, RECIPE.replace('default = 3', 'default = 5'))
+    with pytest.raises(AssertionError):
+        load_template(path)
+
+
+@pytest.mark.parametrize('change, message', [
+    (('loops = "n"', 'loops = "n"\nloop = 3'), "the recipe has unknown keys ['loop']"),
+    (('flow = 10', 'flow = 10\nduraton = 3'), "cycle[0] has unknown keys ['duraton']"),
+    (('default = 3', 'default = 3\nunit = "s"'), "input 'n' has unknown keys ['unit']"),
+    (('duration = "purge_wait"', 'duration = -1'), 'cycle[0].duration must not be negative'),
+    (('open = ["purge"]', 'open = "purge"'), 'cycle[0].open must be a list of valve names'),
+    (('valves = ["purge", "oxygen"]', 'valves = "purge"'), 'valves must be a list of valve names'),
+    (('default = 3', 'default = "many"'), "input 'n' has an invalid default"),
+    (('flow = 10', 'flow = 10\nmessages = ["ald/io/closeall"]'),
+     'cycle[0].messages must be a list of [topic, payload] pairs'),
+])
+def test_invalid_files_are_rejected(tmp_path, change, message):
+    path = write(tmp_path, RECIPE.replace(*change))
+    with pytest.raises(RecipeFileError) as error:
+        load_template(path)
+    assert str(error.value).startswith(path + ': ' + message)
+
+
+def test_negative_duration_from_an_input_is_rejected(tmp_path):
+    template = load_template(write(tmp_path, RECIPE))
+    with pytest.raises(ValueError):
+        bind(template, {'n': 3, 'purge_wait': -1.0})
@@ -0,0 +1,61 @@
+from recipes.logindex import parse_log
+
+
+def write_log(path, lines):
+    with open(path, 'w') as file:
+        for second, (marker, text) in enumerate(lines):
+            file.write('2026-10-18T10:00:{:02d}{} - {}\n'.format(second, marker, text))
+
+
+def test_engine_messages_are_events_and_not_steps(tmp_path):
+    path = str(tmp_path / '2026-10-18T10-00-oxygen.log')
+    write_log(path, [('', 'run of oxygen on chamber default'),
+                     (' #1 cycle', 'starting CYCLE 1'),
+                     (' #1 step', 'Open oxygen'),
+                     (' #1 event', 'broker disconnected, run paused'),
+                     (' #1 event', 'broker reconnected, run continues after a pause of 1.0 s'),
+                     (' #1 step', 'Close oxygen'),
+                     (' #1 event', 'command to ald/io/set not published (rc 15)'),
+                     (' #2 cycle', 'starting CYCLE 2')])
+
+    run, = parse_log(path)
+    assert list(run.steps) == ['Open oxygen', 'Close oxygen']
+    assert run.steps['Open oxygen'][1] == 3.0
+    assert [text.split(',')[0] for time, text in run.events] == [
+        'broker disconnected', 'broker reconnected', 'command to ald/io/set not published (rc 15)']
+
+
+def test_controller_and_archive_messages_are_events(tmp_path):
+    path = str(tmp_path / '2026-10-18T10-00-oxygen.log')
+    write_log(path, [('', 'run of oxygen on chamber default'),
+                     (' event', 'program 0123abcd uploaded to the controller'),
+                     (' #1 cycle', 'starting CYCLE 1'),
+                     (' #1 step', 'Open oxygen'),
+                     (' #1 event', 'controller did not report for 2.5 s'),
+                     (' #1 stop', 'recipe stopped'),
+                     (' #1 step', 'Close all valves'),
+                     (' #1', 'aldrun_cycle: 1'),
+                     (' #1 event', 'archive not written: disk full')])
+
+    run, = parse_log(path)
+    assert list(run.steps) == ['Open oxygen', 'Close all valves']
+    assert run.stopped
+    assert len(run.events) == 4
+
+
+def test_lines_are_read_by_their_kind_and_not_by_their_text(tmp_path):
+    path = str(tmp_path / '2026-10-18T10-00-oxygen.log')
+    write_log(path, [('', 'run of oxygen on chamber default'),
+                     (' resume', 'resuming with CYCLE 3, driving valves to safe state'),
+                     (' #3 cycle', 'starting CYCLE 3'),
+                     (' #3 step', 'program the heater'),
+                     (' #3 event', 'heater did not respond'),
+                     (' #3 step', 'recipe stopped the purge'),
+                     (' #3', 'actuation timeouts: 0')])
+
+    run, = parse_log(path)
+    assert run.resumed and not run.stopped
+    assert run.cycles == 1
+    assert list(run.steps) == ['program the heater', 'recipe stopped the purge']
+    assert [text for time, text in run.events] == ['resuming with CYCLE 3, driving valves to safe state',
+                                                   'heater did not respond']
@@ -0,0 +1,66 @@
+from threading import Thread
+
+from recipes.metrics import Metrics
+
+
+def test_render():
+    metrics = Metrics()
+    metrics.counter('aldrun_steps_total', 'Executed steps', chamber='a').inc(2)
+    metrics.gauge('aldrun_cycle', 'Current cycle', lambda: 3)
+    histogram = metrics.histogram('aldrun_lateness_seconds', 'Lateness of the steps', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert metrics.render().splitlines() == [
+        '# HELP aldrun_steps_total Executed steps',
+        '# TYPE aldrun_steps_total counter',
+        'aldrun_steps_total{chamber="a"} 2.0',
+        '# HELP aldrun_cycle Current cycle',
+        '# TYPE aldrun_cycle gauge',
+        'aldrun_cycle 3.0',
+        '# HELP aldrun_lateness_seconds Lateness of the steps',
+        '# TYPE aldrun_lateness_seconds histogram',
+        'aldrun_lateness_seconds_bucket{le="0.1"} 1',
+        'aldrun_lateness_seconds_bucket{le="1.0"} 2',
+        'aldrun_lateness_seconds_bucket{le="+Inf"} 3',
+        'aldrun_lateness_seconds_sum 2.55',
+        'aldrun_lateness_seconds_count 3',
+    ]
+
+
+def test_summary_skips_empty_histograms():
+    metrics = Metrics()
+    metrics.counter('aldrun_steps_total', 'Executed steps').inc()
+    metrics.histogram('aldrun_stop_seconds', 'Stop latency')
+    histogram = metrics.histogram('aldrun_lateness_seconds', 'Lateness of the steps', buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+
+    assert metrics.summary() == [
+        'aldrun_steps_total: 1',
+        'aldrun_lateness_seconds: n=2 mean=0.275 p95<=1 max=0.5',
+    ]
+
+
+def test_concurrent_updates_are_not_lost():
+    metrics = Metrics()
+    counter = metrics.counter('aldrun_steps_total', 'Executed steps')
+    histogram = metrics.histogram('aldrun_lateness_seconds', 'Lateness of the steps')
+
+    def update():
+        for _ in range(10000):
+            counter.inc()
+            histogram.observe(0.001)
+
+    threads = [Thread(target=update) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    # rendering while the metrics change sees consistent histograms
+    while any(thread.is_alive() for thread in threads):
+        lines = metrics.render().splitlines()
+        assert lines[-1].split()[-1] == lines[-3].split()[-1]
+    for thread in threads:
+        thread.join()
+
+    assert counter.value == 40000
+    assert histogram.count == sum(histogram.counts) == 40000
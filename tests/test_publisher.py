@@ -0,0 +1,99 @@
+import json
+
+from recipes.fake import FakeMQTTClient
+from recipes.publisher import DELIVERED, DROPPED, MQTT_ERR_QUEUE_SIZE, QUEUED, REPLAY_LATEST, SUPERSEDED, Publisher
+
+
+def payloads(client):
+    return [(publication.topic, publication.payload) for publication in client.published]
+
+
+def test_messages_are_delivered_while_connected():
+    client = FakeMQTTClient()
+    publisher = Publisher(client)
+
+    delivery = publisher.publish('a', '1')
+    assert delivery.status == DELIVERED
+    assert delivery.rc == 0
+    assert payloads(client) == [('a', b'1')]
+    assert publisher.flush(0)
+
+
+def test_outage_queues_and_replays_all_messages_in_order():
+    client = FakeMQTTClient()
+    publisher = Publisher(client)
+    client.set_connected(False)
+
+    deliveries = [publisher.publish('a', '1'), publisher.publish('b', '2'), publisher.publish('a', '3')]
+    assert [delivery.status for delivery in deliveries] == [QUEUED] * 3
+    assert client.published == []
+    assert not publisher.flush(0)
+
+    client.set_connected(True)
+    assert payloads(client) == [('a', b'1'), ('b', b'2'), ('a', b'3')]
+    assert [delivery.status for delivery in deliveries] == [DELIVERED] * 3
+    assert publisher.connections == 2
+
+
+def test_replay_latest_supersedes_older_messages_of_a_topic():
+    client = FakeMQTTClient()
+    publisher = Publisher(client, replay=REPLAY_LATEST)
+    client.set_connected(False)
+
+    deliveries = [publisher.publish('a', '1'), publisher.publish('b', '2'), publisher.publish('a', '3')]
+    client.set_connected(True)
+    assert payloads(client) == [('b', b'2'), ('a', b'3')]
+    assert [delivery.status for delivery in deliveries] == [SUPERSEDED, DELIVERED, DELIVERED]
+
+
+def test_replay_latest_merges_disjoint_valve_deltas():
+    client = FakeMQTTClient()
+    publisher = Publisher(client, replay=REPLAY_LATEST)
+    client.set_connected(False)
+
+    older = publisher.publish('ald/left/io/set', '{"oxygen": true, "purge": false}')
+    newer = publisher.publish('ald/left/io/set', '{"platinum": true, "oxygen": false}')
+    publisher.publish('ald/left/flow/set', '5.0')
+    publisher.publish('ald/left/flow/set', '7.0')
+    client.set_connected(True)
+
+    (valve_topic, valves), flow = payloads(client)
+    assert valve_topic == 'ald/left/io/set'
+    assert json.loads(valves) == {'oxygen': False, 'purge': False, 'platinum': True}
+    assert flow == ('ald/left/flow/set', b'7.0')
+    assert (older.status, newer.status) == (SUPERSEDED, DELIVERED)
+
+
+def test_full_queue_drops_messages():
+    client = FakeMQTTClient()
+    publisher = Publisher(client, queue_size=2)
+    client.set_connected(False)
+
+    deliveries = [publisher.publish('a', str(number)) for number in range(3)]
+    assert deliveries[-1].status == DROPPED
+    assert deliveries[-1].rc == MQTT_ERR_QUEUE_SIZE
+    assert publisher.dropped == 1
+
+
+def test_subscriptions_are_restored_after_a_reconnect():
+    client = FakeMQTTClient()
+    publisher = Publisher(client)
+    received = []
+    publisher.subscribe('sensors/#')
+    publisher.message_callback_add('sensors/#', lambda client, user_data, message: received.append(message))
+
+    client.set_connected(False)
+    client.set_connected(True)
+    client.publish('sensors/pressure', '1.0')
+    assert len(received) == 1
+    assert client._subscriptions == {'sensors/#'}
+
+
+def test_confirmations_of_other_publishers_are_not_kept():
+    client = FakeMQTTClient()
+    publisher = Publisher(client)
+
+    for number in range(100):
+        client.publish('echo', str(number))
+    assert publisher.publish('a', '1').status == DELIVERED
+    assert publisher._early_confirmations == set()
@@ -0,0 +1,154 @@
+import json
+
+import pytest
+
+from recipes import REGISTRY
+from recipes.fake import FakeMQTTClient
+from recipes.program import FLOW_TOPIC, VALVE_TOPIC, Program, step
+from recipes.recipe import AbstractRecipe
+from recipes.signals import NullSignalInterface
+from recipes.simulation import VirtualClock
+
+INPUTS = {'n': 5, 'close_wait': 1.0, 'oxygen_wait': 2.0, 'flow': 10.0}
+
+
+class CycleSignalInterface(NullSignalInterface):
+    """Calls a function with the recipe when a cycle starts."""
+
+    def __init__(self, cycle, function):
+        self.cycle = cycle
+        self.function = function
+        self.recipe = None
+
+    def emit_update_process_value(self, value):
+        if value == self.cycle:
+            self.function(self.recipe)
+
+
+def build(signal_interface=None, **options):
+    clock = VirtualClock()
+    client = FakeMQTTClient(clock.time)
+    options = dict(INPUTS, **dict({'log_directory': None}, **options))
+    recipe = REGISTRY['Oxygen On Off'](client, signal_interface or NullSignalInterface(), clock=clock, **options)
+    if signal_interface is not None:
+        signal_interface.recipe = recipe
+    return recipe, client
+
+
+def test_stop_publishes_the_safe_state_at_once():
+    recipe, client = build(CycleSignalInterface(2, lambda recipe: recipe.stop()))
+    recipe()
+
+    assert recipe.stopped
+    topics = [publication.topic for publication in client.published]
+    # safe state from stop(), then the teardown, no step of the stopped cycle
+    assert topics[-2:] == ['ald/io/closeall', 'ald/io/closeall']
+    assert client.published[-2].time == 2 * 3.0
+
+
+def test_stop_before_the_start_only_executes_the_teardown():
+    recipe, client = build()
+    recipe.stop()
+    recipe()
+
+    assert recipe.stopped
+    assert [publication.topic for publication in client.published] == ['ald/io/closeall']
+
+
+def test_failed_run_publishes_the_safe_state():
+    def fail(recipe):
+        raise RuntimeError('sensor lost')
+
+    recipe, client = build(CycleSignalInterface(2, fail))
+    with pytest.raises(RuntimeError):
+        recipe()
+
+    assert recipe.stopped
+    assert client.published[-1].topic == 'ald/io/closeall'
+
+
+class TwoValves(AbstractRecipe):
+    """Valve b and the flow never change within the cycles."""
+
+    def __init__(self, mqtt_client, signal_interface, **options):
+        super().__init__(mqtt_client, signal_interface, **options)
+        self._program = Program([step('Open a', 1.0, {'a': True, 'b': False}, 5.0),
+                                 step('Close a', 1.0, {'a': False, 'b': False}, 5.0)],
+                                loops=4, teardown=[step('Off', 0.0, {'a': False, 'b': False}, 0.0)])
+
+    @staticmethod
+    def inputs():
+        return {}
+
+
+def valve_commands(client, start, end):
+    return [json.loads(publication.payload) for publication in client.published
+            if publication.topic == VALVE_TOPIC and start <= publication.time < end]
+
+
+def build_two_valves(signal_interface=None, **options):
+    clock = VirtualClock()
+    client = FakeMQTTClient(clock.time)
+    recipe = TwoValves(client, signal_interface or NullSignalInterface(), clock=clock, log_directory=None, **options)
+    if signal_interface is not None:
+        signal_interface.recipe = recipe
+    return recipe, client
+
+
+def test_delta_publishing_sends_changes_only():
+    recipe, client = build_two_valves(resync_interval=0)
+    recipe()
+
+    assert valve_commands(client, 0.0, 2.0) == [{'a': True, 'b': False}, {'a': False}]
+    assert valve_commands(client, 2.0, 8.0) == [{'a': True}, {'a': False}] * 3
+    assert len([publication for publication in client.published if publication.topic == FLOW_TOPIC]) == 2
+
+
+def test_resync_interval_publishes_the_complete_state():
+    recipe, client = build_two_valves(resync_interval=2)
+    recipe()
+
+    assert valve_commands(client, 4.0, 6.0) == [{'a': True, 'b': False}, {'a': False, 'b': False}]
+    assert valve_commands(client, 6.0, 8.0) == [{'a': True}, {'a': False}]
+
+
+def test_publish_error_resyncs_the_next_cycle():
+    clients = []
+
+    class Outage(NullSignalInterface):
+        def emit_update_process_value(self, value):
+            if value in (1, 2):
+                clients[0].set_connected(value == 2)
+
+    recipe, client = build_two_valves(Outage(), resync_interval=0)
+    clients.append(client)
+    recipe()
+
+    assert valve_commands(client, 2.0, 4.0) == []
+    assert valve_commands(client, 4.0, 6.0) == [{'a': True, 'b': False}, {'a': False, 'b': False}]
+    assert valve_commands(client, 6.0, 8.0) == [{'a': True}, {'a': False}]
+
+
+def test_failed_begin_is_undone(tmp_path):
+    import socket
+
+    class Finished(NullSignalInterface):
+        finished = False
+
+        def emit_finished(self):
+            self.finished = True
+
+    with socket.socket() as blocker:
+        blocker.bind(('127.0.0.1', 0))
+        blocker.listen()
+        signal_interface = Finished()
+        recipe, client = build(signal_interface, log_directory=str(tmp_path),
+                               metrics_port=blocker.getsockname()[1])
+        with pytest.raises(OSError):
+            recipe()
+
+    assert signal_interface.finished
+    assert client._callbacks == {}
+    assert recipe.failed is not None
+    log, = tmp_path.glob('*.log')
+    assert 'run failed: ' in log.read_text().splitlines()[-2]
@@ -0,0 +1,68 @@
+import errno
+import re
+
+from recipes.runlog import STEP, RunLogger
+from recipes.simulation import VirtualClock
+
+
+class FullDisk(object):
+    """File whose writes fail until space is freed."""
+
+    def __init__(self, file):
+        self.file = file
+        self.full = True
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def write(self, text):
+        if self.full:
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        return self.file.write(text)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def test_lines_carry_the_time_the_cycle_and_the_kind(tmp_path):
+    path = str(tmp_path / 'run.log')
+    logger = RunLogger(path, clock=VirtualClock().time)
+    logger.open()
+    logger.log('run of oxygen on chamber default')
+    logger.log('Open oxygen', 2, STEP)
+    logger.stop()
+
+    with open(path) as file:
+        lines = file.read().splitlines()
+    stamp = r'\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?'
+    assert re.fullmatch(stamp + r' - run of oxygen on chamber default', lines[0])
+    assert re.fullmatch(stamp + r' #3 step - Open oxygen', lines[1])
+    assert lines[2].endswith(' - logger: 2 events written, 0 dropped, 0 delayed')
+
+
+def test_a_failed_write_is_counted_and_reported(tmp_path):
+    path = str(tmp_path / 'run.log')
+    logger = RunLogger(path, clock=VirtualClock().time)
+    logger.open()
+    disk = logger._file = FullDisk(logger._file)
+
+    logger.log('Open oxygen', 0)
+    logger.log('Close oxygen', 0)
+    logger.flush()
+    assert logger.lost == 2
+    assert logger.error.errno == errno.ENOSPC
+
+    disk.full = False
+    logger.log('Close all valves')
+    logger.stop()
+
+    with open(path) as file:
+        lines = file.read().splitlines()
+    assert len(lines) == 2
+    assert lines[0].endswith(' - Close all valves')
+    assert lines[1].endswith(' - logger: 1 events written, 0 dropped, 0 delayed, 2 lost: '
+                             '[Errno 28] No space left on device')
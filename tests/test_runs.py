@@ -0,0 +1,129 @@
+import json
+import os
+
+import pytest
+
+from recipes import checkpoint
+from recipes.fake import FakeMQTTClient
+from recipes.runs import RunManager
+from recipes.signals import NullSignalInterface
+from recipes.simulation import VirtualClock
+
+INPUTS = {'n': 5, 'close_wait': 1.0, 'oxygen_wait': 2.0, 'flow': 10.0}
+
+
+class StopAtCycle(NullSignalInterface):
+    def __init__(self, cycle):
+        self.cycle = cycle
+        self.run = None
+
+    def emit_update_process_value(self, value):
+        if value == self.cycle:
+            self.run.stop()
+
+
+def test_checkpoint_and_archive_of_a_stopped_and_resumed_run(tmp_path):
+    clock = VirtualClock()
+    client = FakeMQTTClient(clock.time)
+    manager = RunManager(client, checkpoint_directory=str(tmp_path / 'checkpoints'),
+                         archive_directory=str(tmp_path / 'archives'))
+
+    signal_interface = StopAtCycle(2)
+    run = manager.prepare(None, 'Oxygen On Off', signal_interface, clock=clock, log_directory=None, **INPUTS)
+    signal_interface.run = run
+    manager.start_prepared(run)
+    assert run.join(5)
+    assert run.recipe.stopped
+    assert client.published[-1].topic == 'ald/io/closeall'
+
+    # a run stopped by the operator is not offered for a resume, but it can be resumed explicitly
+    assert checkpoint.pending(str(tmp_path / 'checkpoints')) == []
+    saved = checkpoint.load(checkpoint.checkpoint_path(str(tmp_path / 'checkpoints'), None))
+    assert saved.stopped
+    assert saved.cycle == 2
+    assert saved.inputs == dict(INPUTS, log_directory=None)
+
+    resumed = manager.resume(saved, NullSignalInterface(), clock=clock)
+    assert resumed.join(5)
+    assert not resumed.recipe.stopped
+    assert checkpoint.pending(str(tmp_path / 'checkpoints')) == []
+
+    archives = sorted(os.listdir(str(tmp_path / 'archives')))
+    assert len(archives) == 2
+    with open(os.path.join(str(tmp_path / 'archives'), archives[0], 'meta.json')) as file:
+        assert json.load(file)['inputs'] == dict(INPUTS, log_directory=None)
+
+
+def test_resume_options_override_the_saved_inputs(tmp_path):
+    clock = VirtualClock()
+    manager = RunManager(FakeMQTTClient(clock.time), checkpoint_directory=str(tmp_path / 'checkpoints'))
+
+    signal_interface = StopAtCycle(1)
+    run = manager.prepare(None, 'Oxygen On Off', signal_interface, clock=clock, log_directory=None,
+                          controller_timed=False, **INPUTS)
+    signal_interface.run = run
+    manager.start_prepared(run)
+    assert run.join(5)
+
+    saved = checkpoint.load(checkpoint.checkpoint_path(str(tmp_path / 'checkpoints'), None))
+    resumed = manager.resume(saved, NullSignalInterface(), clock=clock, controller_timed=False)
+    assert resumed.join(5)
+    assert not resumed.recipe.stopped
+
+
+class CrashAtCycle(NullSignalInterface):
+    def __init__(self, cycle):
+        self.cycle = cycle
+
+    def emit_update_process_value(self, value):
+        if value == self.cycle:
+            raise RuntimeError('GUI crashed')
+
+
+@pytest.mark.filterwarnings('ignore::pytest.PytestUnhandledThreadExceptionWarning')
+def test_crashed_run_is_offered_for_a_resume(tmp_path):
+    clock = VirtualClock()
+    client = FakeMQTTClient(clock.time)
+    manager = RunManager(client, checkpoint_directory=str(tmp_path / 'checkpoints'))
+
+    run = manager.start(None, 'Oxygen On Off', CrashAtCycle(3), clock=clock, log_directory=None, **INPUTS)
+    run.join(5)
+    assert run.recipe.failed is not None
+
+    saved, = checkpoint.pending(str(tmp_path / 'checkpoints'))
+    assert not saved.stopped
+    assert (saved.cycle, saved.loops) == (3, INPUTS['n'])
+
+    resumed = manager.resume(saved, NullSignalInterface(), clock=clock)
+    assert resumed.join(5)
+    assert resumed.recipe.failed is None
+    assert checkpoint.pending(str(tmp_path / 'checkpoints')) == []
+    assert not os.path.exists(saved.path)
+
+
+def test_prepared_run_is_named_and_archived_when_it_starts(tmp_path, monkeypatch):
+    from datetime import datetime
+    from recipes import engine
+
+    class Now(object):
+        value = datetime(2026, 10, 18, 9, 0)
+
+        @classmethod
+        def now(cls):
+            return cls.value
+
+    monkeypatch.setattr(engine, 'datetime', Now)
+    (tmp_path / 'logs').mkdir()
+    clock = VirtualClock()
+    manager = RunManager(FakeMQTTClient(clock.time), archive_directory=str(tmp_path / 'archives'))
+    run = manager.prepare(None, 'Oxygen On Off', NullSignalInterface(), clock=clock,
+                          log_directory=str(tmp_path / 'logs'), **INPUTS)
+    assert run.recipe.archive is None
+
+    Now.value = datetime(2026, 10, 18, 10, 30)
+    manager.start_prepared(run)
+    assert run.join(5)
+    assert os.listdir(str(tmp_path / 'logs')) == ['2026-10-18T10-30-general.log']
+    assert run.recipe.archive.path is not None
+    with open(os.path.join(run.recipe.archive.path, 'meta.json')) as file:
+        assert json.load(file)['inputs'] == dict(INPUTS, log_directory=str(tmp_path / 'logs'))
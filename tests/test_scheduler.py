@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from recipes.scheduler import LoopWaits, Ready, Scheduler, ThreadWaits, run_blocking
+from recipes.simulation import VirtualClock
+
+# (duration, time the step takes), the first step overruns by 2 s
+STEPS = [(1.0, 3.0), (1.0, 0.0), (1.0, 0.0), (1.0, 0.0)]
+
+
+def blocking_scheduler(clock, policy=Scheduler.CATCH_UP):
+    return Scheduler(ThreadWaits(sleep_function=clock.sleep).wait, policy=policy, clock=clock.time)
+
+
+def run(scheduler, foo, duration, *args):
+    async def step(*args):
+        foo(*args)
+    return run_blocking(scheduler.run(step, duration, *args))
+
+
+def run_steps(policy):
+    clock = VirtualClock()
+    scheduler = blocking_scheduler(clock, policy)
+    starts = []
+    lateness = []
+    for duration, busy in STEPS:
+        def step(busy=busy):
+            starts.append(clock.time())
+            clock.sleep(busy)
+        lateness.append(run(scheduler, step, duration))
+    return starts, lateness, clock.time()
+
+
+def test_catch_up_shortens_the_following_steps():
+    starts, lateness, end = run_steps(Scheduler.CATCH_UP)
+    assert starts == [0.0, 3.0, 3.0, 3.0]
+    assert lateness == [0.0, 2.0, 1.0, 0.0]
+    assert end == 4.0
+
+
+def test_skip_continues_the_timeline_from_the_overrun():
+    starts, lateness, end = run_steps(Scheduler.SKIP)
+    assert starts == [0.0, 3.0, 4.0, 5.0]
+    # the overrun is reported by the next step although its start is on time
+    assert lateness == [0.0, 2.0, 0.0, 0.0]
+    assert end == 6.0
+
+
+def test_delay_shifts_the_following_deadlines():
+    clock = VirtualClock()
+    scheduler = blocking_scheduler(clock)
+    lateness = [run(scheduler, lambda: scheduler.delay_to(clock.time() + 5.0), 1.0)]
+    assert clock.time() == 6.0
+    lateness.append(run(scheduler, clock.sleep, 1.0, 2.0))
+    lateness.append(run(scheduler, lambda: None, 1.0))
+    assert lateness == [0.0, 0.0, 1.0]
+
+
+def test_aborted_wait_returns_early():
+    clock = VirtualClock()
+    scheduler = Scheduler(lambda seconds: Ready(True), clock=clock.time)
+    run(scheduler, lambda: None, 10.0)
+    assert clock.time() == 0.0
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Scheduler(policy='late')
+
+
+def test_run_blocking_refuses_event_loop_waits():
+    async def step():
+        await asyncio.sleep(0)
+
+    with pytest.raises(RuntimeError):
+        run_blocking(step())
+
+
+def test_loop_waits_skip_like_thread_waits():
+    clock = VirtualClock()
+
+    async def overrun():
+        clock.sleep(3.0)
+
+    async def nothing():
+        pass
+
+    async def steps():
+        waits = LoopWaits(asyncio.Event(), lambda: None, clock)
+        scheduler = Scheduler(waits.wait, policy=Scheduler.SKIP, clock=clock.time)
+        return [await scheduler.run(overrun, 1.0), await scheduler.run(nothing, 1.0)]
+
+    assert asyncio.run(steps()) == [0.0, 2.0]
+    assert clock.time() == 4.0
+
+
+def test_cancelled_loop_wait_calls_on_cancel():
+    cancels = []
+
+    async def wait():
+        waits = LoopWaits(asyncio.Event(), lambda: cancels.append(True))
+        task = asyncio.get_running_loop().create_task(waits.wait(10.0))
+        await asyncio.sleep(0)
+        task.cancel()
+        return await task, waits.cancelled
+
+    assert asyncio.run(wait()) == (True, True)
+    assert cancels == [True]
@@ -0,0 +1,28 @@
+from recipes import REGISTRY
+from recipes.fake import FakeMQTTClient
+from recipes.logindex import parse_log
+from recipes.signals import NullSignalInterface
+from recipes.simulation import VirtualClock
+from recipes.sweep import Sweep, _planned_duration
+
+
+def test_editing_a_sweep_only_compiles_new_variants():
+    Sweep('Oxygen On Off', {'n': '1, 2, 3'}, {'oxygen_wait': '1.5'})
+    compiled = _planned_duration.cache_info().misses
+
+    sweep = Sweep('Oxygen On Off', {'n': '1, 2, 3, 4'}, {'oxygen_wait': '1.5'}, name='edited')
+    assert _planned_duration.cache_info().misses == compiled + 1
+    assert [point.duration for point in sweep.points] == sorted(point.duration for point in sweep.points)
+
+
+def test_tags_with_separators_survive_the_log(tmp_path):
+    sweep = Sweep('Oxygen On Off', {'n': '1, 2'}, name='a=1, b=2 100%')
+    point = sweep.points[1]
+    clock = VirtualClock()
+    recipe = REGISTRY['Oxygen On Off'](FakeMQTTClient(clock.time), NullSignalInterface(), clock=clock,
+                                       log_directory=str(tmp_path), tags=sweep.tags(point), **point.inputs)
+    recipe()
+
+    log, = tmp_path.glob('*.log')
+    run, = parse_log(str(log))
+    assert run.tags == sweep.tags(point)
@@ -0,0 +1,137 @@
+from PyQt5.QtWidgets import QWidget, QSizePolicy
+from PyQt5.QtGui import QColor, QPainter, QPainterPath, QPen
+from PyQt5.QtCore import Qt, QPointF, QTimer, pyqtSlot
+
+from time import time
+
+from recipes.telemetry import MinMaxDecimator
+
+
+class PlotWidget(QWidget):
+    """Sensor traces of the telemetry with the valve steps of the running recipe.
+
+    Every channel is reduced to the minimum and maximum of at most BINS time
+    bins (see telemetry.MinMaxDecimator), so a redraw costs the same after
+    minutes and after hours. Each trace is scaled to its own range, the
+    legend shows the latest values.
+    """
+
+    BINS = 1000
+    REFRESH_INTERVAL = 500
+    # minimum distance of two step labels in pixels
+    LABEL_SPACING = 60
+    COLORS = ('#1f77b4', '#d62728', '#2ca02c', '#ff7f0e', '#9467bd', '#8c564b')
+
+    def __init__(self, telemetry, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(400, 250)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+        self._telemetry = telemetry
+        self._recipe = None
+        self._marker_since = 0
+        self._decimators = {}
+        self.reset()
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.REFRESH_INTERVAL)
+        self._timer.timeout.connect(self._refresh)
+        self._timer.start()
+
+    def reset(self):
+        """Starts the traces at the current time."""
+        start = time()
+        self._start = start
+        self._decimators = {name: MinMaxDecimator(self._telemetry.channel(name), start, self.BINS)
+                            for name in self._telemetry.channels}
+
+    def set_recipe(self, recipe):
+        """Shows the traces from now on with the valve steps of the recipe."""
+        self.reset()
+        self._recipe = recipe
+        self._marker_since = recipe.step_markers.count
+
+    @pyqtSlot()
+    def _refresh(self):
+        for decimator in self._decimators.values():
+            decimator.update()
+        self.update()
+
+    def _span(self):
+        return max(max((decimator.width * len(decimator.bins()[0]) for decimator in self._decimators.values()),
+                       default=0.0), time() - self._start, 1.0)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+
+        width = self.width()
+        height = self.height()
+        span = self._span()
+
+        self._draw_markers(painter, width, height, span)
+        for number, (name, decimator) in enumerate(self._decimators.items()):
+            color = QColor(self.COLORS[number % len(self.COLORS)])
+            self._draw_trace(painter, decimator, color, width, height, span)
+            self._draw_legend(painter, number, name, color)
+        painter.end()
+
+    def _draw_trace(self, painter, decimator, color, width, height, span):
+        minima, maxima = decimator.bins()
+        present = [value for value in minima if value == value]
+        if not present:
+            return
+        low = min(present)
+        high = max(value for value in maxima if value == value)
+        if high == low:
+            high, low = high + 0.5, low - 0.5
+        y_scale = (height - 20) / (high - low)
+        x_scale = width / span
+        bin_width = decimator.width
+
+        # a vertical line from minimum to maximum per bin, the bins are connected at their maxima
+        path = QPainterPath()
+        connected = False
+        for index, (minimum, maximum) in enumerate(zip(minima, maxima)):
+            if minimum != minimum:
+                connected = False
+                continue
+            x = (index + 0.5) * bin_width * x_scale
+            top = height - 10 - (maximum - low) * y_scale
+            bottom = height - 10 - (minimum - low) * y_scale
+            if connected:
+                path.lineTo(QPointF(x, top))
+            else:
+                path.moveTo(QPointF(x, top))
+            path.lineTo(QPointF(x, bottom))
+            path.moveTo(QPointF(x, top))
+            connected = True
+
+        painter.setPen(QPen(color, 1))
+        painter.drawPath(path)
+
+    def _draw_markers(self, painter, width, height, span):
+        if self._recipe is None:
+            return
+        names = self._recipe.step_names
+        x_scale = width / span
+        painter.setPen(QPen(QColor('#b0b0b0'), 1, Qt.DashLine))
+        last_x = None
+        last_label_x = None
+        for times, indices in self._recipe.step_markers.segments(self._marker_since):
+            for timestamp, index in zip(times, indices):
+                x = int((timestamp - self._start) * x_scale)
+                # one marker per pixel column
+                if x == last_x:
+                    continue
+                last_x = x
+                painter.drawLine(x, 0, x, height)
+                if last_label_x is None or x - last_label_x >= self.LABEL_SPACING:
+                    painter.drawText(x + 2, height - 2, names[int(index)])
+                    last_label_x = x
+
+    def _draw_legend(self, painter, number, name, color):
+        latest = self._telemetry.latest(name)
+        text = name if latest is None else '{}: {:.4g}'.format(name, latest[1])
+        painter.setPen(color)
+        painter.drawText(6, 16 + 14 * number, text)
@@ -0,0 +1,77 @@
+from PyQt5.QtWidgets import QGroupBox, QHBoxLayout, QVBoxLayout, QListWidget, QListWidgetItem, QPushButton
+from PyQt5.QtCore import Qt, pyqtSignal, pyqtSlot
+
+
+class QueueWidget(QGroupBox):
+    """Jobs of the run queue with controls to reorder, cancel and run them."""
+
+    move_requested = pyqtSignal(int, int)
+    cancel_requested = pyqtSignal(int)
+    clear_requested = pyqtSignal()
+    start_requested = pyqtSignal()
+    pause_requested = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__('Queue', parent)
+
+        vertical_layout = QVBoxLayout()
+        self.setLayout(vertical_layout)
+
+        self._list = QListWidget(self)
+        vertical_layout.addWidget(self._list)
+
+        self._up_button = QPushButton('up', self)
+        self._down_button = QPushButton('down', self)
+        self._cancel_button = QPushButton('cancel', self)
+        self._clear_button = QPushButton('clear finished', self)
+        self._start_button = QPushButton('start', self)
+        self._pause_button = QPushButton('pause', self)
+        self._pause_button.hide()
+
+        button_layout = QHBoxLayout()
+        button_layout.addWidget(self._up_button)
+        button_layout.addWidget(self._down_button)
+        button_layout.addWidget(self._cancel_button)
+        button_layout.addWidget(self._clear_button)
+        button_layout.addStretch(1)
+        button_layout.addWidget(self._start_button)
+        button_layout.addWidget(self._pause_button)
+        vertical_layout.addLayout(button_layout)
+
+        self._up_button.clicked.connect(lambda: self._on_move(-1))
+        self._down_button.clicked.connect(lambda: self._on_move(1))
+        self._cancel_button.clicked.connect(self._on_cancel)
+        self._clear_button.clicked.connect(self.clear_requested)
+        self._start_button.clicked.connect(self.start_requested)
+        self._pause_button.clicked.connect(self.pause_requested)
+
+    def _selected_job(self):
+        item = self._list.currentItem()
+        return item.data(Qt.UserRole) if item is not None else None
+
+    def _on_move(self, offset):
+        job_id = self._selected_job()
+        if job_id is not None:
+            self.move_requested.emit(job_id, self._list.currentRow() + offset)
+
+    @pyqtSlot()
+    def _on_cancel(self):
+        job_id = self._selected_job()
+        if job_id is not None:
+            self.cancel_requested.emit(job_id)
+
+    def set_jobs(self, jobs):
+        selected = self._selected_job()
+        self._list.clear()
+        for job in jobs:
+            text = '#{} {} on {} - {}'.format(job.id, job.recipe, job.chamber or 'default', job.state)
+            item = QListWidgetItem(text, self._list)
+            item.setData(Qt.UserRole, job.id)
+            if job.id == selected:
+                self._list.setCurrentItem(item)
+        self.setVisible(len(jobs) > 0)
+
+    @pyqtSlot(bool)
+    def set_active(self, active):
+        self._start_button.setVisible(not active)
+        self._pause_button.setVisible(active)
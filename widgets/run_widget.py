@@ -0,0 +1,84 @@
+from PyQt5.QtWidgets import QGroupBox, QHBoxLayout, QVBoxLayout, QLabel, QProgressBar, QPushButton
+from PyQt5.QtCore import pyqtSignal, pyqtSlot
+
+from datetime import datetime
+from time import time
+
+
+class RunWidget(QGroupBox):
+    """Progress, status and stop control of a single run."""
+
+    stop_requested = pyqtSignal()
+    close_requested = pyqtSignal()
+
+    def __init__(self, chamber, recipe_name, max_process_value, parent=None):
+        title = recipe_name if chamber is None else '{}: {}'.format(chamber, recipe_name)
+        super().__init__(title, parent)
+
+        vertical_layout = QVBoxLayout()
+        self.setLayout(vertical_layout)
+
+        self._progress = QProgressBar(self)
+        self._progress.setMinimum(0)
+        self._progress.setMaximum(max_process_value)
+        self._progress.setValue(0)
+
+        self._stop_button = QPushButton('stop', self)
+        self._close_button = QPushButton('close', self)
+        self._close_button.hide()
+
+        progress_layout = QHBoxLayout()
+        progress_layout.addWidget(self._progress, 1)
+        progress_layout.addWidget(self._stop_button)
+        progress_layout.addWidget(self._close_button)
+        vertical_layout.addLayout(progress_layout)
+
+        self._message_label = QLabel('', self)
+        self._etc_label = QLabel('', self)
+
+        status_layout = QHBoxLayout()
+        status_layout.addWidget(self._message_label)
+        status_layout.addStretch(1)
+        status_layout.addWidget(self._etc_label)
+        vertical_layout.addLayout(status_layout)
+
+        self._stop_button.clicked.connect(self._on_stop)
+        self._close_button.clicked.connect(self.close_requested)
+
+    def _show_message(self, message):
+        self._message_label.setText('{:%H:%M:%S} - {}'.format(datetime.now(), message))
+
+    @pyqtSlot()
+    def _on_stop(self):
+        self._stop_button.setDisabled(True)
+        self.stop_requested.emit()
+
+    @pyqtSlot()
+    def on_started(self):
+        self._show_message('recipe started')
+
+    @pyqtSlot()
+    def on_stopped(self):
+        self._show_message('recipe stopped')
+
+    @pyqtSlot()
+    def on_finished(self):
+        self._show_message('recipe finished')
+        self._stop_button.hide()
+        self._close_button.show()
+
+    @pyqtSlot(str)
+    def on_status_message(self, message):
+        self._show_message(message)
+
+    @pyqtSlot(int)
+    def on_update_process_value(self, value):
+        self._progress.setValue(value)
+
+    @pyqtSlot(float, float)
+    def on_update_timeline(self, planned_end, drift):
+        minutes, seconds = divmod(max(0, int(planned_end - time())), 60)
+        hours, minutes = divmod(minutes, 60)
+        # planned end, remaining time and how far the run is behind its plan
+        self._etc_label.setText('ETC: {:%H:%M:%S} ({}:{:02d}:{:02d} left, drift {:+.1f} s)'.format(
+            datetime.fromtimestamp(planned_end), hours, minutes, seconds, drift))
@@ -0,0 +1,90 @@
+from PyQt5.QtWidgets import QDialog, QDialogButtonBox, QFormLayout, QLabel, QLineEdit, QPlainTextEdit, QVBoxLayout
+from PyQt5.QtCore import QTimer, pyqtSlot
+
+from recipes.sweep import Sweep, SweepError, format_sweep
+
+# milliseconds without edits before the variants are compiled again
+UPDATE_DELAY = 300
+
+
+class SweepDialog(QDialog):
+    """Defines a parameter sweep over the inputs of a recipe.
+
+    An input whose text contains a list '1, 2, 5' or a grid '1:2:0.25' is
+    varied, all others are fixed. The variants are validated and listed with
+    the planned tool time shortly after the last edit; the dialog can only be
+    accepted with a valid sweep.
+    """
+
+    def __init__(self, recipe, inputs, handoff=0.0, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle('Sweep {}'.format(recipe))
+        self._recipe = recipe
+        self._handoff = handoff
+        self._sweep = None
+        self._input_edits = {}
+
+        self._update_timer = QTimer(self)
+        self._update_timer.setSingleShot(True)
+        self._update_timer.setInterval(UPDATE_DELAY)
+        self._update_timer.timeout.connect(self._update)
+
+        vertical_layout = QVBoxLayout()
+        self.setLayout(vertical_layout)
+
+        form_layout = QFormLayout()
+        self._name_edit = QLineEdit(self)
+        self._name_edit.setPlaceholderText('recipe and time')
+        form_layout.addRow('Sweep name:', self._name_edit)
+        for key, value in inputs.items():
+            # no validators, lists and grids are checked by the sweep
+            edit = QLineEdit(str(value.default), self)
+            edit.textChanged.connect(self._schedule_update)
+            form_layout.addRow('{}:'.format(value.fullname), edit)
+            self._input_edits[key] = edit
+        self._name_edit.textChanged.connect(self._schedule_update)
+        vertical_layout.addLayout(form_layout)
+
+        vertical_layout.addWidget(QLabel('Variants:', self))
+        self._summary = QPlainTextEdit(self)
+        self._summary.setReadOnly(True)
+        vertical_layout.addWidget(self._summary)
+
+        self._buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
+        self._buttons.button(QDialogButtonBox.Ok).setText('queue')
+        self._buttons.accepted.connect(self.accept)
+        self._buttons.rejected.connect(self.reject)
+        vertical_layout.addWidget(self._buttons)
+
+        self._update()
+
+    @property
+    def sweep(self):
+        """The valid sweep, None if the inputs are invalid."""
+        return self._sweep
+
+    @pyqtSlot()
+    def _schedule_update(self):
+        # the sweep is invalid until it is compiled again
+        self._buttons.button(QDialogButtonBox.Ok).setEnabled(False)
+        self._update_timer.start()
+
+    @pyqtSlot()
+    def _update(self):
+        axes = {}
+        fixed = {}
+        for key, edit in self._input_edits.items():
+            text = edit.text()
+            if ',' in text or ':' in text:
+                axes[key] = text
+            else:
+                fixed[key] = text
+
+        try:
+            self._sweep = Sweep(self._recipe, axes, fixed, self._name_edit.text().strip() or None)
+            lines = format_sweep(self._sweep, self._handoff)
+        except SweepError as error:
+            self._sweep = None
+            lines = error.errors
+        self._summary.setPlainText('\n'.join(lines))
+        self._buttons.button(QDialogButtonBox.Ok).setEnabled(self._sweep is not None)